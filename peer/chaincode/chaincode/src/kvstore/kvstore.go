@@ -0,0 +1,147 @@
+/*
+Copyright IBM Corp. 2017 All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+// A key/value chaincode for measuring peer latency as the world state grows.
+// Keys are addressed by index, and values of a given size are generated by
+// the chaincode, so that loading many keys takes few, small transactions:
+//
+//   load <start> <count> <size>  put count keys from index start
+//   put <index> <size>           put a single key
+//   get <index>                  the value of a key
+//   range <start> <count>        the number of keys in a range query
+package main
+
+import (
+	"fmt"
+	"strconv"
+	"strings"
+
+	"github.com/hyperledger/fabric/core/chaincode/shim"
+	pb "github.com/hyperledger/fabric/protos/peer"
+)
+
+type KVStore struct {
+}
+
+func key(index int) string {
+	// zero padded, so that keys sort by index in range queries
+	return fmt.Sprintf("key%09d", index)
+}
+
+func value(index int, size int) []byte {
+	return []byte(strings.Repeat(key(index), size/len(key(index))+1)[:size])
+}
+
+func intArgs(args []string, count int) ([]int, error) {
+	if len(args) != count {
+		return nil, fmt.Errorf("Incorrect number of arguments. Expecting %d", count)
+	}
+	values := make([]int, count)
+	for i, arg := range args {
+		value, err := strconv.Atoi(arg)
+		if err != nil || value < 0 {
+			return nil, fmt.Errorf("Expecting a non-negative integer, got %s", arg)
+		}
+		values[i] = value
+	}
+	return values, nil
+}
+
+func (t *KVStore) Init(stub shim.ChaincodeStubInterface) pb.Response {
+	return shim.Success(nil)
+}
+
+func (t *KVStore) Invoke(stub shim.ChaincodeStubInterface) pb.Response {
+	function, args := stub.GetFunctionAndParameters()
+	switch function {
+	case "load":
+		return t.load(stub, args)
+	case "put":
+		return t.put(stub, args)
+	case "get":
+		return t.get(stub, args)
+	case "range":
+		return t.rangeQuery(stub, args)
+	}
+	return shim.Error("Invalid invoke function name. Expecting \"load\" \"put\" \"get\" \"range\"")
+}
+
+func (t *KVStore) load(stub shim.ChaincodeStubInterface, args []string) pb.Response {
+	values, err := intArgs(args, 3)
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	start, count, size := values[0], values[1], values[2]
+	for index := start; index < start+count; index++ {
+		if err := stub.PutState(key(index), value(index, size)); err != nil {
+			return shim.Error(err.Error())
+		}
+	}
+	return shim.Success(nil)
+}
+
+func (t *KVStore) put(stub shim.ChaincodeStubInterface, args []string) pb.Response {
+	values, err := intArgs(args, 2)
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	if err := stub.PutState(key(values[0]), value(values[0], values[1])); err != nil {
+		return shim.Error(err.Error())
+	}
+	return shim.Success(nil)
+}
+
+func (t *KVStore) get(stub shim.ChaincodeStubInterface, args []string) pb.Response {
+	values, err := intArgs(args, 1)
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	data, err := stub.GetState(key(values[0]))
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	if data == nil {
+		return shim.Error("Nil value for " + key(values[0]))
+	}
+	return shim.Success(data)
+}
+
+func (t *KVStore) rangeQuery(stub shim.ChaincodeStubInterface, args []string) pb.Response {
+	values, err := intArgs(args, 2)
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	iterator, err := stub.GetStateByRange(key(values[0]), key(values[0]+values[1]))
+	if err != nil {
+		return shim.Error(err.Error())
+	}
+	defer iterator.Close()
+	count := 0
+	for iterator.HasNext() {
+		if _, err := iterator.Next(); err != nil {
+			return shim.Error(err.Error())
+		}
+		count++
+	}
+	return shim.Success([]byte(strconv.Itoa(count)))
+}
+
+func main() {
+	err := shim.Start(new(KVStore))
+	if err != nil {
+		fmt.Printf("Error starting KVStore chaincode: %s", err)
+	}
+}
@@ -0,0 +1,35 @@
+@benchmark
+Feature: Orderer batching
+
+  The orderer cuts a block once MaxMessageCount transactions are pending or
+  BatchTimeout expires. Larger batches raise throughput at the cost of commit
+  latency while the load is low. Only runs when the benchmark flag is defined.
+
+Scenario Outline: Block cutting under concurrent load
+
+  Given a fabric peer and orderer with the orderer settings
+    | setting         | value               |
+    | BatchTimeout    | <batch timeout>     |
+    | MaxMessageCount | <max message count> |
+  And a go chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When 100 invokes are submitted with concurrency 20
+  Then the p50/p95/p99 invoke latency is reported
+  And on average the blocks are at least 50% as full as the submit rate allows
+  And no block holds more transactions than MaxMessageCount
+  When the commit latency of 10 invokes is measured
+  Then the p50/p95/p99 commit latency is reported
+  And the p50 commit latency is at most <max commit latency> seconds
+
+  # the invokes return once the orderer accepted the transaction, so the
+  # transactions pending when a block is cut are not bounded by the
+  # concurrency; a block holds what is submitted within BatchTimeout, up to
+  # MaxMessageCount, and the submit rate of docker exec and the peer CLI
+  # depends on the host. Half of that leaves room for the first and last
+  # blocks, which are cut short.
+  Examples:
+  | batch timeout | max message count | max commit latency |
+  | 1s            | 1                 | 5                  |
+  | 250ms         | 10                | 5                  |
+  | 1s            | 10                | 5                  |
+  | 2s            | 50                | 10                 |
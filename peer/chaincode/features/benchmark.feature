@@ -0,0 +1,35 @@
+@benchmark
+Feature: Chaincode throughput and latency via CLI
+
+  Only runs when the benchmark flag is defined. Every transfer moves 15 from
+  a to b, so concurrent invokes endorsed against the same state may be
+  committed as invalid (MVCC read conflict); they are still ordered and
+  committed, which is what these scenarios measure.
+
+Scenario Outline: Invoke throughput and latency via CLI
+
+  Given a fabric peer and orderer
+  And a <lang> chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When 100 invokes are submitted with concurrency 10
+  Then the p50/p95/p99 invoke latency is reported
+  And the invoke throughput is at least 1 TPS
+
+  Examples:
+  | lang |
+  | go   |
+  | java |
+
+Scenario Outline: Query throughput and latency via CLI
+
+  Given a fabric peer and orderer
+  And a <lang> chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When 200 queries are submitted with concurrency 20
+  Then the p50/p95/p99 query latency is reported
+  And the query throughput is at least 1 TPS
+
+  Examples:
+  | lang |
+  | go   |
+  | java |
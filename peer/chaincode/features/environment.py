@@ -13,13 +13,29 @@
 # limitations under the License.
 
 from behave import *
+from behave.model import Status
 import os
+import random
 import re
-import subprocess
+import shutil
 import tempfile
 import time
 import sys
 
+from harness import benchmark, javaenv
+from harness.artifacts import ArtifactCache, tree_size
+from harness.cassette import CASSETTE_MODES, Cassette, RecordingDockerClient, ReplayDockerClient
+from harness.docker_api import DockerClient
+from harness.history import History
+from harness.network import Network, NETWORK_SCOPES, ORDERER_SETTINGS, STATE_DATABASES, STORAGE_TYPES
+from harness.reaper import DEFAULT_MANIFEST_DIR, Reaper, ResourceTracker, format_report
+from harness.resources import ResourceSampler, format_summary
+from harness.tracing import Tracer
+from harness.wait import DEFAULT_TIMEOUT
+
+# RAM backed file system for the temp dir with tmpfs storage
+RAM_DIR = '/dev/shm'
+
 # set the default step matcher
 use_step_matcher("re")
 
@@ -41,15 +57,130 @@ def before_all(context):
         context.docker_tag['orderer'] = context.config.userdata['fabric-orderer-docker-tag']
     if 'fabric-tools-docker-tag' in context.config.userdata:
         context.docker_tag['tools'] = context.config.userdata['fabric-tools-docker-tag']
-    if sys.platform == 'darwin':
+    context.docker_tag['javaenv'] = context.config.userdata.get('fabric-javaenv-docker-tag', context.docker_tag['fabric'])
+    # ZooKeeper, Kafka and CouchDB images are versioned apart from fabric since 1.1
+    context.docker_tag['kafka'] = context.config.userdata.get('fabric-kafka-docker-tag', 'latest')
+    context.docker_tag['couchdb'] = context.config.userdata.get('fabric-couchdb-docker-tag', 'latest')
+    # ledgers on disk (default) or tmpfs, in which case the temp dir holding
+    # all generated artifacts is put on a RAM backed file system too
+    context.storage = context.config.userdata.get('storage', 'disk')
+    assert context.storage in STORAGE_TYPES, 'Unknown storage: {}'.format(context.storage)
+    # size limit (MB) of the tmpfs of every container, and space required for the temp dir
+    context.tmpfs_size = context.config.userdata.getint('tmpfs-size', 512) * 1024 * 1024
+    if context.storage == 'tmpfs':
+        assert os.path.isdir(RAM_DIR), '{} is required for tmpfs storage'.format(RAM_DIR)
+        ram_dir_stat = os.statvfs(RAM_DIR)
+        available = ram_dir_stat.f_bavail * ram_dir_stat.f_frsize
+        assert available >= context.tmpfs_size, 'Only {} MB available in {}'.format(available // (1024 * 1024), RAM_DIR)
+        context.temp_dir = tempfile.mkdtemp(dir=RAM_DIR, prefix='behave_')
+    elif context.config.userdata.get('temp-root'):
+        # e.g. a per worker directory when running in parallel
+        temp_root = os.path.abspath(context.config.userdata['temp-root'])
+        if not os.path.isdir(temp_root):
+            os.makedirs(temp_root)
+        context.temp_dir = tempfile.mkdtemp(dir=temp_root, prefix='behave_')
+    elif sys.platform == 'darwin':
         # on macOS, the typical value of TMPDIR is not accessible to the Docker vm.
         context.temp_dir = tempfile.mkdtemp(dir='/tmp', prefix='behave_')
     else:
         context.temp_dir = tempfile.mkdtemp()
+    # lifetime of the fabric network: a fresh network for every scenario
+    # (default), one network per feature, or one network for the whole run
+    context.network_scope = context.config.userdata.get('network-scope', 'scenario')
+    assert context.network_scope in NETWORK_SCOPES, 'Unknown network-scope: {}'.format(context.network_scope)
+    # orderer batching settings, e.g. --define max-message-count=10
+    context.orderer_settings = {}
+    for setting, (option, default) in ORDERER_SETTINGS.items():
+        if option in context.config.userdata:
+            context.orderer_settings[setting] = context.config.userdata[option]
+    # orderers of the ordering service, and the Kafka brokers and ZooKeeper
+    # servers of a kafka one, e.g. --define orderer-type=etcdraft --define orderer-count=3
+    context.orderer_count = context.config.userdata.getint('orderer-count', 1)
+    context.kafka_brokers = context.config.userdata.getint('kafka-brokers', 3)
+    context.zookeepers = context.config.userdata.getint('zookeepers', 1)
+    # world state database of the peers, e.g. --define state-db=couchdb
+    context.state_db = context.config.userdata.get('state-db', 'leveldb')
+    assert context.state_db in STATE_DATABASES, 'Unknown state-db: {}'.format(context.state_db)
+    # spans of features, scenarios, steps and docker operations, written to
+    # the trace file in Chrome trace format at the end of the run
+    context.tracer = Tracer(enabled=bool(context.config.userdata.get('trace')))
+    # docker engine API client, talking to the daemon at docker-socket (default: DOCKER_HOST or /var/run/docker.sock)
+    # or, with cassette-mode, recording the docker interactions of every scenario
+    # to cassette-dir, or replaying them from there without a docker daemon
+    context.cassette_mode = context.config.userdata.get('cassette-mode')
+    if context.cassette_mode:
+        assert context.cassette_mode in CASSETTE_MODES, 'Unknown cassette-mode: {}'.format(context.cassette_mode)
+        assert context.network_scope == 'scenario', 'cassette-mode requires a network per scenario'
+    context.cassette_dir = os.path.abspath(context.config.userdata.get('cassette-dir', 'cassettes'))
+    if context.cassette_mode == 'record':
+        context.docker = RecordingDockerClient(context.config.userdata.get('docker-socket'), tracer=context.tracer)
+    elif context.cassette_mode == 'replay':
+        # replay-speed scales the recorded timings, 0 replays without delays
+        context.docker = ReplayDockerClient(tracer=context.tracer, speed=float(context.config.userdata.get('replay-speed', 0)))
+    else:
+        context.docker = DockerClient(context.config.userdata.get('docker-socket'), tracer=context.tracer)
+    # seconds to wait for containers to start and transactions to commit
+    context.wait_timeout = context.config.userdata.getint('wait-timeout', DEFAULT_TIMEOUT)
+    # container logs are streamed to files, optionally gzipped and capped in size (MB)
+    context.log_compress = context.config.userdata.getbool('log-compress')
+    context.log_max_bytes = None
+    if context.config.userdata.get('log-max-size'):
+        context.log_max_bytes = context.config.userdata.getint('log-max-size') * 1024 * 1024
+    # optional cache of crypto material and genesis blocks shared across scenarios and runs
+    context.artifact_cache = None
+    # replayed containers do not produce any artifacts to cache, and a
+    # recording against a warm cache would lack the commands that generate
+    # them and use other chaincode names than its replays
+    if context.config.userdata.get('artifact-cache-dir') and not context.cassette_mode:
+        context.artifact_cache = ArtifactCache(
+            os.path.abspath(context.config.userdata['artifact-cache-dir']),
+            context.config.userdata.getint('artifact-cache-size', 256) * 1024 * 1024)
+    # scenario and step durations of every run, see harness.history
+    context.history = None
+    if context.config.userdata.get('history-db'):
+        context.history = History(context.config.userdata['history-db'])
+        context.history.start_run(context.config.userdata.get('history-run', '{:.0f}-{}'.format(time.time(), os.getpid())), context.docker_tag)
+    # docker stats of the orderer, peer and chaincode containers, sampled
+    # every sample-interval seconds during scenarios; extra requests would
+    # not match a cassette
+    context.sample_resources = context.config.userdata.getbool('sample-resources') and not context.cassette_mode
+    context.sample_interval = float(context.config.userdata.get('sample-interval', 2))
+    # stable chaincode names, so that the chaincode images peers build on
+    # instantiate are reused by later scenarios; cassettes need the seeded
+    # random names
+    context.reuse_chaincode_images = context.config.userdata.getbool('reuse-chaincode-images') and not context.cassette_mode
+    # the peers name chaincode containers and images after their network ID,
+    # peer ID, chaincode name and version; peer IDs and, with the above or an
+    # artifact cache, chaincode names are the same in every run, so the network
+    # ID is unique to the run to keep concurrent runs (e.g. the workers of make
+    # test-parallel) from replacing each other's chaincode containers, while
+    # the networks of the run still share their images (scenario networks up
+    # next to a shared one get an ID of their own, see Network); replays must
+    # issue the recorded requests
+    context.peer_network_id = 'behave' + ''.join(random.choice('0123456789') for i in range(7))
+    if context.cassette_mode:
+        context.peer_network_id = 'behave'
+    # containers and networks are labelled with the run, and the reaper
+    # removes the chaincode containers and images of networks that are down,
+    # and everything of earlier runs that are over, see harness.reaper; extra
+    # requests would not match a cassette
+    context.resource_tracker = None
+    context.reaper = None
+    if context.config.userdata.getbool('reap', True) and not context.cassette_mode:
+        manifest_dir = os.path.abspath(context.config.userdata.get('reaper-dir', DEFAULT_MANIFEST_DIR))
+        context.resource_tracker = ResourceTracker(manifest_dir, context.reuse_chaincode_images)
+        context.reaper = Reaper(context.docker, manifest_dir)
+    # instantiate durations by chaincode language, see after_all
+    context.instantiate_timings = {}
+    # latency by state database, across the scenarios comparing them, see state_steps
+    context.state_db_latency = {}
     context.sample_chaincode_path = {
         'golang':'github.com/hyperledger/fabric/examples/chaincode/go/chaincode_example02',
         'java': os.path.join(context.fabric_dir,'examples/chaincode/java/SimpleSample'),
     }
+    # key/value chaincode bundled with the tests, in a GOPATH of its own
+    context.test_go_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'chaincode')
+    context.kv_chaincode_path = 'kvstore'
     context.sample_chaincode_ctor_args = {
         'golang':'{"Args":["init", "a", "100", "b", "200"]}',
         'java':'{"Args": ["init", "a", "100", "b", "200"]}'
@@ -73,40 +204,238 @@ def before_all(context):
         }
     }
 
+    # Java chaincode is built from a runtime image with resolved dependencies;
+    # a cassette has no room for the extra requests
+    context.java_runtime = None
+    if context.config.userdata.getbool('java-cc-enabled') and context.config.userdata.getbool('java-prewarm', True) and not context.cassette_mode:
+        prewarm_java_runtime(context)
+
+    if context.network_scope == 'run':
+        bring_up_shared_network(context, os.path.join(context.temp_dir, 'network'))
+
+def after_all(context):
+    report_instantiate_time_saved(context)
+    if context.history:
+        context.history.close()
+    if context.tracer.enabled:
+        context.tracer.write(context.config.userdata['trace'])
+        print(context.tracer.summary(context.config.userdata.getint('trace-top', 20)))
+    if context.network_scope == 'run':
+        tear_down_shared_network(context, 'run')
+    if context.reaper:
+        reap(context)
+    # do not leave artifacts behind in memory
+    if context.storage == 'tmpfs' and not context.config.userdata.getbool('do-not-decompose'):
+        shutil.rmtree(context.temp_dir, ignore_errors=True)
+
+def before_feature(context, feature):
+    context.feature_start = time.time()
+    if context.network_scope == 'feature' and feature_uses_network(feature):
+        bring_up_shared_network(context, os.path.join(context.temp_dir, re.sub('\W+', '_', feature.name).lower()))
+
+def after_feature(context, feature):
+    if context.network_scope == 'feature' and getattr(context, 'network', None):
+        tear_down_shared_network(context, re.sub('\W+', '_', feature.name).lower())
+    context.tracer.record(feature.name, 'feature', context.feature_start, time.time() - context.feature_start,
+        status=feature.status.name)
+
 def before_scenario(context, scenario):
+    context.scenario_start = time.time()
+    context.tracer.scenario = scenario.name
     if not context.config.userdata.getbool('java-cc-enabled'):
         for step in scenario.steps:
-            if "java chaincode" in step.name:
+            if any("java chaincode" in name for name in step_names(step)):
                 scenario.mark_skipped()
                 break
+    if 'benchmark' in scenario.effective_tags and not context.config.userdata.getbool('benchmark'):
+        scenario.mark_skipped()
+    if 'soak' in scenario.effective_tags and not context.config.userdata.getbool('soak'):
+        scenario.mark_skipped()
     context.scenario_temp_dir = os.path.join(context.temp_dir, re.sub('\W+', '_', scenario.name).lower())
     os.mkdir(context.scenario_temp_dir)
+    # the logs of a shared network are captured per scenario as well
+    if getattr(context, 'network', None):
+        context.network.capture_logs(os.path.join(context.scenario_temp_dir, 'logs'))
+    if context.cassette_mode and scenario.status != Status.skipped:
+        use_cassette(context, scenario)
+    context.resource_sampler = None
+    if context.sample_resources and scenario.status != Status.skipped:
+        context.resource_sampler = ResourceSampler(context.docker, lambda: sampled_containers(context), context.sample_interval)
+        context.resource_sampler.start()
+    # ledger sizes to report bytes written by the scenario against
+    context.storage_usage = {}
+    if 'storage' in context.config.userdata and getattr(context, 'network', None):
+        context.storage_usage = context.network.storage_usage()
 
 def after_scenario(context, scenario):
+    if context.resource_sampler:
+        write_resource_usage(context)
+    if 'storage' in context.config.userdata and scenario.status != Status.skipped:
+        report_bytes_written(context)
+    # write machine readable benchmark results
+    if getattr(context, 'benchmark_results', None):
+        report_dir = context.config.userdata.get('benchmark-report-dir', context.scenario_temp_dir)
+        if not os.path.isdir(report_dir):
+            os.makedirs(report_dir)
+        benchmark.write_report(os.path.join(report_dir, re.sub('\W+', '_', scenario.name).lower() + '.json'),
+            scenario.name, context.docker_tag, context.benchmark_results)
     # collect logs if failure or user specified
     if context.failed or context.config.userdata.getbool('save-logs'):
         dump_container_logs(context, scenario)
-    # teardown docker containers & network
+    # teardown docker containers & network, unless shared with other scenarios
     if not context.config.userdata.getbool('do-not-decompose'):
         decompose_test_environment(context, scenario)
+    if context.cassette_mode == 'record' and context.docker.cassette:
+        context.docker.cassette.save()
+    if context.cassette_mode:
+        context.docker.use_cassette(None)
+    context.tracer.record(scenario.name, 'scenario', context.scenario_start, time.time() - context.scenario_start,
+        status=scenario.status.name)
+    context.tracer.scenario = None
+    if context.history and scenario.status != Status.skipped:
+        context.history.record(scenario.feature, scenario, None, time.time() - context.scenario_start, scenario.status.name)
+        context.history.flush()
+
+def before_step(context, step):
+    context.step_start = time.time()
+    context.tracer.step = '{} {}'.format(step.keyword, step.name)
+
+def after_step(context, step):
+    context.tracer.step = None
+    context.tracer.record('{} {}'.format(step.keyword, step.name), 'step', context.step_start, time.time() - context.step_start,
+        status=step.status.name)
+    if context.history:
+        context.history.record(context.feature, context.scenario, step, time.time() - context.step_start, step.status.name)
+
+def use_cassette(context, scenario):
+    # random channel, chaincode and network names are the same in a
+    # recording and its replays
+    random.seed(scenario.name)
+    cassette = Cassette(os.path.join(context.cassette_dir, os.path.splitext(os.path.basename(scenario.filename))[0],
+        re.sub('\W+', '_', scenario.name).lower() + '.json'),
+        substitutions=[(context.temp_dir, '{temp_dir}'), (context.go_path, '{go_path}'), (context.test_go_path, '{test_go_path}')])
+    if context.cassette_mode == 'replay':
+        assert os.path.exists(cassette.path), 'No cassette for scenario {}, record it with --define cassette-mode=record'.format(scenario.name)
+        cassette.load()
+    context.docker.use_cassette(cassette)
+
+def report_bytes_written(context):
+    bytes_written = {'temp_dir': tree_size(context.scenario_temp_dir)}
+    if getattr(context, 'network', None):
+        for name, size in context.network.storage_usage().items():
+            bytes_written[name] = size - context.storage_usage.get(name, 0)
+    print('bytes written ({}): {}'.format(context.storage, ', '.join(
+        '{} {:.1f} MB'.format(name, size / (1024.0 * 1024)) for name, size in sorted(bytes_written.items()))))
+    if getattr(context, 'benchmark_results', None):
+        context.benchmark_results['bytes_written'] = bytes_written
+
+def sampled_containers(context):
+    network = getattr(context, 'network', None)
+    return network.resource_containers() if network else {}
+
+def write_resource_usage(context):
+    # next to the scenario's logs, see dump_container_logs()
+    context.resource_sampler.stop()
+    log_dir = os.path.join(context.scenario_temp_dir, 'logs')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    context.resource_sampler.write(os.path.join(log_dir, 'resources.csv'), os.path.join(log_dir, 'resources.json'))
+    summary = context.resource_sampler.summary()
+    print('resource usage: ' + format_summary(summary))
+    if getattr(context, 'benchmark_results', None):
+        context.benchmark_results['resources'] = summary
+
+def prewarm_java_runtime(context):
+    start = time.time()
+    with context.tracer.span('prewarm java runtime', 'setup'):
+        context.java_runtime = javaenv.prewarm(context.docker, 'hyperledger/fabric-javaenv:{}'.format(context.docker_tag['javaenv']),
+            context.sample_chaincode_path['java'], context.config.userdata.get('java-cache-volume', 'behave-java-dependencies'),
+            context.resource_tracker.labels if context.resource_tracker else None)
+    print('java chaincode runtime {} ready after {:.1f}s'.format(context.java_runtime, time.time() - start))
+
+def report_instantiate_time_saved(context):
+    for lang, timings in sorted(context.instantiate_timings.items()):
+        if timings['built'] and timings['reused']:
+            built = sum(timings['built']) / len(timings['built'])
+            saved = sum(built - duration for duration in timings['reused'])
+            print('{} chaincode: {} instantiates reused a chaincode image, saving {:.1f}s'.format(lang, len(timings['reused']), saved))
+
+def reap(context):
+    # what the networks of this run left behind, then the resources of
+    # earlier runs that are over; runs on other hosts sharing the docker
+    # daemon are reaped once reap-older-than hours old
+    # the snapshots are gone with the run
+    if not context.reuse_chaincode_images:
+        prefixes = snapshot_chaincode_prefixes(context)
+        if prefixes:
+            context.reaper.remove_chaincode_images(prefixes, context.resource_tracker.id)
+    reclaimed = context.reaper.reclaimed
+    if reclaimed['images'] or reclaimed['errors']:
+        print('reaper: chaincode images of this run: ' + format_report(reclaimed))
+    # not decomposed, left for a later run to reap
+    if not context.config.userdata.getbool('do-not-decompose') and not reclaimed['errors']:
+        context.resource_tracker.close()
+    older_than = None
+    if context.config.userdata.get('reap-older-than'):
+        older_than = float(context.config.userdata['reap-older-than']) * 3600
+    report = context.reaper.reap(older_than=older_than)
+    if report['runs']:
+        print('reaper: {} finished runs: {}'.format(report['runs'], format_report(report)))
+
+def feature_uses_network(feature):
+    for scenario in feature.walk_scenarios():
+        for step in scenario.steps:
+            if 'a fabric peer and orderer' in step_names(step):
+                return True
+    return False
+
+def step_names(step):
+    # the name of a step and those of the steps in its text, see the
+    # snapshot steps
+    return [step.name] + [line.strip().split(None, 1)[-1] for line in (step.text or '').splitlines() if line.strip()]
+
+def bring_up_shared_network(context, work_dir):
+    os.mkdir(work_dir)
+    context.network = Network(context, context.network_scope, work_dir)
+    context.network.up()
+
+def tear_down_shared_network(context, log_file_prefix):
+    if context.failed or context.config.userdata.getbool('save-logs'):
+        context.network.dump_logs(log_file_prefix)
+    if not context.config.userdata.getbool('do-not-decompose'):
+        context.network.down()
+        remove_chaincodes(context, context.network)
 
 def dump_container_logs(context, scenario):
-    # wait a few seconds to let any lat minute blocks make thier way
-    time.sleep(2)
-    # dump peer logs
-    if getattr(context, 'peer_container_id', None):
-        open(re.sub('\W+', '_', scenario.name).lower() + '_peer.log', 'w').write(subprocess.check_output(['docker', 'logs', context.peer_container_id], stderr=subprocess.STDOUT))
-    # dump orderer logs
-    if getattr(context, 'orderer_container_id', None):
-        open(re.sub('\W+', '_', scenario.name).lower() + '_orderer.log', 'w').write(subprocess.check_output(['docker', 'logs', context.orderer_container_id], stderr=subprocess.STDOUT))
+    if getattr(context, 'network', None):
+        # wait up to a few seconds to let any last minute blocks make their way
+        context.network.wait_for_quiet_logs(2)
+        context.network.dump_logs(re.sub('\W+', '_', scenario.name).lower())
+    if context.resource_sampler:
+        for name in ('resources.csv', 'resources.json'):
+            shutil.copy(os.path.join(context.scenario_temp_dir, 'logs', name), re.sub('\W+', '_', scenario.name).lower() + '_' + name)
 
 def decompose_test_environment(context, scenario):
-    # destroy peer container
-    if getattr(context, 'peer_container_id', None):
-        subprocess.check_output(['docker', 'rm', '--force', '--volumes', context.peer_container_id], stderr=subprocess.STDOUT)
-    # destroy orderer container
-    if getattr(context, 'orderer_container_id', None):
-        subprocess.check_output(['docker', 'rm', '--force', '--volumes', context.orderer_container_id], stderr=subprocess.STDOUT)
-    # destroy docker network
-    if getattr(context, 'network_id', None):
-        subprocess.check_output(['docker', 'network', 'rm', context.network_id], stderr=subprocess.STDOUT)
+    network = getattr(context, 'network', None)
+    if network and network.scope == 'scenario':
+        network.down()
+        remove_chaincodes(context, network)
+
+def remove_chaincodes(context, network):
+    # the peers leave their chaincode images behind (network.down() removed
+    # the containers); images are kept for later scenarios with
+    # reuse-chaincode-images and while a snapshot refers to them
+    if context.reaper and network.installed_chaincodes and not context.reuse_chaincode_images:
+        prefixes = set(network.chaincode_prefixes()) - snapshot_chaincode_prefixes(context)
+        if prefixes:
+            context.reaper.remove_chaincode_images(prefixes, context.resource_tracker.id)
+
+def snapshot_chaincode_prefixes(context):
+    snapshots_dir = os.path.join(context.temp_dir, 'snapshots')
+    prefixes = set()
+    if os.path.isdir(snapshots_dir):
+        for name in os.listdir(snapshots_dir):
+            # an incomplete snapshot is of no use to later scenarios
+            if os.path.exists(os.path.join(snapshots_dir, name, 'network.json')):
+                prefixes |= Network.snapshot_chaincode_prefixes(os.path.join(snapshots_dir, name))
+    return prefixes
@@ -0,0 +1,120 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+class ArtifactCache(object):
+    # On-disk cache of generated fabric artifacts (crypto material, genesis
+    # blocks, ...). Entries are directories named after a content hash of the
+    # inputs that produced them. The least recently used entries are evicted
+    # once the cache grows beyond max_bytes.
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(*inputs):
+        digest = hashlib.sha256()
+        for value in inputs:
+            if not isinstance(value, bytes):
+                value = value.encode('utf-8')
+            digest.update(value)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def fetch(self, key, names, dest_dir):
+        # link (or copy) the named artifacts of a cached entry into dest_dir,
+        # returns False on a cache miss
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            return False
+        for name in names:
+            link_tree(os.path.join(entry_dir, name), os.path.join(dest_dir, name))
+        # mark entry as recently used
+        os.utime(entry_dir, None)
+        return True
+
+    def store(self, key, names, src_dir):
+        # populate a private directory first, then rename it into place so
+        # concurrent runs never observe a partially written entry
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.staging_')
+        try:
+            for name in names:
+                src = os.path.join(src_dir, name)
+                if os.path.isdir(src):
+                    shutil.copytree(src, os.path.join(staging_dir, name))
+                else:
+                    shutil.copy2(src, os.path.join(staging_dir, name))
+            os.rename(staging_dir, os.path.join(self.cache_dir, key))
+        except OSError:
+            # another run stored the same entry first
+            if not os.path.isdir(os.path.join(self.cache_dir, key)):
+                raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            entries.append((os.path.getmtime(entry_dir), tree_size(entry_dir), entry_dir, key))
+        total = sum(entry[1] for entry in entries)
+        # oldest first
+        for mtime, size, entry_dir, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+def link_tree(src, dst):
+    # hardlink a file or directory tree, falling back to copies across devices
+    if os.path.isdir(src):
+        os.mkdir(dst)
+        for name in os.listdir(src):
+            link_tree(os.path.join(src, name), os.path.join(dst, name))
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def tree_size(path):
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(dir_path, file_name))
+    return size
+
+def tree_digest(path):
+    # content hash of a directory tree, e.g. a chaincode's source
+    digest = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(dir_path, file_name)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
@@ -0,0 +1,104 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+import time
+from multiprocessing.pool import ThreadPool
+
+def run(operation, count, concurrency):
+    # call operation() count times from concurrency threads, recording the
+    # start time, duration and error (if any) of every call
+    def timed(i):
+        start = time.time()
+        try:
+            operation()
+            error = None
+        except Exception as e:
+            error = str(e)
+        return {'start': start, 'duration': time.time() - start, 'error': error}
+
+    pool = ThreadPool(concurrency)
+    try:
+        start = time.time()
+        timings = pool.map(timed, range(count))
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+    return timings, elapsed
+
+def percentile(values, percent):
+    # nearest rank percentile of a sorted list
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+def summarize(timings, elapsed):
+    latencies = sorted(timing['duration'] for timing in timings if not timing['error'])
+    summary = {
+        'count': len(timings),
+        'errors': len(timings) - len(latencies),
+        'elapsed': elapsed,
+        'tps': len(latencies) / elapsed if elapsed else None,
+        'latency': {
+            'min': latencies[0] if latencies else None,
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+    return summary
+
+def parse_duration(text):
+    # seconds of an orderer duration setting, e.g. 250ms or 2s
+    for unit, seconds in (('ms', 0.001), ('s', 1), ('m', 60)):
+        if text.endswith(unit):
+            return float(text[:-len(unit)]) * seconds
+    raise ValueError('Unknown duration {}'.format(text))
+
+def expected_block_size(submit_tps, batch_timeout, max_message_count):
+    # transactions per block at a steady submit rate: what arrives within
+    # BatchTimeout, up to MaxMessageCount
+    return min(float(max_message_count), max(1.0, submit_tps * batch_timeout))
+
+def summarize_blocks(transaction_counts):
+    # transaction_counts: number of transactions in each committed block
+    return {
+        'blocks': len(transaction_counts),
+        'transactions': sum(transaction_counts),
+        'mean': float(sum(transaction_counts)) / len(transaction_counts) if transaction_counts else None,
+        'min': min(transaction_counts) if transaction_counts else None,
+        'max': max(transaction_counts) if transaction_counts else None,
+    }
+
+def format_summary(operation, summary):
+    def ms(seconds):
+        return '-' if seconds is None else '{:.1f}ms'.format(seconds * 1000)
+    latency = summary['latency']
+    return '{} x{} ({} errors) in {:.2f}s: {} TPS, p50 {}, p95 {}, p99 {}, max {}'.format(
+        operation, summary['count'], summary['errors'], summary['elapsed'],
+        '-' if summary['tps'] is None else '{:.1f}'.format(summary['tps']),
+        ms(latency['p50']), ms(latency['p95']), ms(latency['p99']), ms(latency['max']))
+
+def write_report(path, scenario_name, docker_tag, results):
+    with open(path, 'w') as report:
+        json.dump({
+            'scenario': scenario_name,
+            'docker_tag': docker_tag,
+            'results': results,
+        }, report, indent=2, sort_keys=True)
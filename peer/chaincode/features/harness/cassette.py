@@ -0,0 +1,232 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Record the docker interactions of a scenario to a cassette file, and replay
+# them later without a docker daemon.
+#
+# An interaction is a docker API request with its response, or a stream
+# (container log, exec output) with every frame received on it. Frames are
+# recorded with the number of interactions started before they arrived, and
+# are only replayed once as many interactions have been replayed, so that a
+# block shows up in a peer log after the invoke that produced it, whatever
+# the replay speed.
+
+import json
+import os
+import threading
+import time
+
+from harness.docker_api import DockerClient, DockerError, OutputStream
+
+CASSETTE_MODES = ('record', 'replay')
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+def encode(data):
+    # bytes as (lossless) JSON text
+    return data.decode('latin-1')
+
+def decode(text):
+    return text.encode('latin-1')
+
+class Cassette(object):
+
+    def __init__(self, path, substitutions=()):
+        self.path = path
+        # (value, placeholder) pairs making requests independent of e.g.
+        # the temp dir of a run
+        self.substitutions = substitutions
+        self.interactions = []
+        self.started = 0
+        self.condition = threading.Condition()
+
+    def load(self):
+        with open(self.path) as cassette:
+            self.interactions = json.load(cassette)['interactions']
+        for interaction in self.interactions:
+            interaction['used'] = False
+        return self
+
+    def save(self):
+        cassette_dir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(cassette_dir):
+            os.makedirs(cassette_dir)
+        with self.condition:
+            interactions = list(self.interactions)
+        with open(self.path, 'w') as cassette:
+            json.dump({'interactions': interactions}, cassette, indent=1, sort_keys=True)
+
+    def normalize(self, value):
+        if isinstance(value, dict):
+            return dict((key, self.normalize(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [self.normalize(item) for item in value]
+        if isinstance(value, string_types):
+            for original, placeholder in self.substitutions:
+                value = value.replace(original, placeholder)
+        return value
+
+    def request_of(self, method, path, query, body):
+        return {
+            'method': method,
+            'path': path,
+            'query': self.normalize(dict((key, str(value)) for key, value in (query or {}).items())),
+            'body': self.normalize(body),
+        }
+
+    def start(self):
+        # count an interaction as started, releasing the stream frames waiting for it
+        with self.condition:
+            self.started += 1
+            self.condition.notify_all()
+            return self.started
+
+    def add(self, interaction):
+        with self.condition:
+            self.interactions.append(interaction)
+
+    def match(self, request):
+        # the first unused interaction for the same request, or failing
+        # that, for a GET without a body, the first unused one for the same
+        # path; any other request answered with another's response would
+        # shift every later response, so it fails instead
+        loose_matches = (False, True) if request['method'] == 'GET' and request['body'] is None else (False,)
+        with self.condition:
+            for loose in loose_matches:
+                for interaction in self.interactions:
+                    if interaction['used'] or interaction['method'] != request['method'] or interaction['path'] != request['path']:
+                        continue
+                    if loose or (interaction['query'], interaction['body']) == (request['query'], request['body']):
+                        interaction['used'] = True
+                        return interaction
+        raise DockerError(599, 'No recorded interaction for {} {} in {}'.format(request['method'], request['path'], self.path))
+
+class RecordingDockerClient(DockerClient):
+    # A docker client recording every interaction to the current cassette
+
+    def __init__(self, socket_path=None, tracer=None):
+        DockerClient.__init__(self, socket_path, tracer=tracer)
+        self.cassette = None
+
+    def use_cassette(self, cassette):
+        self.cassette = cassette
+
+    def send_request(self, method, path, query, body):
+        cassette = self.cassette
+        if not cassette:
+            return DockerClient.send_request(self, method, path, query, body)
+        interaction = cassette.request_of(method, path, query, body)
+        cassette.start()
+        start = time.time()
+        status, data = DockerClient.send_request(self, method, path, query, body)
+        interaction.update({'status': status, 'data': encode(data), 'duration': time.time() - start})
+        cassette.add(interaction)
+        return status, data
+
+    def open_stream(self, method, path, query, body):
+        cassette = self.cassette
+        if not cassette:
+            return DockerClient.open_stream(self, method, path, query, body)
+        interaction = cassette.request_of(method, path, query, body)
+        cassette.start()
+        try:
+            stream = DockerClient.open_stream(self, method, path, query, body)
+        except DockerError as e:
+            interaction.update({'status': e.status, 'data': encode(e.message.encode('utf-8')), 'duration': 0})
+            cassette.add(interaction)
+            raise
+        interaction.update({'status': 200, 'stream': True, 'frames': [], 'duration': 0})
+        cassette.add(interaction)
+        return RecordingStream(stream, cassette, interaction)
+
+class RecordingStream(OutputStream):
+
+    def __init__(self, stream, cassette, interaction):
+        OutputStream.__init__(self, stream.connection, stream.response)
+        self.cassette = cassette
+        self.interaction = interaction
+        self.opened = time.time()
+
+    def frames(self):
+        for frame in OutputStream.frames(self):
+            with self.cassette.condition:
+                self.interaction['frames'].append({
+                    'after': self.cassette.started,
+                    'offset': time.time() - self.opened,
+                    'data': encode(frame),
+                })
+            yield frame
+
+class ReplayDockerClient(DockerClient):
+    # A docker client answering from the current cassette instead of a
+    # docker daemon; speed scales the recorded timings (0: no delays)
+
+    live = False
+
+    def __init__(self, tracer=None, speed=0):
+        DockerClient.__init__(self, tracer=tracer)
+        self.speed = speed
+        self.cassette = None
+
+    def use_cassette(self, cassette):
+        self.cassette = cassette
+
+    def replay(self, method, path, query, body):
+        assert self.cassette, 'No cassette to replay {} {} from'.format(method, path)
+        interaction = self.cassette.match(self.cassette.request_of(method, path, query, body))
+        self.cassette.start()
+        if self.speed:
+            time.sleep(interaction['duration'] * self.speed)
+        return interaction
+
+    def send_request(self, method, path, query, body):
+        interaction = self.replay(method, path, query, body)
+        return interaction['status'], decode(interaction['data'])
+
+    def open_stream(self, method, path, query, body):
+        interaction = self.replay(method, path, query, body)
+        if not interaction.get('stream'):
+            raise DockerError(interaction['status'], decode(interaction['data']).decode('utf-8', 'replace'))
+        return ReplayStream(self.cassette, interaction['frames'], self.speed)
+
+class ReplayStream(OutputStream):
+
+    def __init__(self, cassette, frames, speed):
+        OutputStream.__init__(self, None, None)
+        self.cassette = cassette
+        self.recorded_frames = frames
+        self.speed = speed
+        self.closed = False
+        self.opened = time.time()
+
+    def frames(self):
+        for frame in self.recorded_frames:
+            with self.cassette.condition:
+                while self.cassette.started < frame['after'] and not self.closed:
+                    self.cassette.condition.wait(1)
+            if self.speed:
+                delay = self.opened + frame['offset'] * self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            if self.closed:
+                return
+            yield decode(frame['data'])
+
+    def close(self):
+        with self.cassette.condition:
+            self.closed = True
+            self.cassette.condition.notify_all()
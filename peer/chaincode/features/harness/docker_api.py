@@ -0,0 +1,353 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A small Docker Engine API client talking HTTP over the docker unix socket,
+# covering what the harness needs without forking the docker CLI for every
+# container operation.
+
+import json
+import os
+import re
+import socket
+import struct
+
+from harness.tracing import Tracer, shorten_path
+
+try:
+    import httplib
+    import Queue as queue
+    from urllib import quote, urlencode
+except ImportError:
+    import http.client as httplib
+    import queue
+    from urllib.parse import quote, urlencode
+
+API_VERSION = '1.24'
+
+def default_socket_path():
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return '/var/run/docker.sock'
+
+class DockerError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, '{} ({})'.format(message, status))
+        self.status = status
+        self.message = message
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, socket_path):
+        httplib.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+class OutputStream(object):
+    # The multiplexed stdout/stderr stream of container logs and exec output:
+    # frames of an 8 byte header (stream type, 3 bytes padding, big endian
+    # payload size) followed by the payload. The stream owns its connection.
+
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.response = response
+
+    def read_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.response.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def frames(self):
+        try:
+            while True:
+                header = self.read_exactly(8)
+                if len(header) < 8:
+                    return
+                stream_type, size = struct.unpack('>BxxxL', header)
+                yield self.read_exactly(size)
+        except (httplib.HTTPException, socket.error, ValueError, AttributeError):
+            # the stream was closed
+            return
+
+    def lines(self):
+        # the payload split into lines, keeping the line endings
+        pending = b''
+        for frame in self.frames():
+            pending += frame
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        if pending:
+            yield pending
+
+    def read(self):
+        return b''.join(self.frames())
+
+    def close(self):
+        # also unblocks a thread reading the stream
+        try:
+            self.connection.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, socket.error):
+            pass
+        self.connection.close()
+
+class DockerClient(object):
+    # Keeps up to pool_size idle keep-alive connections to the docker daemon
+    # for reuse across requests; streams get a connection of their own.
+
+    # whether containers really run, see harness.cassette
+    live = True
+
+    def __init__(self, socket_path=None, pool_size=8, tracer=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue()
+        self.tracer = tracer or Tracer(enabled=False)
+
+    def span(self, method, path):
+        # container, exec and network IDs make every path unique
+        return self.tracer.span('{} {}'.format(method, re.sub(r'/[0-9a-f]{64}', '/{id}', path)), 'docker')
+
+    def url(self, path, query=None):
+        url = '/v{}{}'.format(API_VERSION, path)
+        if query:
+            url += '?' + urlencode(sorted(query.items()))
+        return url
+
+    def send(self, connection, method, path, query=None, body=None):
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, self.url(path, query), body, headers)
+        return connection.getresponse()
+
+    def acquire(self):
+        try:
+            return self.pool.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path), False
+
+    def release(self, connection):
+        if self.pool.qsize() < self.pool_size:
+            self.pool.put(connection)
+        else:
+            connection.close()
+
+    def request(self, method, path, query=None, body=None):
+        # the decoded JSON response, if any
+        with self.span(method, path) as span:
+            status, data = self.send_request(method, path, query, body)
+            span['status'] = status
+        if status >= 400:
+            raise DockerError(status, error_message(data))
+        return json.loads(data.decode('utf-8')) if data.strip() else None
+
+    def send_request(self, method, path, query, body):
+        # status and body of a response
+        while True:
+            connection, reused = self.acquire()
+            try:
+                response = self.send(connection, method, path, query, body)
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                # the daemon may have closed an idle connection, retry on a new one
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+            return response.status, data
+
+    def stream(self, method, path, query=None, body=None):
+        with self.span(method, path):
+            return self.open_stream(method, path, query, body)
+
+    def open_stream(self, method, path, query, body):
+        connection = UnixHTTPConnection(self.socket_path)
+        response = self.send(connection, method, path, query, body)
+        if response.status >= 400:
+            message = error_message(response.read())
+            connection.close()
+            raise DockerError(response.status, message)
+        return OutputStream(connection, response)
+
+    def create_network(self, name, labels=None):
+        body = {'Name': name, 'CheckDuplicate': True}
+        if labels:
+            body['Labels'] = dict(labels)
+        return self.request('POST', '/networks/create', body=body)['Id']
+
+    def networks(self, filters=None):
+        # filters as in containers()
+        return self.request('GET', '/networks', {'filters': json.dumps(filters)} if filters else None)
+
+    def inspect_network(self, network_id):
+        return self.request('GET', '/networks/{}'.format(quote(network_id)))
+
+    def remove_network(self, network_id):
+        self.request('DELETE', '/networks/{}'.format(quote(network_id)))
+
+    def pull(self, image):
+        repository, _, tag = image.rpartition(':')
+        if not repository or '/' in tag:
+            repository, tag = image, 'latest'
+        # pull progress is reported as a series of JSON objects
+        with self.span('POST', '/images/create'):
+            status, data = self.send_request('POST', '/images/create', {'fromImage': repository, 'tag': tag}, None)
+        if status >= 400:
+            raise DockerError(status, error_message(data))
+        for line in data.decode('utf-8').splitlines():
+            if line.strip() and 'error' in json.loads(line):
+                raise DockerError(status, json.loads(line)['error'])
+
+    def run(self, image, command=None, env=(), volumes=(), network=None, aliases=(), ports=(), working_dir=None, tmpfs=None, labels=None):
+        # create and start a detached container, the equivalent of docker run
+        # --detach; ports are published on free host ports, see port(), and
+        # tmpfs maps container paths to tmpfs mount options
+        with self.tracer.span('run {}'.format(image), 'container', argv=[shorten_path(arg) for arg in command or []]):
+            return self.create_and_start(image, command, env, volumes, network, aliases, ports, working_dir, tmpfs, labels)
+
+    def create_and_start(self, image, command, env, volumes, network, aliases, ports, working_dir, tmpfs, labels):
+        config = {
+            'Image': image,
+            'Env': list(env),
+            'ExposedPorts': dict(('{}/tcp'.format(port), {}) for port in ports),
+            'HostConfig': {
+                'Binds': list(volumes),
+                'PortBindings': dict(('{}/tcp'.format(port), [{'HostIp': '', 'HostPort': ''}]) for port in ports),
+            },
+        }
+        if command:
+            config['Cmd'] = list(command)
+        if working_dir:
+            config['WorkingDir'] = working_dir
+        if tmpfs:
+            config['HostConfig']['Tmpfs'] = dict(tmpfs)
+        if labels:
+            config['Labels'] = dict(labels)
+        if network:
+            config['HostConfig']['NetworkMode'] = network
+            config['NetworkingConfig'] = {'EndpointsConfig': {network: {'Aliases': list(aliases)}}}
+        try:
+            container_id = self.request('POST', '/containers/create', body=config)['Id']
+        except DockerError as e:
+            if e.status != 404:
+                raise
+            # like docker run, pull missing images
+            self.pull(image)
+            container_id = self.request('POST', '/containers/create', body=config)['Id']
+        self.request('POST', '/containers/{}/start'.format(container_id))
+        return container_id
+
+    def containers(self, all=False, filters=None):
+        # running containers, or all of them; filters as in docker ps
+        # --filter, e.g. {'label': ['name=value']}
+        query = {}
+        if all:
+            query['all'] = 1
+        if filters:
+            query['filters'] = json.dumps(filters)
+        return self.request('GET', '/containers/json', query or None)
+
+    def stats(self, container_id):
+        # a snapshot of a container's resource usage; sampled periodically,
+        # so not traced, see harness.resources
+        status, data = self.send_request('GET', '/containers/{}/stats'.format(quote(container_id)), {'stream': 0}, None)
+        if status >= 400:
+            raise DockerError(status, error_message(data))
+        return json.loads(data.decode('utf-8'))
+
+    def images(self):
+        return self.request('GET', '/images/json')
+
+    def remove_image(self, image):
+        # the equivalent of docker rmi --force
+        self.request('DELETE', '/images/{}'.format(quote(image)), {'force': 1})
+
+    def inspect_image(self, image):
+        return self.request('GET', '/images/{}/json'.format(quote(image)))
+
+    def commit(self, container_id, repository, tag, config=None):
+        # create an image from a container, the equivalent of docker commit;
+        # config overrides the container's configuration, e.g. its Cmd
+        return self.request('POST', '/commit', {'container': container_id, 'repo': repository, 'tag': tag}, config or {})['Id']
+
+    def inspect(self, container_id):
+        return self.request('GET', '/containers/{}/json'.format(quote(container_id)))
+
+    def port(self, container_id, port):
+        # host address a container port is published on, e.g. 0.0.0.0:32768
+        bindings = self.inspect(container_id)['NetworkSettings']['Ports']['{}/tcp'.format(port)]
+        for binding in bindings:
+            if ':' not in binding['HostIp']:
+                return '{}:{}'.format(binding['HostIp'] or '0.0.0.0', binding['HostPort'])
+        return '0.0.0.0:{}'.format(bindings[0]['HostPort'])
+
+    def exec_run(self, container_id, command, env=()):
+        # run a command in a running container, returning its exit code and
+        # combined output
+        argv = [shorten_path(arg) for arg in command]
+        with self.tracer.span('exec ' + ' '.join(argv[:3]), 'command', argv=argv) as span:
+            exit_code, output = self.exec_command(container_id, command, env)
+            span['exit_code'] = exit_code
+        return exit_code, output
+
+    def exec_command(self, container_id, command, env):
+        exec_id = self.request('POST', '/containers/{}/exec'.format(quote(container_id)), body={
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Cmd': list(command),
+            'Env': list(env),
+        })['Id']
+        stream = self.stream('POST', '/exec/{}/start'.format(exec_id), body={'Detach': False, 'Tty': False})
+        try:
+            output = stream.read()
+        finally:
+            stream.close()
+        return self.request('GET', '/exec/{}/json'.format(exec_id))['ExitCode'], output
+
+    def logs(self, container_id, follow=False):
+        # stream of the container's log, from container start
+        return self.stream('GET', '/containers/{}/logs'.format(quote(container_id)), {
+            'stdout': 1,
+            'stderr': 1,
+            'follow': int(follow),
+        })
+
+    def kill(self, container_id, signal='SIGKILL'):
+        self.request('POST', '/containers/{}/kill'.format(quote(container_id)), {'signal': signal})
+
+    def remove_container(self, container_id):
+        # the equivalent of docker rm --force --volumes
+        self.request('DELETE', '/containers/{}'.format(quote(container_id)), {'force': 1, 'v': 1})
+
+def error_message(data):
+    try:
+        return json.loads(data.decode('utf-8'))['message']
+    except (ValueError, KeyError, TypeError):
+        return data.decode('utf-8', 'replace').strip()
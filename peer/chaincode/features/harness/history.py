@@ -0,0 +1,159 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Scenario and step durations of every run, kept in a SQLite file, and a
+# report of the steps whose median duration changed compared to earlier runs
+# or to runs of a baseline docker tag.
+#
+# usage: python -m harness.history --db FILE [--last N | --baseline-tag TAG]
+#            [--threshold PERCENT] [--min-seconds SECONDS] [--run KEY]
+#
+# Exits with 1 if any step got slower beyond the threshold.
+
+import argparse
+import collections
+import os
+import re
+import sqlite3
+import sys
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    started REAL,
+    fabric_tag TEXT,
+    peer_tag TEXT,
+    orderer_tag TEXT,
+    tools_tag TEXT
+);
+CREATE TABLE IF NOT EXISTS durations (
+    run_id INTEGER REFERENCES runs (id),
+    feature TEXT,
+    scenario TEXT,
+    example_row TEXT,
+    step TEXT,
+    duration REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS durations_run_id ON durations (run_id);
+'''
+
+class History(object):
+    # Durations are buffered and written at the end of every scenario. Runs
+    # are identified by a key, so that the workers of a parallel run (see
+    # harness.parallel) add to the same run.
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.executescript(SCHEMA)
+        self.run_id = None
+        self.pending = []
+
+    def start_run(self, key, docker_tag):
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO runs (key, started, fabric_tag, peer_tag, orderer_tag, tools_tag) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, time.time(), docker_tag['fabric'], docker_tag['peer'], docker_tag['orderer'], docker_tag['tools']))
+        self.run_id = self.connection.execute('SELECT id FROM runs WHERE key = ?', (key,)).fetchone()[0]
+
+    def record(self, feature, scenario, step, duration, status):
+        # step None for the duration of the whole scenario
+        name, example_row = scenario_key(scenario)
+        self.pending.append((self.run_id, feature.name, name, example_row, step.name if step else '', duration, status))
+
+    def flush(self):
+        with self.connection:
+            self.connection.executemany('INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?, ?)', self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+def scenario_key(scenario):
+    # the name of a scenario, and for scenario outlines the values of its
+    # Examples row, e.g. lang=go
+    row = getattr(scenario, '_row', None)
+    if not row:
+        return scenario.name, ''
+    return re.sub(r'\s+-- @\S+.*$', '', scenario.name), ', '.join('{}={}'.format(heading, cell) for heading, cell in zip(row.headings, row.cells))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def medians(connection, run_ids):
+    # median duration of every passed step (and scenario) in the runs
+    durations = collections.defaultdict(list)
+    for row in connection.execute('SELECT feature, scenario, example_row, step, duration FROM durations WHERE status = ? AND run_id IN ({})'.format(
+            ', '.join('?' * len(run_ids))), ['passed'] + list(run_ids)):
+        durations[tuple(row[:4])].append(row[4])
+    return dict((key, median(values)) for key, values in durations.items())
+
+def compare(connection, run_id, baseline_run_ids, threshold, min_seconds):
+    # (change, baseline median, current median, key) of the steps whose
+    # median moved by more than threshold percent and min_seconds
+    current = medians(connection, [run_id])
+    baseline = medians(connection, baseline_run_ids)
+    changes = []
+    for key, duration in current.items():
+        if key not in baseline or not baseline[key]:
+            continue
+        change = (duration - baseline[key]) / baseline[key] * 100
+        if abs(change) > threshold and abs(duration - baseline[key]) > min_seconds:
+            changes.append((change, baseline[key], duration, key))
+    return sorted(changes, reverse=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare step durations of a run with earlier runs.')
+    parser.add_argument('--db', required=True, help='history file, see the history-db userdata option')
+    parser.add_argument('--run', help='key of the run to check (default: the latest run)')
+    parser.add_argument('--last', type=int, default=5, help='compare with the N runs before it (default: 5)')
+    parser.add_argument('--baseline-tag', help='compare with the last N runs of this fabric or peer docker tag instead')
+    parser.add_argument('--threshold', type=float, default=20, help='percent a median must move to be reported (default: 20)')
+    parser.add_argument('--min-seconds', type=float, default=0.1, help='seconds a median must move to be reported (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error('no such history file: {}'.format(args.db))
+    connection = sqlite3.connect(args.db, timeout=60)
+    if args.run:
+        run = connection.execute('SELECT id, key, fabric_tag, peer_tag FROM runs WHERE key = ?', (args.run,)).fetchone()
+    else:
+        run = connection.execute('SELECT id, key, fabric_tag, peer_tag FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+    if not run:
+        parser.error('no run to check')
+    if args.baseline_tag:
+        baseline_runs = connection.execute('SELECT id FROM runs WHERE id != ? AND ? IN (fabric_tag, peer_tag) ORDER BY id DESC LIMIT ?',
+            (run[0], args.baseline_tag, args.last)).fetchall()
+    else:
+        baseline_runs = connection.execute('SELECT id FROM runs WHERE id < ? ORDER BY id DESC LIMIT ?', (run[0], args.last)).fetchall()
+    if not baseline_runs:
+        print('no baseline runs for run {}'.format(run[1]))
+        return 0
+
+    changes = compare(connection, run[0], [baseline_run[0] for baseline_run in baseline_runs], args.threshold, args.min_seconds)
+    print('run {} (fabric {}, peer {}) against {} baseline runs{}: {} changes beyond {}%'.format(
+        run[1], run[2], run[3], len(baseline_runs), ' of ' + args.baseline_tag if args.baseline_tag else '', len(changes), args.threshold))
+    if changes:
+        print('{:>9}  {:>9}  {:>9}  {}'.format('change', 'baseline', 'current', 'step'))
+    for change, baseline, current, (feature, scenario, example_row, step) in changes:
+        print('{:>+8.1f}%  {:>8.2f}s  {:>8.2f}s  {} / {}{}{}'.format(change, baseline, current, feature, scenario,
+            ' [{}]'.format(example_row) if example_row else '', ': ' + step if step else ''))
+    return 1 if any(change > 0 for change, baseline, current, key in changes) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
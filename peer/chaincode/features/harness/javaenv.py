@@ -0,0 +1,64 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Peers build Java chaincode in a container of the Java runtime image
+# (fabric-javaenv), which resolves the chaincode's Gradle or Maven
+# dependencies from scratch on every instantiate. prewarm() builds a chaincode
+# once in a container of the runtime image and commits the container, with
+# the resolved dependencies in its Gradle and Maven caches, as the runtime
+# image for the peers. The caches are also kept in a docker volume between
+# runs, so that prewarming a new runtime image tag does not download them
+# all again.
+
+import subprocess
+
+from harness.artifacts import ArtifactCache, tree_digest
+
+# repository of the prewarmed runtime images, tagged by a hash of the runtime
+# image, chaincode source and prewarm script
+PREWARMED_REPOSITORY = 'behave-fabric-javaenv'
+
+# build the chaincode where and how the peer builds it, starting from the
+# caches in the volume and saving them back there
+PREWARM_SCRIPT = '''set -e
+mkdir -p /cache/gradle /cache/m2 "$HOME/.gradle" "$HOME/.m2" /chaincode/input/src /chaincode/output
+cp -a /cache/gradle/. "$HOME/.gradle/"
+cp -a /cache/m2/. "$HOME/.m2/"
+cp -a /prewarm/. /chaincode/input/src/
+./build.sh
+cp -a "$HOME/.gradle/." /cache/gradle/
+cp -a "$HOME/.m2/." /cache/m2/
+rm -rf /chaincode/input/src /chaincode/output/*
+'''
+
+def prewarm(docker, runtime_image, source_dir, volume, labels=None):
+    # name of the prewarmed runtime image, which is built unless it exists
+    image = '{}:{}'.format(PREWARMED_REPOSITORY, ArtifactCache.key(runtime_image, tree_digest(source_dir), PREWARM_SCRIPT)[:12])
+    if any(image in (existing.get('RepoTags') or []) for existing in docker.images()):
+        return image
+    container_id = docker.run(runtime_image, ['tail', '-f', '/dev/null'], volumes=[
+        '{}:/cache'.format(volume),
+        '{}:/prewarm:ro'.format(source_dir),
+    ], labels=labels)
+    try:
+        exit_code, output = docker.exec_run(container_id, ['sh', '-c', PREWARM_SCRIPT])
+        if exit_code:
+            print(output)
+            raise subprocess.CalledProcessError(exit_code, ['sh', '-c', PREWARM_SCRIPT], output)
+        # keep the command of the runtime image, not that of the container
+        repository, tag = image.split(':')
+        docker.commit(container_id, repository, tag, {'Cmd': docker.inspect_image(runtime_image)['Config']['Cmd']})
+    finally:
+        docker.remove_container(container_id)
+    return image
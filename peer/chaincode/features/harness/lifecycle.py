@@ -0,0 +1,85 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+from multiprocessing.pool import ThreadPool
+
+class TaskGraph(object):
+    # Runs named tasks on a thread pool, starting every task as soon as the
+    # tasks it depends on have completed. When a task fails no further tasks
+    # are started, the running ones are waited for and the first error is
+    # raised once everything has settled.
+
+    def __init__(self):
+        self.tasks = collections.OrderedDict()
+
+    def add(self, name, function, after=()):
+        assert name not in self.tasks, 'Duplicate task: {}'.format(name)
+        for dependency in after:
+            assert dependency in self.tasks, 'Unknown dependency {} of task {}'.format(dependency, name)
+        self.tasks[name] = (function, tuple(after))
+
+    def run(self):
+        if not self.tasks:
+            return {}
+        results = {}
+        errors = []
+        running = set()
+        condition = threading.Condition()
+
+        def execute(name, function):
+            try:
+                result = function()
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+            with condition:
+                running.discard(name)
+                if error:
+                    errors.append(error)
+                else:
+                    results[name] = result
+                condition.notify()
+
+        pool = ThreadPool(len(self.tasks))
+        try:
+            pending = collections.OrderedDict(self.tasks)
+            with condition:
+                while True:
+                    if not errors:
+                        for name, (function, after) in list(pending.items()):
+                            if all(dependency in results for dependency in after):
+                                del pending[name]
+                                running.add(name)
+                                pool.apply_async(execute, (name, function))
+                    if not running:
+                        break
+                    # wait with a timeout so that KeyboardInterrupt is delivered
+                    condition.wait(1)
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            raise errors[0]
+        return results
+
+def run_concurrently(functions):
+    # call every function at once, returning their results in order
+    graph = TaskGraph()
+    for i, function in enumerate(functions):
+        graph.add(i, function)
+    results = graph.run()
+    return [results[i] for i in range(len(functions))]
@@ -0,0 +1,189 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+
+class LogStream(object):
+    # Follows the log of a container from its start in a background thread,
+    # writing it to a file as it arrives (optionally gzipped, optionally
+    # capped at max_bytes per file) and passing every line to the listeners.
+    # Nothing but the file handle and a few counters is kept in memory.
+
+    def __init__(self, docker, container_id, path, compress=False, max_bytes=None):
+        self.docker = docker
+        self.container_id = container_id
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.listeners = []
+        # patterns that have been seen in the log, see watch()
+        self.patterns = {}
+        # total bytes received, and when the last of them arrived
+        self.bytes_received = 0
+        self.last_received = time.time()
+        self.lock = threading.Lock()
+        self.stream = None
+        self.thread = None
+        self.log_file = None
+        self.open_file(path)
+
+    def open_file(self, path):
+        log_dir = os.path.dirname(path)
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+        if self.compress:
+            self.path = path + '.gz'
+            self.log_file = gzip.open(self.path, 'wb')
+        else:
+            self.path = path
+            self.log_file = open(self.path, 'wb')
+        self.bytes_written = 0
+        self.truncated = False
+
+    def add_listener(self, listener):
+        # listener(line) is called from the streaming thread for every line
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        # the streaming thread may be iterating over the current list
+        self.listeners = [other for other in self.listeners if other is not listener]
+
+    def watch(self, pattern):
+        # remember whether pattern has appeared in the log, see seen(); to
+        # not miss early lines, watch before the stream is started
+        self.patterns[pattern] = False
+
+    def seen(self, pattern):
+        return self.patterns[pattern]
+
+    def start(self):
+        self.stream = self.docker.logs(self.container_id, follow=True)
+        self.thread = threading.Thread(target=self.follow)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def follow(self):
+        for line in self.stream.lines():
+            text = line.decode('utf-8', 'replace')
+            with self.lock:
+                self.bytes_received += len(line)
+                self.last_received = time.time()
+                self.write(line)
+            for pattern in self.patterns:
+                if not self.patterns[pattern] and re.search(pattern, text):
+                    self.patterns[pattern] = True
+            for listener in self.listeners:
+                listener(text)
+
+    def write(self, line):
+        if self.truncated or self.log_file.closed:
+            return
+        if self.max_bytes is not None and self.bytes_written + len(line) > self.max_bytes:
+            self.log_file.write('[log truncated at {} bytes]\n'.format(self.bytes_written).encode('utf-8'))
+            self.truncated = True
+            return
+        self.log_file.write(line)
+        self.bytes_written += len(line)
+
+    def copy(self, path):
+        # copy everything received so far, as a complete (gzip) file
+        with self.lock:
+            if not self.compress:
+                self.log_file.flush()
+                shutil.copyfile(self.path, path)
+                return
+            # the gzip trailer is only written on close, so the flushed
+            # data is recompressed into a file of its own
+            self.log_file.flush(zlib.Z_SYNC_FLUSH)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with open(self.path, 'rb') as source:
+                with gzip.open(path, 'wb') as destination:
+                    for chunk in iter(lambda: source.read(64 * 1024), b''):
+                        destination.write(decompressor.decompress(chunk))
+
+    def rotate(self, path):
+        # continue the log in a new file, e.g. for the next scenario
+        with self.lock:
+            self.log_file.close()
+            self.open_file(path)
+
+    def stop(self):
+        if self.stream:
+            self.stream.close()
+        if self.thread:
+            self.thread.join(5)
+        with self.lock:
+            self.log_file.close()
+
+class BlockTracker(object):
+    # Log stream listener keeping the (block number, transaction count) of
+    # every block a peer committed, by channel.
+
+    PATTERN = re.compile(r'Channel \[([^\]]+)\]: (?:Committed|Created) block \[(\d+)\] with (\d+) transaction')
+
+    def __init__(self, blocks=None):
+        self.blocks = blocks or {}
+        self.lock = threading.Lock()
+
+    def __call__(self, line):
+        match = self.PATTERN.search(line)
+        if match:
+            channel_id, block, transactions = match.groups()
+            with self.lock:
+                self.blocks.setdefault(channel_id, []).append((int(block), int(transactions)))
+
+    def committed_blocks(self, channel_id):
+        with self.lock:
+            return list(self.blocks.get(channel_id, []))
+
+class OrdererTracker(object):
+    # Log stream listener keeping when an orderer wrote every block, and the
+    # Raft leader it last saw elected (Raft node ID, 0 for none), by channel.
+
+    WROTE_PATTERN = re.compile(r'\[channel: ([^\]]+)\] Wrote block \[(\d+)\]')
+    LEADER_PATTERN = re.compile(r'Raft leader changed: \d+ -> (\d+) channel=(\S+)')
+
+    def __init__(self):
+        self.blocks = {}
+        self.leaders = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, line):
+        match = self.WROTE_PATTERN.search(line)
+        if match:
+            channel_id, block = match.groups()
+            with self.lock:
+                self.blocks.setdefault(channel_id, []).append((int(block), time.time()))
+            return
+        match = self.LEADER_PATTERN.search(line)
+        if match:
+            leader, channel_id = match.groups()
+            with self.lock:
+                self.leaders[channel_id] = (time.time(), int(leader))
+
+    def written_blocks(self, channel_id):
+        # (block number, time written)
+        with self.lock:
+            return list(self.blocks.get(channel_id, []))
+
+    def leader(self, channel_id):
+        # (time seen, Raft node ID) of the channel's leader, if any
+        with self.lock:
+            leader = self.leaders.get(channel_id)
+        return leader if leader and leader[1] else None
@@ -0,0 +1,992 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import pyaml
+
+from harness.artifacts import link_tree
+from harness.docker_api import DockerClient
+from harness.lifecycle import TaskGraph, run_concurrently
+from harness.logs import BlockTracker, LogStream, OrdererTracker
+from harness.wait import DEFAULT_TIMEOUT, WaitTimeout, wait_for_port, wait_for_quiet, wait_until
+
+# lifetimes a fabric network can have, see the network-scope userdata option
+NETWORK_SCOPES = ('scenario', 'feature', 'run')
+
+# configtx.yaml orderer settings that can be changed, with the userdata
+# option that changes them and their default value
+ORDERER_SETTINGS = collections.OrderedDict([
+    ('OrdererType', ('orderer-type', 'solo')),
+    ('BatchTimeout', ('batch-timeout', '1s')),
+    ('MaxMessageCount', ('max-message-count', '1')),
+    ('AbsoluteMaxBytes', ('absolute-max-bytes', '10 MB')),
+    ('PreferredMaxBytes', ('preferred-max-bytes', '512 KB')),
+])
+
+# ordering services: a single solo orderer, or a cluster of orderers
+# replicating through Kafka (and ZooKeeper) containers or Raft
+ORDERER_TYPES = ('solo', 'kafka', 'etcdraft')
+
+# where the orderer and peers keep their ledgers: the container's writable
+# layer on disk, or tmpfs, see the storage userdata option
+STORAGE_TYPES = ('disk', 'tmpfs')
+PRODUCTION_DIR = '/var/hyperledger/production'
+
+# world state databases of the peers: LevelDB inside the peer, or a CouchDB
+# container per peer, see the state-db userdata option
+STATE_DATABASES = ('leveldb', 'couchdb')
+# where CouchDB keeps its databases, the counterpart of PRODUCTION_DIR
+COUCHDB_DATA_DIR = '/opt/couchdb/data'
+
+# GOPATH, mounted from the host, inside the CLI container
+CLI_GOPATH = '/run/chaincode'
+# GOPATH of the chaincode bundled with the tests, see the chaincode directory
+CLI_TEST_GOPATH = '/run/testchaincode'
+
+class Orderer(object):
+
+    def __init__(self, name):
+        # the name doubles as hostname and network alias; every orderer is
+        # also reachable as orderer, see start_orderer()
+        self.name = name
+        self.container_id = None
+        self.address = None
+
+def orderers(orderer_type, orderer_count):
+    assert orderer_type in ORDERER_TYPES, 'Unknown orderer type: {}'.format(orderer_type)
+    if orderer_type == 'solo':
+        assert orderer_count == 1, 'A solo ordering service has a single orderer'
+        return [Orderer('orderer')]
+    return [Orderer('orderer{}'.format(i)) for i in range(orderer_count)]
+
+class PeerOrg(object):
+
+    def __init__(self, name, msp_id, domain, peers):
+        self.name = name
+        self.msp_id = msp_id
+        self.domain = domain
+        # peers as (hostname, name) pairs, the name doubles as peer ID and network alias
+        self.peers = [Peer(self, hostname, name) for hostname, name in peers]
+
+class Peer(object):
+
+    def __init__(self, org, hostname, name):
+        self.org = org
+        self.hostname = hostname
+        self.name = name
+        self.container_id = None
+        self.address = None
+        # name of the peer's CouchDB container, if any
+        self.couchdb = None
+
+def peer_orgs(org_count, peers_per_org):
+    if (org_count, peers_per_org) == (1, 1):
+        # a single peer organization with a single peer
+        return [PeerOrg('PeerOrg', 'PeerMSP', 'local', [('peer', 'peer')])]
+    return [
+        PeerOrg('PeerOrg{}'.format(i), 'PeerOrg{}MSP'.format(i), 'org{}.local'.format(i),
+            [('peer{}'.format(j), 'peer{}.org{}.local'.format(j, i)) for j in range(peers_per_org)])
+        for i in range(1, org_count + 1)
+    ]
+
+class Network(object):
+    # A fabric network of a solo orderer or a cluster of orderers and one or
+    # more peer organizations running on its own docker network. All
+    # generated artifacts are written to work_dir.
+
+    def __init__(self, context, scope, work_dir, orderer_settings=None, org_count=1, peers_per_org=1, orderer_count=None, state_db=None):
+        assert scope in NETWORK_SCOPES, 'Unknown network scope: {}'.format(scope)
+        # orderer settings: defaults, overridden by userdata, overridden by the caller
+        self.orderer_settings = dict((setting, default) for setting, (option, default) in ORDERER_SETTINGS.items())
+        self.orderer_settings.update(getattr(context, 'orderer_settings', {}))
+        for setting in (orderer_settings or {}):
+            assert setting in ORDERER_SETTINGS, 'Unknown orderer setting: {}'.format(setting)
+            self.orderer_settings[setting] = orderer_settings[setting]
+        self.orderers = orderers(self.orderer_settings['OrdererType'], orderer_count or getattr(context, 'orderer_count', 1))
+        # Kafka brokers and ZooKeeper servers of a kafka ordering service
+        self.kafka_brokers = getattr(context, 'kafka_brokers', 3)
+        self.zookeepers = getattr(context, 'zookeepers', 1)
+        self.orgs = peer_orgs(org_count, peers_per_org)
+        self.peers = [peer for org in self.orgs for peer in org.peers]
+        self.state_db = state_db or getattr(context, 'state_db', 'leveldb')
+        assert self.state_db in STATE_DATABASES, 'Unknown state database: {}'.format(self.state_db)
+        if self.state_db == 'couchdb':
+            for peer in self.peers:
+                peer.couchdb = 'couchdb.' + peer.name
+        self.scope = scope
+        self.work_dir = work_dir
+        self.docker_tag = context.docker_tag
+        self.go_path = context.go_path
+        self.test_go_path = getattr(context, 'test_go_path', None)
+        # prewarmed Java chaincode runtime image, see harness.javaenv
+        self.java_runtime = getattr(context, 'java_runtime', None)
+        # prefix of the names of the chaincode containers and images the peers
+        # create, see peer_network_id in environment.py
+        self.peer_network_id = getattr(context, 'peer_network_id', 'dev')
+        # a scenario network may be up next to the shared network of the
+        # feature or run, see steps.py, with peers of the same names
+        if scope == 'scenario' and getattr(context, 'network_scope', 'scenario') != 'scenario':
+            self.peer_network_id += '-scenario'
+        self.artifact_cache = getattr(context, 'artifact_cache', None)
+        self.wait_timeout = getattr(context, 'wait_timeout', DEFAULT_TIMEOUT)
+        self.docker = getattr(context, 'docker', None) or DockerClient()
+        # labels of the containers and networks of the run, and the manifest
+        # of its chaincode containers and images, see harness.reaper
+        self.resource_tracker = getattr(context, 'resource_tracker', None)
+        self.labels = self.resource_tracker.labels if self.resource_tracker else None
+        self.storage = getattr(context, 'storage', 'disk')
+        self.tmpfs_size = getattr(context, 'tmpfs_size', None)
+        # container logs are streamed to files in log_dir, see capture_logs()
+        self.log_dir = os.path.join(work_dir, 'logs')
+        self.log_compress = getattr(context, 'log_compress', False)
+        self.log_max_bytes = getattr(context, 'log_max_bytes', None)
+        self.log_streams = collections.OrderedDict()
+        self.block_trackers = {}
+        # whether the ledgers were restored from a snapshot, see restore()
+        self.restored = False
+        self.name = None
+        self.id = None
+        # running containers by name, in start order
+        self.containers = collections.OrderedDict()
+        # (peer name, chaincode name, version) of every chaincode installed
+        self.installed_chaincodes = set()
+        self.cli_container_id = None
+        # containers killed by kill_orderer(), removed along with the others
+        self.killed_containers = []
+        # blocks the orderers wrote and the Raft leaders they saw, by orderer name
+        self.orderer_trackers = {}
+
+    # the first orderer
+    @property
+    def orderer(self):
+        return self.orderers[0]
+
+    @property
+    def orderer_container_id(self):
+        return self.orderer.container_id
+
+    @property
+    def orderer_address(self):
+        return self.orderer.address
+
+    @property
+    def orderer_type(self):
+        return self.orderer_settings['OrdererType']
+
+    # the first peer of the first organization, which creates the channels
+    @property
+    def peer(self):
+        return self.peers[0]
+
+    @property
+    def peer_container_id(self):
+        return self.peer.container_id
+
+    @property
+    def peer_address(self):
+        return self.peer.address
+
+    @property
+    def peer_tls_dir(self):
+        return self.peer.tls_dir
+
+    @property
+    def peer_admin_msp_dir(self):
+        return self.peer.org.admin_msp_dir
+
+    def up(self):
+        # generate crypto materials input file
+        secrets_dir = 'secrets'
+        crypto_config_yaml = 'crypto-config.yaml'
+
+        with open(os.path.join(self.work_dir, crypto_config_yaml), 'w') as crypto_config_stream:
+            crypto_config = {
+                'OrdererOrgs':[
+                    {
+                        'Name':'OrdererOrg',
+                        'Domain':'local',
+                        'CA': {'Country':'US','Province':'North Carolina','Locality':'Raleigh'},
+                        'Specs': self.orderer_specs(),
+                    }
+                ],
+                'PeerOrgs':[
+                    {
+                        'Name':org.name,
+                        'Domain':org.domain,
+                        'CA': {'Country':'US','Province':'North Carolina','Locality':'Raleigh'},
+                        'Specs': [{'Hostname':peer.hostname} for peer in org.peers]
+                    }
+                    for org in self.orgs
+                ]
+            }
+            pyaml.dump(crypto_config, crypto_config_stream)
+
+        orderer_org_msp_dir = '{0}/ordererOrganizations/{1}/msp'.format(secrets_dir, 'local')
+
+        # generate configuration transaction generator input file
+        configtx_yaml = 'configtx.yaml'
+        with open(os.path.join(self.work_dir, configtx_yaml), 'w') as configtx_stream:
+            orderer_org = {
+                'Name' : 'OrdererOrg',
+                'ID' : 'OrdererMSP',
+                'MSPDir' : orderer_org_msp_dir,
+            }
+            peer_orgs = [
+                {
+                    'Name' : org.name,
+                    'ID' : org.msp_id,
+                    'MSPDir' : '{0}/peerOrganizations/{1}/msp'.format(secrets_dir, org.domain),
+                    'AnchorPeers' : [{ 'Host':org.peers[0].name, 'Port':7051 }],
+                }
+                for org in self.orgs
+            ]
+            orderer_config = {
+                'OrdererType' : self.orderer_type,
+                'Addresses' : ['{}:7050'.format(orderer.name) for orderer in self.orderers],
+                'BatchTimeout' : self.orderer_settings['BatchTimeout'],
+                'BatchSize' : {
+                    'MaxMessageCount' : self.orderer_settings['MaxMessageCount'],
+                    'AbsoluteMaxBytes' : self.orderer_settings['AbsoluteMaxBytes'],
+                    'PreferredMaxBytes' : self.orderer_settings['PreferredMaxBytes']
+                },
+                'MaxChannels' : 0,
+                'Organizations' : [orderer_org],
+            }
+            if self.orderer_type == 'kafka':
+                orderer_config['Kafka'] = {
+                    'Brokers' : ['kafka{}:9092'.format(i) for i in range(self.kafka_brokers)],
+                }
+            if self.orderer_type == 'etcdraft':
+                orderer_config['EtcdRaft'] = {
+                    'Consenters' : [
+                        {
+                            'Host' : orderer.name,
+                            'Port' : 7050,
+                            'ClientTLSCert' : '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/tls/server.crt'.format(secrets_dir, 'local', orderer.name),
+                            'ServerTLSCert' : '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/tls/server.crt'.format(secrets_dir, 'local', orderer.name),
+                        }
+                        for orderer in self.orderers
+                    ],
+                }
+            configtx = {}
+            configtx['Organizations'] = [orderer_org] + peer_orgs
+            configtx['Profiles'] = {
+                'OrdererSystemChannel': {
+                    'Orderer': orderer_config,
+                    'Consortiums' : {
+                        'SampleConsortium' : {
+                            'Organizations' : peer_orgs,
+                        }
+                    }
+                },
+                'TestChannel' : {
+                    'Consortium' : 'SampleConsortium',
+                    'Application' : {
+                        'Organizations' : peer_orgs,
+                    },
+                }
+            }
+            pyaml.dump(configtx, configtx_stream)
+
+        # absolute path to secrets directory
+        secrets_dir = os.path.join(self.work_dir, secrets_dir)
+        self.locate_secrets(secrets_dir)
+
+        self.name = 'behave_' + ''.join(random.choice('0123456789') for i in range(7))
+
+        # containers are started concurrently, as soon as what they depend on is in place
+        lifecycle = TaskGraph()
+        lifecycle.add('network', self.traced('create docker network', self.create_docker_network))
+        lifecycle.add('cli', self.traced('start cli', self.start_cli), after=['network'])
+        lifecycle.add('artifacts', self.traced('generate artifacts', lambda: self.generate_artifacts(crypto_config_yaml, configtx_yaml, secrets_dir)), after=['cli'])
+        self.add_orderers(lifecycle, after=['artifacts'])
+        self.add_peers(lifecycle, after=['artifacts'])
+        with self.docker.tracer.span('network up', 'network'):
+            lifecycle.run()
+
+    def orderer_specs(self):
+        # clients reach any orderer of a cluster as orderer, so the TLS
+        # certificates of the orderers are issued for that name too
+        if self.orderer_type == 'solo':
+            return [{'Hostname':'orderer'}]
+        return [{'Hostname':orderer.name, 'SANS':['orderer']} for orderer in self.orderers]
+
+    def add_orderers(self, lifecycle, after):
+        # the orderers, and the ZooKeeper and Kafka containers they depend on
+        orderer_after = list(after)
+        if self.orderer_type == 'kafka':
+            zookeepers = ['zookeeper{}'.format(i) for i in range(self.zookeepers)]
+            brokers = ['kafka{}'.format(i) for i in range(self.kafka_brokers)]
+            for i, name in enumerate(zookeepers):
+                lifecycle.add(name, self.traced('start ' + name, lambda i=i: self.start_zookeeper(i)), after=['network'])
+            for i, name in enumerate(brokers):
+                lifecycle.add(name, self.traced('start ' + name, lambda i=i: self.start_kafka(i)), after=zookeepers)
+            orderer_after += brokers
+        for orderer in self.orderers:
+            lifecycle.add(orderer.name, self.traced('start ' + orderer.name, lambda orderer=orderer: self.start_orderer(orderer)), after=orderer_after)
+
+    def add_peers(self, lifecycle, after):
+        # the peers, and the CouchDB containers holding their world state
+        for peer in self.peers:
+            peer_after = list(after)
+            if peer.couchdb:
+                lifecycle.add(peer.couchdb, self.traced('start ' + peer.couchdb, lambda peer=peer: self.start_couchdb(peer)), after=['network'])
+                peer_after.append(peer.couchdb)
+            lifecycle.add(peer.name, self.traced('start ' + peer.name, lambda peer=peer: self.start_peer(peer)), after=peer_after)
+
+    def locate_secrets(self, secrets_dir):
+        # paths of the generated crypto material
+        for orderer in self.orderers:
+            orderer.msp_dir = '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/msp'.format(secrets_dir, 'local', orderer.name)
+            orderer.tls_dir = '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/tls'.format(secrets_dir, 'local', orderer.name)
+        self.orderer_org_tlsca_cert_file = '{0}/ordererOrganizations/{1}/tlsca/tlsca.{1}-cert.pem'.format(secrets_dir, 'local')
+        for org in self.orgs:
+            org.admin_tls_dir = '{0}/peerOrganizations/{1}/users/{2}@{1}/tls'.format(secrets_dir, org.domain, 'Admin')
+            org.admin_msp_dir = '{0}/peerOrganizations/{1}/users/{2}@{1}/msp'.format(secrets_dir, org.domain, 'Admin')
+            for peer in org.peers:
+                peer.tls_dir = '{0}/peerOrganizations/{1}/peers/{2}.{1}/tls'.format(secrets_dir, org.domain, peer.hostname)
+                peer.msp_dir = '{0}/peerOrganizations/{1}/peers/{2}.{1}/msp'.format(secrets_dir, org.domain, peer.hostname)
+
+    def snapshot(self, snapshot_dir):
+        # save the ledgers of the orderer and peers (and the CouchDB
+        # databases, if any), the generated artifacts
+        # and the blocks and chaincodes known to the harness, for networks to
+        # be restored from; the processes writing them are stopped while they
+        # are archived, so that all of them are copied at the same point in
+        # time; Kafka keeps the orderers' state in its containers, so kafka
+        # networks cannot be snapshotted
+        assert self.orderer_type != 'kafka', 'Networks with a kafka ordering service cannot be snapshotted.'
+        with self.docker.tracer.span('network snapshot', 'network'):
+            production_dir = os.path.join(snapshot_dir, 'production')
+            os.makedirs(production_dir)
+            containers = [(name, container_id) for name, container_id in self.containers.items() if name != 'cli']
+            try:
+                run_concurrently([lambda container_id=container_id: self.signal_processes(container_id, 'STOP') for name, container_id in containers])
+                run_concurrently([
+                    lambda name=name, container_id=container_id: self.archive_data_dir(name, container_id, os.path.join(production_dir, name + '.tar'))
+                    for name, container_id in containers
+                ])
+            finally:
+                run_concurrently([lambda container_id=container_id: self.signal_processes(container_id, 'CONT') for name, container_id in containers])
+            shutil.copytree(self.work_dir, os.path.join(snapshot_dir, 'work'), ignore=shutil.ignore_patterns('logs', 'production'))
+            with open(os.path.join(snapshot_dir, 'network.json'), 'w') as network_file:
+                json.dump({
+                    'orderer_settings': self.orderer_settings,
+                    'orderer_count': len(self.orderers),
+                    'state_db': self.state_db,
+                    'org_count': len(self.orgs),
+                    'peers_per_org': len(self.orgs[0].peers),
+                    'installed_chaincodes': sorted(self.installed_chaincodes),
+                    'peer_network_id': self.peer_network_id,
+                    'blocks': dict((name, dict((channel_id, tracker.committed_blocks(channel_id)) for channel_id in list(tracker.blocks)))
+                        for name, tracker in self.block_trackers.items()),
+                }, network_file, indent=2, sort_keys=True)
+
+    def signal_processes(self, container_id, signal):
+        # stop or continue every process of a container; docker pause would
+        # freeze the tar in archive_data_dir() too, so the processes are sent
+        # SIGSTOP instead: the first one by the daemon, as it ignores signals
+        # from within its PID namespace, the others from an exec
+        if signal == 'STOP':
+            self.docker.kill(container_id, 'SIGSTOP')
+        self.docker.exec_run(container_id, ['sh', '-c', 'kill -s {} -1 2>/dev/null; true'.format(signal)])
+        if signal == 'CONT':
+            self.docker.kill(container_id, 'SIGCONT')
+
+    def archive_data_dir(self, name, container_id, archive_file):
+        # tar inside the container, as the docker archive API cannot read tmpfs mounts
+        data_dir = self.data_dir(name)
+        exit_code, output = self.docker.exec_run(container_id, ['sh', '-c', 'tar -C {} -cf - . 2>/dev/null'.format(data_dir)])
+        if exit_code:
+            raise subprocess.CalledProcessError(exit_code, ['tar', '-C', data_dir, '-cf', '-', '.'])
+        with open(archive_file, 'wb') as archive:
+            archive.write(output)
+
+    @staticmethod
+    def restore_settings(snapshot_dir):
+        # the Network() arguments of the network a snapshot was taken of
+        with open(os.path.join(snapshot_dir, 'network.json')) as network_file:
+            state = json.load(network_file)
+        return {
+            'orderer_settings': state['orderer_settings'],
+            'orderer_count': state.get('orderer_count', 1),
+            'state_db': state.get('state_db', 'leveldb'),
+            'org_count': state['org_count'],
+            'peers_per_org': state['peers_per_org'],
+        }
+
+    @staticmethod
+    def snapshot_chaincode_prefixes(snapshot_dir):
+        # name prefixes of the chaincode images the networks restored from a
+        # snapshot reuse
+        with open(os.path.join(snapshot_dir, 'network.json')) as network_file:
+            state = json.load(network_file)
+        return set('{}-{}-{}-{}'.format(state['peer_network_id'], *chaincode) for chaincode in state['installed_chaincodes'])
+
+    def restore(self, snapshot_dir):
+        # instead of up(): start fresh containers on copies of the ledgers and
+        # artifacts of a snapshot, see snapshot(); the network must be created
+        # with the settings of the snapshot, see restore_settings()
+        with open(os.path.join(snapshot_dir, 'network.json')) as network_file:
+            state = json.load(network_file)
+        self.restored = True
+        for name in os.listdir(os.path.join(snapshot_dir, 'work')):
+            link_tree(os.path.join(snapshot_dir, 'work', name), os.path.join(self.work_dir, name))
+        for name in os.listdir(os.path.join(snapshot_dir, 'production')):
+            with tarfile.open(os.path.join(snapshot_dir, 'production', name)) as archive:
+                archive.extractall(os.path.join(self.work_dir, 'production', os.path.splitext(name)[0]))
+        self.installed_chaincodes = set(tuple(chaincode) for chaincode in state['installed_chaincodes'])
+        self.track_chaincodes()
+        for name, blocks in state['blocks'].items():
+            self.block_trackers[name] = BlockTracker(dict((channel_id, [tuple(block) for block in channel_blocks])
+                for channel_id, channel_blocks in blocks.items()))
+        self.locate_secrets(os.path.join(self.work_dir, 'secrets'))
+
+        self.name = 'behave_' + ''.join(random.choice('0123456789') for i in range(7))
+
+        lifecycle = TaskGraph()
+        lifecycle.add('network', self.traced('create docker network', self.create_docker_network))
+        lifecycle.add('cli', self.traced('start cli', self.start_cli), after=['network'])
+        self.add_orderers(lifecycle, after=['network'])
+        self.add_peers(lifecycle, after=['network'])
+        with self.docker.tracer.span('network restore', 'network'):
+            lifecycle.run()
+
+    def traced(self, name, function):
+        def traced_function():
+            with self.docker.tracer.span(name, 'network'):
+                return function()
+        return traced_function
+
+    def create_docker_network(self):
+        self.id = self.docker.create_network(self.name, labels=self.labels)
+
+    def start_cli(self):
+        # start the long lived CLI container every tools command is executed in
+        self.cli_container_id = self.containers['cli'] = self.docker.run(
+            'hyperledger/fabric-tools:{}'.format(self.docker_tag['tools']),
+            ['tail', '-f', '/dev/null'],
+            network=self.name,
+            env=['FABRIC_CFG_PATH=/work'],
+            volumes=[
+                '/var/run/docker.sock:/var/run/docker.sock',
+                '{}:/work'.format(self.work_dir),
+                '{}:{}'.format(self.go_path, CLI_GOPATH),
+            ] + (['{}:{}'.format(self.test_go_path, CLI_TEST_GOPATH)] if self.test_go_path else []),
+            working_dir='/work',
+            labels=self.labels,
+        )
+
+    def generate_artifacts(self, crypto_config_yaml, configtx_yaml, secrets_dir):
+        # orderer system channel bootstrap block
+        orderer_genesis_block = 'genesis.block'
+
+        # crypto material and genesis block only depend on the generator input
+        # files and the tools image, so they can be reused from the cache
+        cache_key = None
+        if self.artifact_cache:
+            cache_key = self.artifact_cache.key(
+                open(os.path.join(self.work_dir, crypto_config_yaml)).read(),
+                open(os.path.join(self.work_dir, configtx_yaml)).read(),
+                self.docker_tag['tools'],
+            )
+        cached_artifacts = [os.path.basename(secrets_dir), orderer_genesis_block]
+
+        if not cache_key or not self.artifact_cache.fetch(cache_key, cached_artifacts, self.work_dir):
+            self.cli([
+                'cryptogen', 'generate',
+                '--config', crypto_config_yaml,
+                '--output', os.path.basename(secrets_dir),
+            ])
+
+            # create orderer system channel bootstrap block
+            self.cli([
+                'configtxgen',
+                '--profile', 'OrdererSystemChannel',
+                '--channelID', 'orderer.system.channel',
+                '--outputBlock', orderer_genesis_block,
+            ])
+
+            if cache_key:
+                self.artifact_cache.store(cache_key, cached_artifacts, self.work_dir)
+
+    def data_dir(self, name):
+        # where a container keeps its data: the ledgers, or the world state
+        # in a CouchDB container
+        if any(peer.couchdb == name for peer in self.peers):
+            return COUCHDB_DATA_DIR
+        return PRODUCTION_DIR
+
+    def production_tmpfs(self, name):
+        # restored ledgers are bind mounted from the work dir instead, which
+        # is in memory too with tmpfs storage
+        if self.storage != 'tmpfs' or self.restored:
+            return None
+        options = 'rw'
+        if self.tmpfs_size:
+            options += ',size={}'.format(self.tmpfs_size)
+        return {self.data_dir(name): options}
+
+    def production_volumes(self, name):
+        if not self.restored:
+            return []
+        return ['{}:{}'.format(os.path.join(self.work_dir, 'production', name), self.data_dir(name))]
+
+    def start_zookeeper(self, i):
+        name = 'zookeeper{}'.format(i)
+        self.containers[name] = self.docker.run(
+            'hyperledger/fabric-zookeeper:{}'.format(self.docker_tag['kafka']),
+            network=self.name,
+            aliases=[name],
+            env=[
+                'ZOO_MY_ID={}'.format(i + 1),
+                'ZOO_SERVERS={}'.format(' '.join('server.{}=zookeeper{}:2888:3888'.format(j + 1, j) for j in range(self.zookeepers))),
+            ],
+            labels=self.labels,
+        )
+        self.follow_logs(name, self.containers[name], ['binding to port'])
+        self.wait_for_log(name, 'binding to port', '{} to start'.format(name))
+
+    def start_kafka(self, i):
+        # topics of the channels are replicated to up to 3 brokers, and writes
+        # wait for all but one of them, the setup recommended for orderers
+        name = 'kafka{}'.format(i)
+        replicas = min(3, self.kafka_brokers)
+        self.containers[name] = self.docker.run(
+            'hyperledger/fabric-kafka:{}'.format(self.docker_tag['kafka']),
+            network=self.name,
+            aliases=[name],
+            env=[
+                'KAFKA_BROKER_ID={}'.format(i),
+                'KAFKA_ZOOKEEPER_CONNECT={}'.format(','.join('zookeeper{}:2181'.format(j) for j in range(self.zookeepers))),
+                'KAFKA_DEFAULT_REPLICATION_FACTOR={}'.format(replicas),
+                'KAFKA_MIN_INSYNC_REPLICAS={}'.format(max(1, replicas - 1)),
+                'KAFKA_UNCLEAN_LEADER_ELECTION_ENABLE=false',
+                'KAFKA_MESSAGE_MAX_BYTES=103809024',
+                'KAFKA_REPLICA_FETCH_MAX_BYTES=103809024',
+                'KAFKA_LOG_RETENTION_MS=-1',
+            ],
+            labels=self.labels,
+        )
+        self.follow_logs(name, self.containers[name], [r'started \(kafka\.server\.KafkaServer\)'])
+        self.wait_for_log(name, r'started \(kafka\.server\.KafkaServer\)', '{} to start'.format(name))
+
+    def start_orderer(self, orderer):
+        orderer_genesis_block = os.path.join(self.work_dir, 'genesis.block')
+        env = [
+            'ORDERER_GENERAL_LISTENADDRESS=0.0.0.0',
+            'ORDERER_GENERAL_GENESISMETHOD=file',
+            'ORDERER_GENERAL_GENESISFILE=/run/secrets/genesis.block',
+            'ORDERER_GENERAL_LOCALMSPDIR=/run/secrets/msp',
+            'ORDERER_GENERAL_LOCALMSPID=OrdererMSP',
+            'ORDERER_GENERAL_LOGLEVEL=debug',
+            'ORDERER_GENERAL_TLS_ENABLED=true',
+            'ORDERER_GENERAL_TLS_PRIVATEKEY=/run/secrets/tls/server.key',
+            'ORDERER_GENERAL_TLS_CERTIFICATE=/run/secrets/tls/server.crt',
+            'ORDERER_GENERAL_TLS_ROOTCAS=[/run/secrets/tls/ca.crt]',
+        ]
+        # the orderer is ready once it serves requests and, in a cluster, the
+        # system channel can order transactions
+        ready = ['Beginning to serve requests']
+        if self.orderer_type == 'kafka':
+            env += [
+                'ORDERER_KAFKA_RETRY_SHORTINTERVAL=1s',
+                'ORDERER_KAFKA_RETRY_SHORTTOTAL=30s',
+                'ORDERER_KAFKA_VERBOSE=true',
+            ]
+            ready.append(r'\[channel: orderer\.system\.channel\] Start phase completed successfully')
+        if self.orderer_type == 'etcdraft':
+            # orderers of a cluster talk to each other with their server TLS certificates
+            env += [
+                'ORDERER_GENERAL_CLUSTER_CLIENTCERTIFICATE=/run/secrets/tls/server.crt',
+                'ORDERER_GENERAL_CLUSTER_CLIENTPRIVATEKEY=/run/secrets/tls/server.key',
+                'ORDERER_GENERAL_CLUSTER_ROOTCAS=[/run/secrets/tls/ca.crt]',
+            ]
+            ready.append(r'Raft leader changed: \d+ -> [1-9]\d* channel=orderer\.system\.channel')
+        orderer.container_id = self.containers[orderer.name] = self.docker.run(
+            'hyperledger/fabric-orderer:{}'.format(self.docker_tag['orderer']),
+            tmpfs=self.production_tmpfs(orderer.name),
+            network=self.name,
+            # clients and peers use any orderer of a cluster, see orderer_specs()
+            aliases=sorted(set([orderer.name, 'orderer'])),
+            ports=[7050],
+            env=env,
+            volumes=[
+                '{}:/run/secrets/genesis.block'.format(orderer_genesis_block),
+                '{}:/run/secrets/msp'.format(orderer.msp_dir),
+                '{}:/run/secrets/tls'.format(orderer.tls_dir),
+            ] + self.production_volumes(orderer.name),
+            labels=self.labels,
+        )
+        self.orderer_trackers[orderer.name] = OrdererTracker()
+        self.follow_logs(orderer.name, orderer.container_id, ready, [self.orderer_trackers[orderer.name]])
+
+        # get exposed orderer port address
+        orderer.address = self.docker.port(orderer.container_id, 7050)
+        if self.docker.live:
+            wait_for_port(orderer.address, self.wait_timeout)
+        for pattern in ready:
+            self.wait_for_log(orderer.name, pattern, '{} to start'.format(orderer.name))
+
+    def start_couchdb(self, peer):
+        self.containers[peer.couchdb] = self.docker.run(
+            'hyperledger/fabric-couchdb:{}'.format(self.docker_tag['couchdb']),
+            tmpfs=self.production_tmpfs(peer.couchdb),
+            network=self.name,
+            aliases=[peer.couchdb],
+            volumes=self.production_volumes(peer.couchdb),
+            labels=self.labels,
+        )
+        self.follow_logs(peer.couchdb, self.containers[peer.couchdb], ['Apache CouchDB has started'])
+        self.wait_for_log(peer.couchdb, 'Apache CouchDB has started', '{} to start'.format(peer.couchdb))
+
+    def start_peer(self, peer):
+        env = [
+            'CORE_PEER_ADDRESSAUTODETECT=true',
+            'CORE_PEER_ID={}'.format(peer.name),
+            'CORE_PEER_NETWORKID={}'.format(self.peer_network_id),
+            # chaincode containers join the network, see chaincode_containers()
+            'CORE_VM_DOCKER_HOSTCONFIG_NETWORKMODE={}'.format(self.name),
+            'CORE_PEER_GOSSIP_EXTERNALENDPOINT={}:7051'.format(peer.name),
+            'CORE_CHAINCODE_STARTUPTIMEOUT=300s',
+            'CORE_VM_DOCKER_ATTACHSTDOUT=true',
+            'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
+            'CORE_PEER_LOCALMSPID={}'.format(peer.org.msp_id),
+            'CORE_PEER_TLS_ENABLED=true',
+            'CORE_PEER_TLS_CERT_FILE=/run/secrets/tls/server.crt',
+            'CORE_PEER_TLS_KEY_FILE=/run/secrets/tls/server.key',
+            'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
+        ]
+        # gossip with the first peer of the organization, and across
+        # organizations through the anchor peers
+        if peer is not peer.org.peers[0]:
+            env += ['CORE_PEER_GOSSIP_BOOTSTRAP={}:7051'.format(peer.org.peers[0].name)]
+        if peer.couchdb:
+            env += [
+                'CORE_LEDGER_STATE_STATEDATABASE=CouchDB',
+                'CORE_LEDGER_STATE_COUCHDBCONFIG_COUCHDBADDRESS={}:5984'.format(peer.couchdb),
+            ]
+        if self.java_runtime:
+            # older peers build Java chaincode from a Dockerfile instead
+            env += [
+                'CORE_CHAINCODE_JAVA_RUNTIME={}'.format(self.java_runtime),
+                'CORE_CHAINCODE_JAVA_DOCKERFILE=from {}'.format(self.java_runtime),
+            ]
+        peer.container_id = self.containers[peer.name] = self.docker.run(
+            'hyperledger/fabric-peer:{}'.format(self.docker_tag['peer']),
+            ['peer', 'node', 'start', '--logging-level', 'debug', '--orderer', 'orderer:7050'],
+            tmpfs=self.production_tmpfs(peer.name),
+            network=self.name,
+            aliases=[peer.name],
+            ports=[7051],
+            env=env,
+            volumes=[
+                '/var/run/docker.sock:/var/run/docker.sock',
+                '{0}:/run/secrets/tls'.format(peer.tls_dir),
+                '{0}:/run/secrets/msp'.format(peer.msp_dir),
+            ] + self.production_volumes(peer.name),
+            labels=self.labels,
+        )
+        # committed blocks are tracked as they show up in the peer log, on
+        # top of those restored from a snapshot
+        self.block_trackers.setdefault(peer.name, BlockTracker())
+        self.follow_logs(peer.name, peer.container_id, ['Started peer with ID'], [self.block_trackers[peer.name]])
+        peer.address = self.docker.port(peer.container_id, 7051)
+        if self.docker.live:
+            wait_for_port(peer.address, self.wait_timeout)
+        self.wait_for_log(peer.name, 'Started peer with ID', '{} to start'.format(peer.name))
+
+    def create_channel(self, channel_id):
+        with self.docker.tracer.span('create channel', 'network'):
+            self.create_and_join_channel(channel_id)
+
+    def create_and_join_channel(self, channel_id):
+        # create channel creation tx for test channel
+        channel_create_tx = channel_id + '.tx'
+        self.cli([
+            'configtxgen',
+            '-profile', 'TestChannel',
+            '-channelID', channel_id,
+            '-outputCreateChannelTx', channel_create_tx,
+        ])
+
+        # create channel, the channel genesis block is output to the working directory
+        self.peer_cli([
+            'peer', 'channel', 'create', '--logging-level', 'debug',
+            '--channelID', channel_id,
+            '--file', channel_create_tx,
+            '--tls', 'true',
+            '--orderer', 'orderer:7050',
+            '--cafile', self.cli_path(self.orderer_org_tlsca_cert_file),
+        ])
+
+        # join peers to channel
+        run_concurrently([
+            lambda peer=peer: self.peer_cli([
+                'peer', 'channel', 'join', '--logging-level', 'debug', '--blockpath', channel_id + '.block'
+            ], peer)
+            for peer in self.peers
+        ])
+
+        for org in self.orgs:
+            # generate anchor peers update for channel
+            anchorpeers_update_tx = '{}-{}-update.tx'.format(channel_id, org.name)
+            self.cli([
+                'configtxgen',
+                '--profile', 'TestChannel',
+                '--channelID', channel_id,
+                '--outputAnchorPeersUpdate', anchorpeers_update_tx,
+                '--asOrg', org.name
+            ])
+
+            # update channel anchor peers
+            self.peer_cli([
+                'peer', 'channel', 'update', '--logging-level', 'debug',
+                '--channelID', channel_id,
+                '--file', anchorpeers_update_tx,
+                '--tls', 'true',
+                '--orderer', 'orderer:7050',
+                '--cafile', self.cli_path(self.orderer_org_tlsca_cert_file),
+            ], org.peers[0])
+
+    def cli_path(self, path):
+        # path of a file below work_dir inside the CLI container
+        return '/work/' + os.path.relpath(path, self.work_dir)
+
+    def cli(self, args, env=(), echo=True):
+        # execute a command in the CLI container
+        exit_code, output = self.docker.exec_run(self.cli_container_id, args, env)
+        # echo the output, always echoing it on failure unless echo is None
+        if echo or (exit_code and echo is not None):
+            print(output)
+        if exit_code:
+            raise subprocess.CalledProcessError(exit_code, args, output)
+        return output
+
+    def peer_cli(self, args, peer=None, echo=True, go_path=CLI_GOPATH):
+        # execute a peer command against a peer (default: the first peer) as
+        # the admin of the peer's organization
+        peer = peer or self.peer
+        return self.cli(args, echo=echo, env=[
+            'CORE_PEER_ADDRESS={}:7051'.format(peer.name),
+            'CORE_PEER_MSPCONFIGPATH={}'.format(self.cli_path(peer.org.admin_msp_dir)),
+            'CORE_PEER_LOCALMSPID={}'.format(peer.org.msp_id),
+            'CORE_PEER_TLS_ENABLED=true',
+            'CORE_PEER_TLS_ROOTCERT_FILE={}'.format(self.cli_path(os.path.join(peer.tls_dir, 'ca.crt'))),
+            'GOPATH={}'.format(go_path),
+        ])
+
+    def install_chaincode(self, name, path, version, lang, package_key=None, go_path=CLI_GOPATH):
+        # install on every peer at once, so that any of them can endorse; with
+        # a package_key, the chaincode is installed from a deployment package
+        # kept in the artifact cache
+        chaincode = ['--name', name, '--path', path, '--version', version, '--lang', lang]
+        if package_key and self.artifact_cache:
+            install = [self.cli_path(self.chaincode_package(package_key, chaincode, go_path))]
+        else:
+            install = chaincode
+        peers = [peer for peer in self.peers if (peer.name, name, version) not in self.installed_chaincodes]
+        run_concurrently([
+            lambda peer=peer: self.peer_cli(['peer', 'chaincode', 'install', '--logging-level', 'debug', '--orderer', 'orderer:7050'] + install, peer, go_path=go_path)
+            for peer in peers
+        ])
+        self.installed_chaincodes.update((peer.name, name, version) for peer in peers)
+        self.track_chaincodes()
+
+    def chaincode_package(self, package_key, chaincode, go_path=CLI_GOPATH):
+        # path of the deployment package of a chaincode, packaged once and
+        # then reused from the artifact cache
+        package_dir = os.path.join(self.work_dir, 'chaincodes', package_key)
+        package_file = os.path.join(package_dir, 'chaincode.cds')
+        if os.path.exists(package_file):
+            return package_file
+        os.makedirs(package_dir)
+        if not self.artifact_cache.fetch(package_key, ['chaincode.cds'], package_dir):
+            self.peer_cli(['peer', 'chaincode', 'package', '--logging-level', 'debug'] + chaincode + [self.cli_path(package_file)], go_path=go_path)
+            self.artifact_cache.store(package_key, ['chaincode.cds'], package_dir)
+        return package_file
+
+    def chaincode_images(self, name, version, peer=None):
+        # tags of the images a peer (default: the first peer) built for a chaincode
+        prefix = '{}-{}-{}-{}'.format(self.peer_network_id, (peer or self.peer).name, name, version)
+        return [tag for image in self.docker.images() for tag in image.get('RepoTags') or [] if tag.startswith(prefix)]
+
+    def chaincode_prefixes(self):
+        # name prefixes of the containers and images the peers create for the
+        # installed chaincodes
+        return ['{}-{}-{}-{}'.format(self.peer_network_id, *chaincode) for chaincode in sorted(self.installed_chaincodes)]
+
+    def track_chaincodes(self):
+        # peers may start chaincode containers from now on, see harness.reaper
+        if self.resource_tracker:
+            self.resource_tracker.track(self.chaincode_prefixes())
+
+    def resource_containers(self):
+        # orderer, peer and chaincode containers by name, see harness.resources
+        containers = collections.OrderedDict((name, container_id) for name, container_id in self.containers.items() if name != 'cli')
+        if self.installed_chaincodes:
+            prefixes = tuple('/' + prefix for prefix in self.chaincode_prefixes())
+            for container in self.docker.containers():
+                names = [name for name in container.get('Names') or [] if name.startswith(prefixes)]
+                if names:
+                    containers[names[0][1:]] = container['Id']
+        return containers
+
+    def invoke_chaincode(self, channel_id, name, ctor, logging_level='debug', echo=True):
+        return self.peer_cli([
+            'peer', 'chaincode', 'invoke',
+            '--logging-level', logging_level,
+            '--channelID', channel_id,
+            '--name', name,
+            '--ctor', ctor,
+            '--tls', 'true',
+            '--orderer', 'orderer:7050',
+            '--cafile', self.cli_path(self.orderer_org_tlsca_cert_file),
+        ], echo=echo)
+
+    def query_chaincode(self, channel_id, name, ctor, logging_level='debug', echo=True):
+        return self.peer_cli([
+            'peer', 'chaincode', 'query',
+            '--logging-level', logging_level,
+            '--channelID', channel_id,
+            '--name', name,
+            '--ctor', ctor,
+            '--tls', 'true',
+            '--orderer', 'orderer:7050',
+            '--cafile', self.cli_path(self.orderer_org_tlsca_cert_file),
+        ], echo=echo)
+
+    def follow_logs(self, name, container_id, patterns=(), listeners=()):
+        stream = LogStream(self.docker, container_id, os.path.join(self.log_dir, name + '.log'), self.log_compress, self.log_max_bytes)
+        for pattern in patterns:
+            stream.watch(pattern)
+        for listener in listeners:
+            stream.add_listener(listener)
+        self.log_streams[name] = stream
+        stream.start()
+
+    def capture_logs(self, log_dir):
+        # continue every container log in a new file in log_dir, e.g. to
+        # keep the logs of the scenarios sharing a network apart
+        self.log_dir = log_dir
+        for name, stream in self.log_streams.items():
+            stream.rotate(os.path.join(log_dir, name + '.log'))
+
+    def wait_for_log(self, name, pattern, description):
+        # pattern must have been watched when the log stream was started
+        wait_until(lambda: self.log_streams[name].seen(pattern), description, self.wait_timeout)
+
+    def committed_blocks(self, channel_id, peer=None):
+        # (block number, transaction count) of every block a peer (default: the first peer) committed on the channel
+        return self.block_trackers[(peer or self.peer).name].committed_blocks(channel_id)
+
+    def block_height(self, channel_id, peer=None):
+        # number of blocks a peer has committed on the channel
+        blocks = [block for block, transactions in self.committed_blocks(channel_id, peer)]
+        return max(blocks) + 1 if blocks else 0
+
+    def committed_transactions(self, channel_id):
+        return sum(transactions for block, transactions in self.committed_blocks(channel_id))
+
+    def wait_for_committed_transactions(self, channel_id, count):
+        wait_until(lambda: self.committed_transactions(channel_id) >= count,
+            '{} transactions to be committed on channel {}'.format(count, channel_id), self.wait_timeout)
+
+    def wait_for_block_height(self, channel_id, height, peer=None, max_interval=2.0):
+        wait_until(lambda: self.block_height(channel_id, peer) >= height,
+            'block {} to be committed on channel {}'.format(height - 1, channel_id), self.wait_timeout,
+            max_interval=max_interval)
+
+    def storage_usage(self):
+        # bytes used by the ledgers of the orderer and every peer, and by
+        # the CouchDB databases
+        usage = {}
+        for name, container_id in self.containers.items():
+            if name != 'cli':
+                exit_code, output = self.docker.exec_run(container_id, ['du', '-sb', self.data_dir(name)])
+                usage[name] = int(output.split()[0]) if exit_code == 0 else 0
+        return usage
+
+    def wait_for_quiet_logs(self, timeout):
+        # give in flight blocks a chance to be committed, but never wait longer than timeout
+        stream = self.log_streams.get(self.peer.name)
+        if not stream:
+            return
+        try:
+            wait_for_quiet(lambda: stream.bytes_received, 0.5, timeout)
+        except WaitTimeout:
+            pass
+
+    def dump_logs(self, log_file_prefix):
+        # copy the orderer and peer logs captured so far
+        for name, stream in self.log_streams.items():
+            stream.copy(log_file_prefix + '_' + os.path.basename(stream.path))
+
+    def kill_orderer(self, orderer):
+        # stop an orderer of a cluster the hard way, e.g. to measure failover;
+        # docker drops it from the orderer alias
+        self.docker.kill(orderer.container_id)
+        self.killed_containers.append(self.containers.pop(orderer.name))
+        self.orderers = [other for other in self.orderers if other is not orderer]
+
+    def raft_leader(self, channel_id):
+        # the orderer the orderers last saw elected as Raft leader of the
+        # channel, if any; Raft node IDs follow the order of the consenters
+        leaders = [self.orderer_trackers[orderer.name].leader(channel_id) for orderer in self.orderers]
+        leaders = sorted(leader for leader in leaders if leader)
+        if not leaders:
+            return None
+        name = 'orderer{}'.format(leaders[-1][1] - 1)
+        return ([orderer for orderer in self.orderers if orderer.name == name] or [None])[0]
+
+    def ordered_blocks(self, channel_id):
+        # when every block of the channel was first written by an orderer, by block number
+        written = {}
+        for tracker in self.orderer_trackers.values():
+            for block, timestamp in tracker.written_blocks(channel_id):
+                written[block] = min(timestamp, written.get(block, timestamp))
+        return written
+
+    def down(self):
+        with self.docker.tracer.span('network down', 'network'):
+            self.remove_containers()
+
+    def chaincode_containers(self):
+        # IDs of the containers the peers started on the network, that is of
+        # the chaincodes
+        if not self.id:
+            return []
+        started = set(self.containers.values()) | set(self.killed_containers)
+        return [container_id for container_id in self.docker.inspect_network(self.id).get('Containers') or {} if container_id not in started]
+
+    def remove_containers(self):
+        # destroy containers, those of the chaincodes included, all at once;
+        # every removal is attempted before the first error (if any) is raised
+        try:
+            run_concurrently([
+                lambda container_id=container_id: self.docker.remove_container(container_id)
+                for container_id in list(self.containers.values()) + self.killed_containers + self.chaincode_containers()
+            ])
+        finally:
+            for stream in self.log_streams.values():
+                stream.stop()
+            # destroy docker network
+            if self.id:
+                self.docker.remove_network(self.id)
@@ -0,0 +1,165 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Run the behave scenarios sharded across several behave processes.
+#
+# Every scenario (and every Examples row of a scenario outline) already runs
+# on its own docker network and channel, and ports are published without a
+# fixed host port so docker hands out a free one, so the shards only need
+# their own temp root and report locations.
+#
+# usage: python -m harness.parallel [--workers N] [--output DIR] [behave options] [[--] feature paths]
+
+import argparse
+import collections
+import glob
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from itertools import islice
+
+from behave.parser import parse_file
+
+try:
+    from behave.configuration import OPTIONS as BEHAVE_OPTIONS
+except ImportError:
+    # behave < 1.2.7
+    from behave.configuration import options as BEHAVE_OPTIONS
+
+def scenario_locations(paths):
+    feature_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            feature_files.extend(sorted(glob.glob(os.path.join(path, '*.feature'))))
+        else:
+            feature_files.append(path)
+    locations = []
+    for feature_file in feature_files:
+        feature = parse_file(feature_file)
+        for scenario in feature.walk_scenarios():
+            locations.append('{}:{}'.format(scenario.location.filename, scenario.location.line))
+    return locations
+
+def split_feature_paths(behave_args):
+    # the positional behave arguments are feature paths; the values of the
+    # behave options that take one, e.g. --junit-directory DIR, are not
+    value_options = set(option for option_strings, settings in BEHAVE_OPTIONS if settings.get('action') in (None, 'store', 'append')
+        for option in option_strings)
+    options = []
+    paths = []
+    args = iter(behave_args)
+    for arg in args:
+        if arg == '--':
+            paths.extend(args)
+        elif arg.startswith('-'):
+            options.append(arg)
+            if arg in value_options:
+                options.extend(list(islice(args, 1)))
+        else:
+            paths.append(arg)
+    return options, paths
+
+def remove_reports(output):
+    # what an earlier run left in output, and nothing else
+    for path in glob.glob(os.path.join(output, 'worker-*')) + [os.path.join(output, 'junit')]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+    if os.path.exists(os.path.join(output, 'pretty.txt')):
+        os.remove(os.path.join(output, 'pretty.txt'))
+
+def shard(locations, workers):
+    return [shard for shard in (locations[i::workers] for i in range(workers)) if shard]
+
+def start_worker(worker_dir, locations, behave_args, run_key):
+    os.makedirs(os.path.join(worker_dir, 'junit'))
+    command = [
+        sys.executable, '-m', 'behave',
+        '--define', 'temp-root={}'.format(os.path.join(worker_dir, 'tmp')),
+        # the workers record their durations as a single run, see harness.history
+        '--define', 'history-run={}'.format(run_key),
+        '--junit', '--junit-directory', os.path.join(worker_dir, 'junit'),
+        '--format', 'pretty', '--outfile', os.path.join(worker_dir, 'pretty.txt'),
+    ] + behave_args + locations
+    stdout = open(os.path.join(worker_dir, 'behave.out'), 'w')
+    return subprocess.Popen(command, stdout=stdout, stderr=subprocess.STDOUT)
+
+def merge_junit(worker_dirs, junit_dir):
+    # behave writes one TESTS-<feature>.xml file per feature, in which the
+    # scenarios of other shards show up as skipped; shards of the same feature
+    # are merged back into a single testsuite keeping the executed testcases
+    suites = {}
+    testcases = {}
+    for worker_dir in worker_dirs:
+        for report in sorted(glob.glob(os.path.join(worker_dir, 'junit', '*.xml'))):
+            suite = ElementTree.parse(report).getroot()
+            name = os.path.basename(report)
+            suites.setdefault(name, suite)
+            cases = testcases.setdefault(name, collections.OrderedDict())
+            for testcase in suite.findall('testcase'):
+                key = (testcase.get('classname'), testcase.get('name'))
+                if key not in cases or cases[key].get('status') == 'skipped':
+                    cases[key] = testcase
+    os.makedirs(junit_dir)
+    for name, suite in suites.items():
+        for testcase in suite.findall('testcase'):
+            suite.remove(testcase)
+        statuses = []
+        for testcase in testcases[name].values():
+            suite.append(testcase)
+            statuses.append(testcase.get('status'))
+        suite.set('tests', str(len(statuses)))
+        suite.set('failures', str(statuses.count('failed')))
+        suite.set('errors', str(statuses.count('error')))
+        suite.set('skipped', str(statuses.count('skipped')))
+        suite.set('time', str(sum(float(testcase.get('time', '0')) for testcase in testcases[name].values())))
+        ElementTree.ElementTree(suite).write(os.path.join(junit_dir, name), encoding='utf-8')
+
+def merge_pretty(worker_dirs, pretty_file):
+    with open(pretty_file, 'w') as merged:
+        for worker_dir in worker_dirs:
+            worker_pretty_file = os.path.join(worker_dir, 'pretty.txt')
+            if os.path.exists(worker_pretty_file):
+                with open(worker_pretty_file) as pretty:
+                    shutil.copyfileobj(pretty, merged)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run behave scenarios in parallel worker processes.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='number of behave processes (default: cpu count)')
+    parser.add_argument('--output', default='reports', help='directory for merged reports (default: reports)')
+    args, behave_args = parser.parse_known_args(argv)
+
+    behave_args, paths = split_feature_paths(behave_args)
+
+    remove_reports(args.output)
+    shards = shard(scenario_locations(paths or ['features']), max(args.workers, 1))
+    worker_dirs = [os.path.abspath(os.path.join(args.output, 'worker-{}'.format(i))) for i in range(len(shards))]
+    run_key = 'parallel-{:.0f}-{}'.format(time.time(), os.getpid())
+    workers = [start_worker(worker_dir, locations, behave_args, run_key) for worker_dir, locations in zip(worker_dirs, shards)]
+    exit_codes = [worker.wait() for worker in workers]
+
+    merge_junit(worker_dirs, os.path.join(args.output, 'junit'))
+    merge_pretty(worker_dirs, os.path.join(args.output, 'pretty.txt'))
+    with open(os.path.join(args.output, 'pretty.txt')) as pretty:
+        sys.stdout.write(pretty.read())
+    for worker_dir, exit_code in zip(worker_dirs, exit_codes):
+        if exit_code:
+            print('worker failed with exit code {}, see {}'.format(exit_code, os.path.join(worker_dir, 'behave.out')))
+    return max(exit_codes) if exit_codes else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Removal of the docker resources runs leave behind: the containers and
+# networks of networks that were not decomposed, e.g. with do-not-decompose
+# or when a run was aborted, with the chaincode containers on them, and the
+# chaincode images the peers create through the docker socket.
+#
+# The containers and networks of a run (behave process) are labelled with
+# it. The peers name chaincode containers and images, so they cannot be
+# labelled; their name prefixes are kept in a manifest file of the run
+# instead. A run is over when its process is gone, which can only be told on
+# the host it ran on; runs on other hosts sharing the docker daemon are over
+# once older than a given age.
+#
+# usage: python -m harness.reaper [--dir DIR] [--run RUN]... [--older-than HOURS] [--dry-run]
+
+import argparse
+import collections
+import errno
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from harness.docker_api import DockerClient, DockerError
+
+LABEL_PREFIX = 'org.hyperledger.fabric.behave.'
+RUN_LABEL = LABEL_PREFIX + 'run'
+HOST_LABEL = LABEL_PREFIX + 'host'
+PID_LABEL = LABEL_PREFIX + 'pid'
+STARTED_LABEL = LABEL_PREFIX + 'started'
+
+# where the manifests of all runs on a host are kept by default
+DEFAULT_MANIFEST_DIR = os.path.join(tempfile.gettempdir(), 'behave-fabric-runs')
+
+class ResourceTracker(object):
+    # The labels of the containers and networks of this run, see Network, and
+    # its manifest of chaincode name prefixes. With keep_images, the chaincode
+    # images are meant to be reused by later runs, see reuse-chaincode-images.
+
+    def __init__(self, manifest_dir, keep_images=False):
+        host = socket.gethostname()
+        started = int(time.time())
+        self.id = '{}-{}-{}'.format(host, os.getpid(), started)
+        self.labels = {
+            RUN_LABEL: self.id,
+            HOST_LABEL: host,
+            PID_LABEL: str(os.getpid()),
+            STARTED_LABEL: str(started),
+        }
+        self.keep_images = keep_images
+        self.chaincodes = set()
+        self.lock = threading.Lock()
+        try:
+            os.makedirs(manifest_dir)
+        except OSError as e:
+            # parallel workers create it at the same time
+            if e.errno != errno.EEXIST:
+                raise
+        self.path = os.path.join(manifest_dir, self.id + '.json')
+        self.save()
+
+    def track(self, prefixes):
+        # name prefixes of chaincode containers and images, e.g. behave1234567-peer-mycc-1.0
+        with self.lock:
+            if set(prefixes) <= self.chaincodes:
+                return
+            self.chaincodes.update(prefixes)
+            self.save()
+
+    def save(self):
+        # written whole, the reaper of another run may read it at any time
+        with open(self.path + '.tmp', 'w') as manifest:
+            json.dump({'labels': self.labels, 'chaincodes': sorted(self.chaincodes), 'keep_images': self.keep_images}, manifest)
+        os.rename(self.path + '.tmp', self.path)
+
+    def close(self):
+        # nothing of the run is left to reap
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class Reaper(object):
+    # Removes resources, up to workers at once, and keeps count of what it
+    # reclaimed in total.
+
+    def __init__(self, docker, manifest_dir, workers=8):
+        self.docker = docker
+        self.manifest_dir = manifest_dir
+        self.workers = workers
+        self.reclaimed = new_report()
+
+    def manifests(self):
+        # manifests by run
+        manifests = {}
+        if not os.path.isdir(self.manifest_dir):
+            return manifests
+        for name in os.listdir(self.manifest_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.manifest_dir, name)) as manifest_file:
+                    manifest = json.load(manifest_file)
+            except (EnvironmentError, ValueError):
+                continue
+            manifests[manifest['labels'][RUN_LABEL]] = manifest
+        return manifests
+
+    def reap(self, runs=None, older_than=None, dry_run=False):
+        # remove the resources of the given runs or else of all runs that are
+        # over, those started more than older_than seconds ago included; with
+        # dry_run, only report what would be removed
+        manifests = self.manifests()
+        containers = self.docker.containers(all=True, filters={'label': [RUN_LABEL]})
+        networks = self.docker.networks(filters={'label': [RUN_LABEL]})
+        labels = {}
+        for resource in containers + networks:
+            labels.setdefault(resource['Labels'][RUN_LABEL], resource['Labels'])
+        for run, manifest in manifests.items():
+            labels.setdefault(run, manifest['labels'])
+        if runs is None:
+            reaped = set(run for run, run_labels in labels.items() if finished(run_labels, older_than))
+        else:
+            reaped = set(runs) & set(labels)
+        report = new_report()
+        report['runs'] = len(reaped)
+        if not reaped:
+            return report
+        # chaincode names are not unique to a run, e.g. with reused chaincode
+        # images; leave those of live runs alone
+        live = live_prefixes(manifests, reaped)
+        container_prefixes = set()
+        image_prefixes = set()
+        for run in reaped & set(manifests):
+            prefixes = set(manifests[run]['chaincodes']) - live
+            container_prefixes.update(prefixes)
+            if not manifests[run]['keep_images']:
+                image_prefixes.update(prefixes)
+        network_ids = [network['Id'] for network in networks if network['Labels'][RUN_LABEL] in reaped]
+        container_ids = [container['Id'] for container in containers if container['Labels'][RUN_LABEL] in reaped]
+        # the chaincode containers still on the networks
+        for network_id in network_ids:
+            try:
+                attached = self.docker.inspect_network(network_id).get('Containers') or {}
+            except DockerError:
+                continue
+            container_ids += [container_id for container_id in attached if container_id not in container_ids]
+        self.remove(report, container_ids, network_ids, container_prefixes, image_prefixes, dry_run)
+        if not dry_run and not report['errors']:
+            for run in reaped & set(manifests):
+                try:
+                    os.remove(os.path.join(self.manifest_dir, run + '.json'))
+                except OSError:
+                    # reaped by another worker as well
+                    pass
+        return report
+
+    def remove_chaincode_images(self, prefixes, run):
+        # the chaincode images of a network of run that is down, unless a
+        # live run of another process has images of the same names
+        report = new_report()
+        manifests = self.manifests()
+        other_runs = set(other for other, manifest in manifests.items() if other == run or finished(manifest['labels']))
+        self.remove(report, [], [], set(), set(prefixes) - live_prefixes(manifests, other_runs), False)
+        return report
+
+    def remove(self, report, container_ids, network_ids, container_prefixes, image_prefixes, dry_run):
+        # containers first, they hold on to the networks and images
+        if container_prefixes:
+            prefixes = tuple('/' + prefix for prefix in container_prefixes)
+            container_ids = container_ids + [container['Id'] for container in self.docker.containers(all=True)
+                if container['Id'] not in container_ids and any(name.startswith(prefixes) for name in container.get('Names') or [])]
+        images = []
+        if image_prefixes:
+            prefixes = tuple(image_prefixes)
+            images = [image for image in self.docker.images() if any(tag.startswith(prefixes) for tag in image.get('RepoTags') or [])]
+        if dry_run:
+            report['containers'] = len(container_ids)
+            report['networks'] = len(network_ids)
+            report['images'] = len(images)
+            report['image_bytes'] = sum(image.get('Size', 0) for image in images)
+            return
+        removed, errors = self.remove_all(self.docker.remove_container, container_ids)
+        report['containers'] += len(removed)
+        report['errors'] += errors
+        removed, errors = self.remove_all(self.docker.remove_network, network_ids)
+        report['networks'] += len(removed)
+        report['errors'] += errors
+        sizes = dict((image['Id'], image.get('Size', 0)) for image in images)
+        removed, errors = self.remove_all(self.docker.remove_image, list(sizes))
+        report['images'] += len(removed)
+        report['image_bytes'] += sum(sizes[image_id] for image_id in removed)
+        report['errors'] += errors
+        for key in report:
+            if key != 'runs':
+                self.reclaimed[key] += report[key]
+
+    def remove_all(self, remove, resource_ids):
+        # the resources remove() removed, and the errors of those it could
+        # not; resources already gone count as neither
+        if not resource_ids:
+            return [], []
+        def attempt(resource_id):
+            try:
+                remove(resource_id)
+                return None
+            except DockerError as e:
+                return e
+        pool = ThreadPool(min(self.workers, len(resource_ids)))
+        try:
+            results = pool.map(attempt, resource_ids)
+        finally:
+            pool.close()
+            pool.join()
+        removed = [resource_id for resource_id, error in zip(resource_ids, results) if error is None]
+        errors = ['{}: {}'.format(resource_id[:12], error) for resource_id, error in zip(resource_ids, results)
+            if error is not None and error.status != 404]
+        return removed, errors
+
+def live_prefixes(manifests, reaped):
+    # chaincode name prefixes of the runs not being reaped
+    return set(prefix for run, manifest in manifests.items() if run not in reaped for prefix in manifest['chaincodes'])
+
+def new_report():
+    return collections.OrderedDict([
+        ('runs', 0),
+        ('containers', 0),
+        ('networks', 0),
+        ('images', 0),
+        ('image_bytes', 0),
+        ('errors', []),
+    ])
+
+def finished(labels, older_than=None):
+    # whether the run with these labels is over
+    if older_than is not None and time.time() - int(labels[STARTED_LABEL]) > older_than:
+        return True
+    if labels[HOST_LABEL] != socket.gethostname():
+        return False
+    try:
+        os.kill(int(labels[PID_LABEL]), 0)
+    except OSError as e:
+        # EPERM: the process is alive, but not ours
+        return e.errno == errno.ESRCH
+    return False
+
+def format_report(report):
+    text = '{} containers, {} networks, {} images ({:.1f} MB)'.format(report['containers'], report['networks'],
+        report['images'], report['image_bytes'] / (1024.0 * 1024))
+    if report['errors']:
+        text += ', {} errors: {}'.format(len(report['errors']), '; '.join(report['errors'][:5]))
+    return text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remove the docker resources of behave runs that are over.')
+    parser.add_argument('--dir', default=DEFAULT_MANIFEST_DIR, help='manifests of the runs, see the reaper-dir userdata option (default: {})'.format(DEFAULT_MANIFEST_DIR))
+    parser.add_argument('--docker-socket', help='docker daemon socket (default: DOCKER_HOST or /var/run/docker.sock)')
+    parser.add_argument('--run', action='append', help='reap this run, whether it is over or not (repeatable)')
+    parser.add_argument('--older-than', type=float, help='also reap runs started more than HOURS ago, e.g. on other hosts')
+    parser.add_argument('--workers', type=int, default=8, help='resources removed at once (default: 8)')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    args = parser.parse_args(argv)
+
+    reaper = Reaper(DockerClient(args.docker_socket), os.path.abspath(args.dir), args.workers)
+    report = reaper.reap(args.run, args.older_than * 3600 if args.older_than is not None else None, args.dry_run)
+    print('{} {} runs: {}'.format('would reap' if args.dry_run else 'reaped', report['runs'], format_report(report)))
+    return 1 if report['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
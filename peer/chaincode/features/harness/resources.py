@@ -0,0 +1,146 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from harness.docker_api import DockerError
+
+# columns of the time series, after the seconds since sampling started and
+# the container name
+METRICS = ('cpu_percent', 'rss_bytes', 'block_read_bytes', 'block_write_bytes', 'net_rx_bytes', 'net_tx_bytes')
+
+# cumulative counters, summarized by how much they grew
+COUNTERS = ('block_read_bytes', 'block_write_bytes', 'net_rx_bytes', 'net_tx_bytes')
+
+class ResourceSampler(object):
+    # Polls the docker stats of the containers returned by containers()
+    # (names to IDs, looked up again on every poll, so containers started
+    # later are sampled too) every interval seconds in a background thread.
+    # Samples are kept as tuples, in the order of METRICS.
+
+    def __init__(self, docker, containers, interval=2.0):
+        self.docker = docker
+        self.containers = containers
+        self.interval = interval
+        self.samples = []
+        # previous CPU usage by container, for when docker reports no precpu_stats
+        self.cpu_usage = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pool = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.pool = ThreadPool(8)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            start = time.time()
+            try:
+                containers = list(self.containers().items())
+            except Exception:
+                # e.g. the network is being torn down
+                containers = []
+            # polls of a stats snapshot take about a second each, all
+            # containers are polled at once
+            for sample in self.pool.map(lambda container: self.sample(*container), containers):
+                if sample:
+                    self.samples.append(sample)
+            self.stopped.wait(max(0, self.interval - (time.time() - start)))
+
+    def sample(self, name, container_id):
+        try:
+            stats = self.docker.stats(container_id)
+        except (DockerError, EnvironmentError):
+            # the container is gone
+            return None
+        cpu = stats.get('cpu_stats') or {}
+        total_usage = (cpu.get('cpu_usage') or {}).get('total_usage', 0)
+        system_usage = cpu.get('system_cpu_usage', 0)
+        precpu = stats.get('precpu_stats') or {}
+        previous = ((precpu.get('cpu_usage') or {}).get('total_usage', 0), precpu.get('system_cpu_usage', 0))
+        if not previous[1]:
+            previous = self.cpu_usage.get(container_id, (total_usage, system_usage))
+        self.cpu_usage[container_id] = (total_usage, system_usage)
+        cpus = len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+        cpu_percent = 0.0
+        if system_usage > previous[1]:
+            cpu_percent = float(total_usage - previous[0]) / (system_usage - previous[1]) * cpus * 100
+        blkio = (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []
+        networks = (stats.get('networks') or {}).values()
+        return (
+            round(time.time() - self.start_time, 2),
+            name,
+            round(cpu_percent, 1),
+            rss_bytes(stats),
+            sum(entry['value'] for entry in blkio if entry.get('op') == 'Read'),
+            sum(entry['value'] for entry in blkio if entry.get('op') == 'Write'),
+            sum(network.get('rx_bytes', 0) for network in networks),
+            sum(network.get('tx_bytes', 0) for network in networks),
+        )
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+    def summary(self):
+        # peak and mean CPU and memory, and the growth of the counters, by container
+        by_container = collections.OrderedDict()
+        for sample in self.samples:
+            by_container.setdefault(sample[1], []).append(sample)
+        summary = collections.OrderedDict()
+        for name, samples in by_container.items():
+            values = dict((metric, [sample[2 + i] for sample in samples]) for i, metric in enumerate(METRICS))
+            summary[name] = collections.OrderedDict([('samples', len(samples))])
+            for metric in ('cpu_percent', 'rss_bytes'):
+                summary[name][metric] = {
+                    'peak': max(values[metric]),
+                    'mean': round(float(sum(values[metric])) / len(samples), 1),
+                }
+            for metric in COUNTERS:
+                summary[name][metric] = values[metric][-1] - values[metric][0]
+        return summary
+
+    def write(self, series_path, summary_path):
+        # the time series as CSV, the summary as JSON
+        with open(series_path, 'w') as series:
+            series.write(','.join(('seconds', 'container') + METRICS) + '\n')
+            for sample in self.samples:
+                series.write(','.join(str(value) for value in sample) + '\n')
+        with open(summary_path, 'w') as summary:
+            json.dump(self.summary(), summary, indent=2)
+
+def rss_bytes(stats):
+    # resident memory of a container, from a docker stats snapshot
+    memory = stats.get('memory_stats') or {}
+    return (memory.get('stats') or {}).get('rss', memory.get('usage', 0))
+
+def format_summary(summary):
+    return '; '.join('{}: cpu peak {}% mean {}%, rss peak {:.1f} MB, block io {:.1f}/{:.1f} MB, net {:.1f}/{:.1f} MB'.format(
+        name, values['cpu_percent']['peak'], values['cpu_percent']['mean'], values['rss_bytes']['peak'] / (1024.0 * 1024),
+        values['block_read_bytes'] / (1024.0 * 1024), values['block_write_bytes'] / (1024.0 * 1024),
+        values['net_rx_bytes'] / (1024.0 * 1024), values['net_tx_bytes'] / (1024.0 * 1024))
+        for name, values in summary.items())
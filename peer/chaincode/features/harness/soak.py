@@ -0,0 +1,293 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Soak runs: load at a fixed arrival rate for minutes or hours, while the
+# memory of the containers and the size of their ledgers are sampled, and a
+# check of the results for memory growth and latency drift.
+#
+# Runs may last hours, so transactions and samples are appended to CSV files
+# as they come in; only a summary per window of transactions and a few
+# numbers per sample are kept in memory.
+
+import collections
+import os
+import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from harness.benchmark import percentile
+from harness.docker_api import DockerError
+from harness.resources import rss_bytes
+
+# Kendall's tau a series must reach to count as growing, with 1 for a series
+# where every value is larger than all before it
+MIN_TAU = 0.5
+
+class OpenLoop(object):
+    # Calls operation() rate times a second for duration seconds, whether or
+    # not earlier calls returned (unlike harness.benchmark.run, which starts a
+    # call when another one returned), from at most max_in_flight threads.
+    # Latencies are measured from when a call was due, so a system falling
+    # behind shows as growing latency rather than as a lower rate; lag is how
+    # late a call started. A call due while max_in_flight calls have not
+    # returned is dropped and counted, not queued, so an overloaded system
+    # does not pile up calls for the rest of the run.
+
+    def __init__(self, operation, rate, duration, window, path, max_in_flight=100):
+        self.operation = operation
+        self.rate = rate
+        self.duration = duration
+        self.window = window
+        self.path = path
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.windows = []
+        self.lock = threading.Lock()
+        # latencies, lags, errors and calls not yet returned of the windows
+        # still open, by index
+        self.open_windows = {}
+        self.start_time = None
+        self.transactions = None
+
+    def run(self, on_window=None):
+        # on_window(summary) is called for every window when its last call returned
+        self.on_window = on_window
+        count = int(self.rate * self.duration)
+        pool = ThreadPool(self.max_in_flight)
+        self.transactions = open(self.path, 'w')
+        self.transactions.write('seconds,latency,lag,error\n')
+        try:
+            self.start_time = time.time()
+            # one call at a time, not a schedule of them all in memory
+            i = 0
+            while i < count:
+                due = self.start_time + i / float(self.rate)
+                index = int((due - self.start_time) // self.window)
+                with self.lock:
+                    # windows before this one get no more calls
+                    for closed in [closed for closed in self.open_windows if closed < index]:
+                        self.open_windows[closed]['scheduling'] = False
+                        self.close_window(closed)
+                    window = self.open_windows.setdefault(index, {'latencies': [], 'lags': [], 'errors': 0, 'dropped': 0, 'pending': 0, 'scheduling': True})
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                if self.in_flight.acquire(False):
+                    with self.lock:
+                        window['pending'] += 1
+                    pool.apply_async(self.call, (index, due))
+                else:
+                    with self.lock:
+                        window['dropped'] += 1
+                        self.transactions.write('{:.3f},,,dropped\n'.format(due - self.start_time))
+                i += 1
+            with self.lock:
+                for index in list(self.open_windows):
+                    self.open_windows[index]['scheduling'] = False
+                    self.close_window(index)
+        finally:
+            pool.close()
+            pool.join()
+            self.transactions.close()
+        # windows close in the order their last call returned
+        self.windows.sort(key=lambda window: window['window'])
+        return self.windows
+
+    def call(self, index, due):
+        start = time.time()
+        try:
+            self.operation()
+            error = None
+        except Exception as e:
+            # the last line of the output of a failed command, e.g. of the peer CLI
+            error = ((getattr(e, 'output', None) or str(e)).strip().splitlines() or [str(e)])[-1][:200]
+        finally:
+            self.in_flight.release()
+        latency = time.time() - due
+        with self.lock:
+            self.transactions.write('{:.3f},{:.4f},{:.4f},{}\n'.format(due - self.start_time, latency, start - due,
+                (error or '').replace(',', ';')))
+            window = self.open_windows[index]
+            window['pending'] -= 1
+            window['lags'].append(start - due)
+            if error:
+                window['errors'] += 1
+            else:
+                window['latencies'].append(latency)
+            self.close_window(index)
+
+    def close_window(self, index):
+        # summarize a window once no more calls are due in it and all of them
+        # returned; called with the lock held
+        window = self.open_windows[index]
+        if window['scheduling'] or window['pending']:
+            return
+        del self.open_windows[index]
+        latencies = sorted(window['latencies'])
+        summary = collections.OrderedDict([
+            ('window', index),
+            ('seconds', index * self.window),
+            ('count', len(latencies) + window['errors']),
+            ('errors', window['errors']),
+            ('dropped', window['dropped']),
+            ('p50', percentile(latencies, 50)),
+            ('p95', percentile(latencies, 95)),
+            ('p99', percentile(latencies, 99)),
+            ('max', latencies[-1] if latencies else None),
+            ('max_lag', max(window['lags']) if window['lags'] else None),
+        ])
+        self.windows.append(summary)
+        self.transactions.flush()
+        if self.on_window:
+            self.on_window(summary)
+
+class Monitor(object):
+    # Samples the memory of the containers returned by containers() (names to
+    # IDs) and the ledger sizes returned by ledgers() (names to bytes) every
+    # interval seconds in a background thread, appending them to a CSV file.
+
+    def __init__(self, docker, containers, ledgers, interval, path):
+        self.docker = docker
+        self.containers = containers
+        self.ledgers = ledgers
+        self.interval = interval
+        self.path = path
+        # (seconds, value) by container name
+        self.memory = collections.OrderedDict()
+        self.ledger = collections.OrderedDict()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.samples = open(self.path, 'w')
+        self.samples.write('seconds,container,rss_bytes,ledger_bytes\n')
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            start = time.time()
+            self.sample()
+            self.stopped.wait(max(0, self.interval - (time.time() - start)))
+
+    def sample(self):
+        seconds = round(time.time() - self.start_time, 1)
+        try:
+            containers = self.containers()
+            ledgers = self.ledgers()
+        except (DockerError, EnvironmentError):
+            return
+        for name, container_id in containers.items():
+            try:
+                rss = rss_bytes(self.docker.stats(container_id))
+            except (DockerError, EnvironmentError):
+                continue
+            self.memory.setdefault(name, []).append((seconds, rss))
+            if name in ledgers:
+                self.ledger.setdefault(name, []).append((seconds, ledgers[name]))
+            self.samples.write('{},{},{},{}\n'.format(seconds, name, rss, ledgers.get(name, '')))
+        self.samples.flush()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.samples.close()
+
+def report_prefix(report_dir, scenario_name):
+    # where the CSV files of a scenario go; next to the dumped container logs
+    # by default, the temp dir is removed with storage=tmpfs
+    report_dir = report_dir or '.'
+    if not os.path.isdir(report_dir):
+        os.makedirs(report_dir)
+    return os.path.join(report_dir, re.sub('\W+', '_', scenario_name).lower())
+
+def kendall_tau(values):
+    # from -1 for a strictly falling series through 0 for a series without
+    # trend to 1 for a strictly rising one
+    pairs = len(values) * (len(values) - 1) // 2
+    if not pairs:
+        return 0.0
+    score = 0
+    for i, earlier in enumerate(values):
+        for later in values[i + 1:]:
+            score += (later > earlier) - (later < earlier)
+    return float(score) / pairs
+
+def trend(values, threshold):
+    # how the mean of the last quarter of a series compares to that of the
+    # first quarter; growth beyond threshold percent is flagged if the series
+    # rises steadily, not just at its end
+    values = [value for value in values if value is not None]
+    if len(values) < 4:
+        return {'samples': len(values), 'flagged': None}
+    quarter = len(values) // 4
+    first = float(sum(values[:quarter])) / quarter
+    last = float(sum(values[-quarter:])) / quarter
+    growth = (last - first) / first * 100 if first else 0.0
+    tau = kendall_tau(values)
+    return collections.OrderedDict([
+        ('samples', len(values)),
+        ('first', first),
+        ('last', last),
+        ('growth_percent', round(growth, 1)),
+        ('tau', round(tau, 2)),
+        ('flagged', growth > threshold and tau >= MIN_TAU),
+    ])
+
+def analyze(windows, monitor, warmup, growth_threshold, drift_threshold):
+    # trends of the latency and memory after the first warmup seconds, and
+    # how fast the ledgers grew; ledgers grow with every block, so their
+    # growth is reported rather than flagged
+    windows = [window for window in windows if window['seconds'] >= warmup]
+    results = collections.OrderedDict()
+    results['dropped'] = sum(window['dropped'] for window in windows)
+    results['latency'] = collections.OrderedDict(
+        (metric, trend([window[metric] for window in windows], drift_threshold)) for metric in ('p50', 'p95'))
+    results['memory'] = collections.OrderedDict(
+        (name, trend([rss for seconds, rss in samples if seconds >= warmup], growth_threshold)) for name, samples in monitor.memory.items())
+    results['ledger'] = collections.OrderedDict()
+    for name, samples in monitor.ledger.items():
+        elapsed = samples[-1][0] - samples[0][0]
+        results['ledger'][name] = {
+            'bytes': samples[-1][1],
+            'bytes_per_hour': (samples[-1][1] - samples[0][1]) / elapsed * 3600 if elapsed else None,
+        }
+    return results
+
+def flagged(results):
+    # descriptions of the latency and memory trends flagged by analyze()
+    problems = []
+    if results['dropped']:
+        problems.append('{} calls dropped, too many in flight'.format(results['dropped']))
+    for metric, result in results['latency'].items():
+        if result['flagged']:
+            problems.append('{} latency drifted by {}% ({:.1f}ms to {:.1f}ms, tau {})'.format(
+                metric, result['growth_percent'], result['first'] * 1000, result['last'] * 1000, result['tau']))
+    for name, result in results['memory'].items():
+        if result['flagged']:
+            problems.append('{} memory grew by {}% ({:.1f} MB to {:.1f} MB, tau {})'.format(
+                name, result['growth_percent'], result['first'] / (1024.0 * 1024), result['last'] / (1024.0 * 1024), result['tau']))
+    return problems
+
+def format_window(window):
+    def ms(seconds):
+        return '-' if seconds is None else '{:.1f}ms'.format(seconds * 1000)
+    return 'soak window {} at {}s: {} transactions ({} errors, {} dropped), p50 {}, p95 {}, p99 {}, max {}, max lag {}'.format(
+        window['window'], window['seconds'], window['count'], window['errors'], window['dropped'],
+        ms(window['p50']), ms(window['p95']), ms(window['p99']), ms(window['max']), ms(window['max_lag']))
@@ -0,0 +1,179 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# DockerClient against a fake daemon serving canned responses on a temporary
+# unix socket.
+#
+# usage: make unit-test
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from harness.docker_api import API_VERSION, DockerClient, DockerError
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn, UnixStreamServer
+
+def frame(stream_type, payload):
+    # a frame of a multiplexed exec or log stream
+    return struct.pack('>BxxxL', stream_type, len(payload)) + payload
+
+class FakeDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        path, _, query = self.path.partition('?')
+        path = path[len('/v{}'.format(API_VERSION)):]
+        with self.server.lock:
+            self.server.requests.append((self.command, path, query, json.loads(body.decode('utf-8')) if body else None))
+            responses = self.server.responses.get((self.command, path), [(404, {'message': 'page not found'}, False)])
+            # the last response of a path is repeated
+            status, data, close = responses.pop(0) if len(responses) > 1 else responses[0]
+        if not isinstance(data, bytes):
+            data = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        # without a Connection: close header, as when the daemon drops an idle connection
+        if close:
+            self.close_connection = True
+
+    do_GET = do_POST = do_DELETE = respond
+
+class FakeDaemon(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        UnixStreamServer.__init__(self, path, FakeDaemonHandler)
+        self.lock = threading.Lock()
+        # (status, body, close) by method and path, in the order they are served
+        self.responses = {}
+        # (method, path, query, body) of every request
+        self.requests = []
+        self.connections = 0
+
+    def respond(self, method, path, *responses):
+        self.responses[(method, path)] = [response if len(response) == 3 else response + (False,) for response in responses]
+
+class DockerClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.daemon = FakeDaemon(os.path.join(self.temp_dir, 'docker.sock'))
+        self.thread = threading.Thread(target=self.daemon.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.docker = DockerClient(self.daemon.server_address)
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_request_decodes_json(self):
+        self.daemon.respond('GET', '/containers/json', (200, [{'Id': 'abc', 'Names': ['/peer']}]))
+        self.assertEqual(self.docker.containers(all=True, filters={'label': ['run']}), [{'Id': 'abc', 'Names': ['/peer']}])
+        method, path, query, body = self.daemon.requests[0]
+        self.assertEqual((method, path), ('GET', '/containers/json'))
+        self.assertIn('all=1', query)
+        self.assertIn('filters=', query)
+
+    def test_send_request_returns_status_and_body(self):
+        self.daemon.respond('DELETE', '/containers/abc', (204, None))
+        status, data = self.docker.send_request('DELETE', '/containers/abc', {'force': 1}, None)
+        self.assertEqual((status, data), (204, b''))
+        self.assertEqual(self.daemon.requests[0][2], 'force=1')
+
+    def test_keep_alive_connection_is_reused(self):
+        self.daemon.respond('GET', '/images/json', (200, []))
+        for i in range(3):
+            self.docker.images()
+        self.assertEqual(self.daemon.connections, 1)
+
+    def test_closed_idle_connection_is_replaced(self):
+        self.daemon.respond('GET', '/images/json', (200, [], True), (200, [{'Id': 'sha256:1'}]))
+        self.docker.images()
+        # let the daemon close the pooled connection
+        time.sleep(0.1)
+        self.assertEqual(self.docker.images(), [{'Id': 'sha256:1'}])
+        self.assertEqual(self.daemon.connections, 2)
+
+    def test_error_status_raises_docker_error(self):
+        self.daemon.respond('POST', '/containers/abc/start', (500, {'message': 'cannot start container'}))
+        with self.assertRaises(DockerError) as raised:
+            self.docker.request('POST', '/containers/abc/start')
+        self.assertEqual(raised.exception.status, 500)
+        self.assertEqual(raised.exception.message, 'cannot start container')
+
+    def test_exec_output_is_demultiplexed(self):
+        self.daemon.respond('POST', '/containers/abc/exec', (201, {'Id': 'e1'}))
+        self.daemon.respond('POST', '/exec/e1/start', (200, frame(1, b'hello ') + frame(2, b'warning\n') + frame(1, b'world\n')))
+        self.daemon.respond('GET', '/exec/e1/json', (200, {'ExitCode': 3}))
+        exit_code, output = self.docker.exec_run('abc', ['peer', 'node', 'status'])
+        self.assertEqual((exit_code, output), (3, b'hello warning\nworld\n'))
+        self.assertEqual(self.daemon.requests[0][3]['Cmd'], ['peer', 'node', 'status'])
+
+    def test_log_lines_span_frames(self):
+        self.daemon.respond('GET', '/containers/abc/logs', (200, frame(1, b'first li') + frame(1, b'ne\nsecond\n') + frame(2, b'no newline')))
+        stream = self.docker.logs('abc')
+        try:
+            self.assertEqual(list(stream.lines()), [b'first line\n', b'second\n', b'no newline'])
+        finally:
+            stream.close()
+
+    def test_missing_image_is_pulled(self):
+        self.daemon.respond('POST', '/containers/create', (404, {'message': 'No such image'}), (201, {'Id': 'abc'}))
+        self.daemon.respond('POST', '/images/create', (200, b'{"status": "Pulling"}\n{"status": "Downloaded"}\n'))
+        self.daemon.respond('POST', '/containers/abc/start', (204, None))
+        self.assertEqual(self.docker.run('hyperledger/fabric-peer:x86_64-1.0.0', env=['A=1']), 'abc')
+        self.assertEqual([(method, path) for method, path, query, body in self.daemon.requests], [
+            ('POST', '/containers/create'),
+            ('POST', '/images/create'),
+            ('POST', '/containers/create'),
+            ('POST', '/containers/abc/start'),
+        ])
+        self.assertEqual(self.daemon.requests[1][2], 'fromImage=hyperledger%2Ffabric-peer&tag=x86_64-1.0.0')
+
+    def test_failed_pull_raises_docker_error(self):
+        self.daemon.respond('POST', '/containers/create', (404, {'message': 'No such image'}))
+        self.daemon.respond('POST', '/images/create', (200, b'{"status": "Pulling"}\n{"error": "manifest unknown"}\n'))
+        with self.assertRaises(DockerError) as raised:
+            self.docker.run('hyperledger/fabric-peer:nope')
+        self.assertEqual(raised.exception.message, 'manifest unknown')
+        self.assertEqual(len(self.daemon.requests), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+class Tracer(object):
+    # Records timed spans of features, scenarios, steps and the docker
+    # operations they make, tagged with the current scenario and step, for
+    # export in the Chrome trace event format (chrome://tracing, Perfetto).
+    # A disabled tracer records nothing.
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []
+        self.lock = threading.Lock()
+        self.thread_ids = {}
+        self.scenario = None
+        self.step = None
+
+    def record(self, name, category, start, duration, **args):
+        if not self.enabled:
+            return
+        if self.scenario:
+            args.setdefault('scenario', self.scenario)
+        if self.step:
+            args.setdefault('step', self.step)
+        with self.lock:
+            # small, stable thread ids read better than idents
+            thread_id = self.thread_ids.setdefault(threading.current_thread().ident, len(self.thread_ids) + 1)
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int(start * 1000000),
+                'dur': int(duration * 1000000),
+                'pid': os.getpid(),
+                'tid': thread_id,
+                'args': args,
+            })
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        # args may be updated by the traced block, e.g. with an exit code
+        start = time.time()
+        try:
+            yield args
+        except Exception as e:
+            args.setdefault('error', str(e))
+            raise
+        finally:
+            self.record(name, category, start, time.time() - start, **args)
+
+    @contextlib.contextmanager
+    def paused(self):
+        # record nothing in the block, e.g. the docker operations of every
+        # transaction of a soak run, which would pile up in memory
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    def write(self, path):
+        trace_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(trace_dir):
+            os.makedirs(trace_dir)
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as trace:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace)
+
+    def summary(self, top):
+        # the slowest operations (features and scenarios aside), and the
+        # total time by category; spans nest, so the totals overlap
+        with self.lock:
+            events = list(self.events)
+        operations = [event for event in events if event['cat'] not in ('feature', 'scenario')]
+        lines = ['{:>10}  {:<10}  {:<50}  {}'.format('seconds', 'category', 'operation', 'scenario')]
+        for event in sorted(operations, key=lambda event: event['dur'], reverse=True)[:top]:
+            lines.append('{:>10.3f}  {:<10}  {:<50}  {}'.format(event['dur'] / 1000000.0, event['cat'],
+                event['name'][:50], event['args'].get('scenario', '')))
+        totals = collections.defaultdict(float)
+        for event in events:
+            totals[event['cat']] += event['dur'] / 1000000.0
+        lines.append('total seconds by category: ' + ', '.join(
+            '{} {:.1f}'.format(category, total) for category, total in sorted(totals.items(), key=lambda item: -item[1])))
+        return '\n'.join(lines)
+
+def shorten_path(arg):
+    # generated crypto material paths are long and not telling, keep the
+    # part after the secrets directory
+    return re.sub(r'\S*/secrets/\S*/(\S+/\S+)', r'secrets/.../\1', arg)
@@ -0,0 +1,62 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import time
+
+# default number of seconds to wait for a condition, see the wait-timeout
+# userdata option
+DEFAULT_TIMEOUT = 60
+
+class WaitTimeout(Exception):
+    pass
+
+def wait_until(condition, description, timeout=DEFAULT_TIMEOUT, interval=0.05, max_interval=2.0, backoff=2.0):
+    # poll condition with exponential backoff until it returns a true value,
+    # which is returned to the caller
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise WaitTimeout('Timed out after {}s waiting for {}'.format(timeout, description))
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+def wait_for_port(address, timeout=DEFAULT_TIMEOUT):
+    # address as reported by `docker port`, e.g. 0.0.0.0:32768
+    host, port = address.rsplit(':', 1)
+    if host in ('0.0.0.0', '::', '[::]'):
+        host = '127.0.0.1'
+    def accepts_connections():
+        try:
+            connection = socket.create_connection((host, int(port)), timeout=1)
+        except socket.error:
+            return False
+        connection.close()
+        return True
+    wait_until(accepts_connections, 'connections on {}'.format(address), timeout)
+
+def wait_for_quiet(measure, settle_time, timeout=DEFAULT_TIMEOUT):
+    # wait until measure() stops changing for at least settle_time seconds
+    state = {'value': measure(), 'since': time.time()}
+    def settled():
+        value = measure()
+        if value != state['value']:
+            state['value'] = value
+            state['since'] = time.time()
+        return time.time() - state['since'] >= settle_time
+    wait_until(settled, 'activity to settle', timeout, interval=settle_time / 4.0, max_interval=settle_time)
@@ -0,0 +1,36 @@
+@benchmark
+Feature: Clustered ordering service
+
+  Networks with an ordering service of several orderers, replicating
+  through Raft or through Kafka brokers, as in production. Ordering
+  throughput is measured up to when the orderers wrote the blocks, and
+  failover by how long blocks stop being committed once an orderer is
+  killed under load. Only runs when the benchmark flag is defined.
+
+Scenario Outline: Ordering throughput of a cluster
+
+  Given a fabric network with <orderers> <type> orderers
+  And a go chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When the ordering throughput of 200 invokes with concurrency 20 is measured
+  Then the ordering throughput is at least 1 TPS
+
+  Examples:
+  | type     | orderers |
+  | etcdraft | 3        |
+  | etcdraft | 5        |
+  | kafka    | 3        |
+
+Scenario Outline: Ordering recovers when an orderer is killed under load
+
+  Given a fabric network with <orderers> <type> orderers
+  And a go chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When <role> orderer is killed during invokes at 5 tx/s for 60 seconds
+  Then the ordering service recovers within <max recovery> seconds
+
+  Examples:
+  | type     | orderers | role        | max recovery |
+  | etcdraft | 3        | the leader  | 30           |
+  | etcdraft | 3        | a follower  | 10           |
+  | kafka    | 3        | any         | 10           |
@@ -2,9 +2,12 @@ Feature: Query chaincode via CLI
 
 Scenario Outline: Query chaincode state via CLI
 
-  Given a fabric peer and orderer
-  And a <lang> chaincode is installed via the CLI
-  And the chaincode is instantiated via the CLI
+  Given the network restored from snapshot "instantiated-<lang>"
+    """
+    Given a fabric peer and orderer
+    And a <lang> chaincode is installed via the CLI
+    And the chaincode is instantiated via the CLI
+    """
   When the chaincode state is queried via the CLI
   Then the expected query result is returned
   When the chaincode state is updated
@@ -0,0 +1,21 @@
+@soak
+Feature: Soak test via CLI
+
+  Only runs when the soak flag is defined. Invokes are submitted at a fixed
+  rate for a long time, while the memory of the orderer, peer and chaincode
+  containers and the size of their ledgers are sampled. The run fails if
+  their memory or the invoke latency keeps growing.
+
+Scenario Outline: Sustained invokes at a fixed rate via CLI
+
+  Given a fabric peer and orderer
+  And a <lang> chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When invokes run at 5 tx/s for 30 minutes
+  Then the soak results are reported
+  And no memory growth or latency drift is detected
+
+  Examples:
+  | lang |
+  | go   |
+  | java |
@@ -0,0 +1,25 @@
+@benchmark
+Feature: World state scaling
+
+  The sample chaincodes only ever touch two keys. These scenarios grow the
+  world state with the bundled key/value chaincode and measure get, put and
+  range query latency at every size, to show where the state database starts
+  to degrade. Only runs when the benchmark flag is defined.
+
+Scenario Outline: Latency as the world state grows
+
+  Given a fabric peer and orderer
+  And the key/value chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When the world state is loaded with 1000 keys of <value size> bytes in batches of 500
+  And the get, put and range latency is measured with 20 samples and ranges of 100 keys
+  And the world state is loaded with 10000 keys of <value size> bytes in batches of 1000
+  And the get, put and range latency is measured with 20 samples and ranges of 100 keys
+  And the world state is loaded with 100000 keys of <value size> bytes in batches of 1000
+  And the get, put and range latency is measured with 20 samples and ranges of 100 keys
+  Then the latency by world state size is reported
+
+  Examples:
+  | value size |
+  | 100        |
+  | 1000       |
@@ -0,0 +1,21 @@
+@benchmark
+Feature: State database comparison
+
+  Peers keep the world state in LevelDB, inside the peer, or in CouchDB,
+  in a container of its own. These scenarios run the same key/value
+  workload against both and report get, put and range query latency side
+  by side. Only runs when the benchmark flag is defined.
+
+Scenario Outline: Latency with a <state db> state database
+
+  Given a fabric peer and orderer with a <state db> state database
+  And the key/value chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When the world state is loaded with 10000 keys of 1000 bytes in batches of 1000
+  And the get, put and range latency is measured with 50 samples and ranges of 100 keys
+  Then the latency by state database is reported
+
+  Examples:
+  | state db |
+  | leveldb  |
+  | couchdb  |
@@ -0,0 +1,124 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from behave import *
+import time
+
+from harness import benchmark
+
+@step(r'(?P<count>\d+) invokes are submitted with concurrency (?P<concurrency>\d+)')
+def step_impl(context, count, concurrency):
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    blocks = context.network.committed_blocks(context.channel_id)
+    committed = sum(transactions for block, transactions in blocks)
+    def invoke():
+        context.network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_transfer_args[context.chaincode_lang], logging_level='warning', echo=False)
+    timings, elapsed = benchmark.run(invoke, int(count), int(concurrency))
+    record_benchmark(context, 'invoke', int(concurrency), timings, elapsed)
+    # the invokes above return once the orderer accepted the transactions,
+    # throughput is also measured up to the point all of them are committed
+    submitted = len([timing for timing in timings if not timing['error']])
+    context.network.wait_for_committed_transactions(context.channel_id, committed + submitted)
+    committed_elapsed = time.time() - min(timing['start'] for timing in timings)
+    context.benchmark_results['invoke']['committed_elapsed'] = committed_elapsed
+    context.benchmark_results['invoke']['committed_tps'] = submitted / committed_elapsed
+    # how the orderer cut the transactions into blocks
+    context.benchmark_results['invoke']['blocks'] = benchmark.summarize_blocks(
+        [transactions for block, transactions in context.network.committed_blocks(context.channel_id)[len(blocks):]])
+    context.last_function = 'invoke'
+
+@step(r'(?P<count>\d+) queries are submitted with concurrency (?P<concurrency>\d+)')
+def step_impl(context, count, concurrency):
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    def query():
+        context.network.query_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_query_args[context.chaincode_lang], logging_level='warning', echo=False)
+    timings, elapsed = benchmark.run(query, int(count), int(concurrency))
+    record_benchmark(context, 'query', int(concurrency), timings, elapsed)
+
+@step(r'the commit latency of (?P<count>\d+) invokes is measured')
+def step_impl(context, count):
+    # invoke one at a time, measuring until the transaction is committed
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    def invoke_and_wait():
+        block_height = context.network.block_height(context.channel_id)
+        context.network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_transfer_args[context.chaincode_lang], logging_level='warning', echo=False)
+        context.network.wait_for_block_height(context.channel_id, block_height + 1, max_interval=0.05)
+    timings, elapsed = benchmark.run(invoke_and_wait, int(count), 1)
+    record_benchmark(context, 'commit', 1, timings, elapsed)
+    context.last_function = 'invoke'
+
+@step(r'the p50/p95/p99 (?P<operation>invoke|query|commit) latency is reported')
+def step_impl(context, operation):
+    results = getattr(context, 'benchmark_results', {})
+    assert operation in results, 'No {} benchmark was run.'.format(operation)
+    print(benchmark.format_summary(operation, results[operation]['summary']))
+    if 'committed_tps' in results[operation]:
+        print('{} committed in {:.2f}s: {:.1f} TPS'.format(operation, results[operation]['committed_elapsed'], results[operation]['committed_tps']))
+    if 'blocks' in results[operation]:
+        blocks = results[operation]['blocks']
+        print('{} transactions in {} blocks, {} per block on average (min {}, max {})'.format(
+            blocks['transactions'], blocks['blocks'], blocks['mean'], blocks['min'], blocks['max']))
+    for timing in results[operation]['timings']:
+        if timing['error']:
+            print(timing['error'])
+
+@step(r'the (?P<operation>invoke|query) throughput is at least (?P<tps>[\d.]+) TPS')
+def step_impl(context, operation, tps):
+    results = getattr(context, 'benchmark_results', {})
+    assert operation in results, 'No {} benchmark was run.'.format(operation)
+    summary = results[operation]['summary']
+    assert summary['errors'] == 0, '{} of {} {} transactions failed'.format(summary['errors'], summary['count'], operation)
+    assert summary['tps'] >= float(tps), 'Expected at least {} TPS, Actual: {:.1f} TPS'.format(tps, summary['tps'])
+
+def record_benchmark(context, operation, concurrency, timings, elapsed):
+    if not getattr(context, 'benchmark_results', None):
+        context.benchmark_results = {}
+    context.benchmark_results[operation] = {
+        'concurrency': concurrency,
+        'summary': benchmark.summarize(timings, elapsed),
+        'timings': timings,
+    }
+
+@step(r'on average the blocks are at least (?P<percent>\d+)% as full as the submit rate allows')
+def step_impl(context, percent):
+    # the invokes return once the orderer accepted the transactions, so how
+    # many are pending when a block is cut depends on the rate they were
+    # submitted at, which depends on the host, not on the concurrency
+    results = getattr(context, 'benchmark_results', {})
+    assert 'invoke' in results, 'No invoke benchmark was run.'
+    blocks = results['invoke']['blocks']
+    settings = context.network.orderer_settings
+    expected = benchmark.expected_block_size(results['invoke']['summary']['tps'] or 0,
+        benchmark.parse_duration(settings['BatchTimeout']), int(settings['MaxMessageCount']))
+    print('submitted at {:.1f} TPS: {:.1f} transactions per block expected'.format(results['invoke']['summary']['tps'] or 0, expected))
+    assert blocks['mean'] is not None and blocks['mean'] >= expected * int(percent) / 100.0, 'Expected at least {:.1f} transactions per block, Actual: {}'.format(
+        expected * int(percent) / 100.0, blocks['mean'])
+
+@step(r'no block holds more transactions than MaxMessageCount')
+def step_impl(context):
+    results = getattr(context, 'benchmark_results', {})
+    assert 'invoke' in results, 'No invoke benchmark was run.'
+    blocks = results['invoke']['blocks']
+    count = int(context.network.orderer_settings['MaxMessageCount'])
+    assert blocks['max'] is not None and blocks['max'] <= count, 'Expected at most {} transactions per block, Actual: {}'.format(count, blocks['max'])
+
+@step(r'the p(?P<percent>50|95|99) commit latency is at most (?P<seconds>[\d.]+) seconds')
+def step_impl(context, percent, seconds):
+    results = getattr(context, 'benchmark_results', {})
+    assert 'commit' in results, 'No commit latency was measured.'
+    latency = results['commit']['summary']['latency']['p' + percent]
+    assert latency is not None and latency <= float(seconds), 'Expected p{} commit latency of at most {}s, Actual: {}s'.format(percent, seconds, latency)
@@ -0,0 +1,167 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Ordering service steps: throughput up to the blocks the orderers write,
+# and how long a cluster takes to order transactions again after losing an
+# orderer.
+
+from behave import *
+import random
+import threading
+import time
+
+from harness import benchmark, soak
+from harness.logs import BlockTracker
+
+@step(r'the ordering throughput of (?P<count>\d+) invokes with concurrency (?P<concurrency>\d+) is measured')
+def step_impl(context, count, concurrency):
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    network = context.network
+    written_before = set(network.ordered_blocks(context.channel_id))
+    committed = network.committed_transactions(context.channel_id)
+    def invoke():
+        network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_transfer_args[context.chaincode_lang], logging_level='warning', echo=False)
+    timings, elapsed = benchmark.run(invoke, int(count), int(concurrency))
+    submitted = len([timing for timing in timings if not timing['error']])
+    network.wait_for_committed_transactions(context.channel_id, committed + submitted)
+    start = min(timing['start'] for timing in timings)
+    committed_elapsed = time.time() - start
+    # transactions are counted in the blocks the peer committed, timed by
+    # when the first orderer wrote them
+    written = dict((block, timestamp) for block, timestamp in network.ordered_blocks(context.channel_id).items() if block not in written_before)
+    transactions = dict(network.committed_blocks(context.channel_id))
+    ordered = sum(transactions.get(block, 0) for block in written)
+    ordered_elapsed = max(written.values()) - start if written else None
+    if not getattr(context, 'benchmark_results', None):
+        context.benchmark_results = {}
+    context.benchmark_results['ordering'] = {
+        'orderer_type': network.orderer_type,
+        'orderers': len(network.orderers),
+        'concurrency': int(concurrency),
+        'summary': benchmark.summarize(timings, elapsed),
+        'timings': timings,
+        'blocks': len(written),
+        'ordered_transactions': ordered,
+        'ordered_elapsed': ordered_elapsed,
+        'ordered_tps': ordered / ordered_elapsed if ordered_elapsed else None,
+        'committed_elapsed': committed_elapsed,
+        'committed_tps': submitted / committed_elapsed,
+    }
+    results = context.benchmark_results['ordering']
+    print(benchmark.format_summary('invoke', results['summary']))
+    print('{} orderers ({}): {} transactions ordered in {} blocks, {} TPS ordered, {:.1f} TPS committed'.format(
+        results['orderers'], results['orderer_type'], ordered, len(written),
+        '-' if results['ordered_tps'] is None else '{:.1f}'.format(results['ordered_tps']), results['committed_tps']))
+    context.last_function = 'invoke'
+
+@step(r'the ordering throughput is at least (?P<tps>[\d.]+) TPS')
+def step_impl(context, tps):
+    results = getattr(context, 'benchmark_results', {}).get('ordering')
+    assert results, 'No ordering throughput was measured.'
+    assert results['ordered_tps'] >= float(tps), 'Expected at least {} TPS, Actual: {}'.format(tps, results['ordered_tps'])
+
+@step(r'(?P<role>the leader|a follower|any) orderer is killed during invokes at (?P<rate>[\d.]+) tx/s for (?P<duration>\d+) seconds')
+def step_impl(context, role, rate, duration):
+    # invokes at a fixed rate, see harness.soak, with an orderer killed a
+    # third of the way in
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    network = context.network
+    assert len(network.orderers) > 1, 'Failover needs a cluster of orderers.'
+    assert role == 'any' or network.orderer_type == 'etcdraft', 'Only Raft orderers have a leader.'
+    # when the first peer committed blocks of the channel
+    commits = []
+    def track_commits(line):
+        match = BlockTracker.PATTERN.search(line)
+        if match and match.group(1) == context.channel_id:
+            commits.append(time.time())
+    killed = {}
+    def kill():
+        leader = network.raft_leader(context.channel_id) if network.orderer_type == 'etcdraft' else None
+        # runs in a timer thread; the step fails on the error below
+        if role != 'any' and not leader:
+            killed['error'] = 'No Raft leader of channel {}'.format(context.channel_id)
+            return
+        if role == 'the leader':
+            orderer = leader
+        else:
+            orderer = random.choice([orderer for orderer in network.orderers if orderer is not leader])
+        killed['orderer'] = orderer.name
+        killed['time'] = time.time()
+        network.kill_orderer(orderer)
+    def invoke():
+        network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_transfer_args[context.chaincode_lang], logging_level='warning', echo=None)
+    load = soak.OpenLoop(invoke, float(rate), int(duration), 1,
+        soak.report_prefix(context.config.userdata.get('benchmark-report-dir'), context.scenario.name) + '_failover_transactions.csv')
+    stream = network.log_streams[network.peer.name]
+    stream.add_listener(track_commits)
+    timer = threading.Timer(int(duration) / 3.0, kill)
+    timer.start()
+    try:
+        windows = load.run()
+        timer.join()
+        # blocks still in flight
+        network.wait_for_quiet_logs(5)
+    finally:
+        timer.cancel()
+        stream.remove_listener(track_commits)
+    assert 'orderer' in killed, killed.get('error', 'No orderer was killed.')
+    recovery = recovery_time(killed['time'], list(commits), load.start_time + int(duration))
+    if not getattr(context, 'benchmark_results', None):
+        context.benchmark_results = {}
+    context.benchmark_results['failover'] = {
+        'orderer_type': network.orderer_type,
+        'role': {'the leader': 'leader', 'a follower': 'follower', 'any': 'any'}[role],
+        'killed': killed['orderer'],
+        'killed_after': killed['time'] - load.start_time,
+        'recovery_seconds': recovery,
+        'failed_invokes': sum(window['errors'] for window in windows),
+        'windows': windows,
+    }
+    context.last_function = 'invoke'
+
+@step(r'the ordering service recovers within (?P<seconds>[\d.]+) seconds')
+def step_impl(context, seconds):
+    results = getattr(context, 'benchmark_results', {}).get('failover')
+    assert results, 'No orderer was killed.'
+    print('killed {} ({} orderer) after {:.1f}s: {} invokes failed, blocks committed again after {}'.format(
+        results['killed'], results['role'], results['killed_after'], results['failed_invokes'],
+        'never' if results['recovery_seconds'] is None else '{:.2f}s'.format(results['recovery_seconds'])))
+    assert results['recovery_seconds'] is not None, 'No block was committed after {} was killed'.format(results['killed'])
+    assert results['recovery_seconds'] <= float(seconds), 'Expected recovery within {}s, Actual: {:.2f}s'.format(seconds, results['recovery_seconds'])
+
+# a gap between commits this many times the median gap before the kill
+# is an outage rather than batching jitter
+OUTAGE_FACTOR = 3
+
+def recovery_time(kill_time, commits, end_time):
+    # seconds from the kill to the commit ending the first outage after it,
+    # 0 if commits went on as before the kill, None if they did not resume
+    # before the invokes ended at end_time; blocks ordered before the kill
+    # may still be committed right after it
+    before = [commit for commit in commits if commit < kill_time]
+    after = [commit for commit in commits if commit >= kill_time]
+    if not after:
+        return None
+    gaps = sorted(later - earlier for earlier, later in zip(commits, commits[1:]))
+    before_gaps = sorted(later - earlier for earlier, later in zip(before, before[1:]))
+    threshold = OUTAGE_FACTOR * benchmark.percentile(before_gaps or gaps or [0], 50)
+    times = before[-1:] + after
+    for earlier, later in zip(times, times[1:]):
+        if later - earlier > threshold:
+            return later - kill_time
+    if end_time - times[-1] > threshold:
+        return None
+    return 0.0
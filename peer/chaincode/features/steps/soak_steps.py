@@ -0,0 +1,92 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Soak steps, see harness.soak.
+
+from behave import *
+
+from harness import soak
+
+SECONDS = {'seconds': 1, 'minutes': 60, 'hours': 3600}
+
+@step(r'invokes run at (?P<rate>[\d.]+) tx/s for (?P<duration>[\d.]+) (?P<unit>seconds|minutes|hours)')
+def step_impl(context, rate, duration, unit):
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    userdata = context.config.userdata
+    window = float(userdata.get('soak-window', 60))
+    prefix = soak.report_prefix(userdata.get('benchmark-report-dir'), context.scenario.name) + '_soak'
+    committed = sum(transactions for block, transactions in context.network.committed_blocks(context.channel_id))
+    def invoke():
+        # failures are counted and written to the transactions file, not echoed
+        context.network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+            context.sample_chaincode_transfer_args[context.chaincode_lang], logging_level='warning', echo=None)
+    def report_window(summary):
+        print(soak.format_window(summary))
+    load = soak.OpenLoop(invoke, float(rate), float(duration) * SECONDS[unit], window, prefix + '_transactions.csv',
+        userdata.getint('soak-max-in-flight', 100))
+    monitor = soak.Monitor(context.docker, context.network.resource_containers, context.network.storage_usage,
+        float(userdata.get('soak-sample-interval', 30)), prefix + '_samples.csv')
+    # every transaction is a few docker operations, too many to trace
+    with context.tracer.paused():
+        monitor.start()
+        try:
+            windows = load.run(report_window)
+            submitted = sum(summary['count'] - summary['errors'] for summary in windows)
+            context.network.wait_for_committed_transactions(context.channel_id, committed + submitted)
+        finally:
+            monitor.stop()
+    if not getattr(context, 'benchmark_results', None):
+        context.benchmark_results = {}
+    context.benchmark_results['soak'] = {
+        'rate': float(rate),
+        'duration': float(duration) * SECONDS[unit],
+        'window': window,
+        'windows': windows,
+        'analysis': soak.analyze(windows, monitor, float(userdata.get('soak-warmup', window)),
+            float(userdata.get('soak-growth-threshold', 10)), float(userdata.get('soak-drift-threshold', 20))),
+    }
+    context.last_function = 'invoke'
+
+@step(r'the soak results are reported')
+def step_impl(context):
+    results = getattr(context, 'benchmark_results', {}).get('soak')
+    assert results, 'No soak run.'
+    count = sum(window['count'] for window in results['windows'])
+    errors = sum(window['errors'] for window in results['windows'])
+    dropped = sum(window['dropped'] for window in results['windows'])
+    print('{} transactions at {} tx/s in {} windows of {:.0f}s, {} errors, {} dropped'.format(
+        count, results['rate'], len(results['windows']), results['window'], errors, dropped))
+    analysis = results['analysis']
+    for metric, result in analysis['latency'].items():
+        if result['flagged'] is None:
+            print('{} latency: too few windows to tell a trend'.format(metric))
+        else:
+            print('{} latency: {:.1f}ms to {:.1f}ms ({:+.1f}%, tau {})'.format(
+                metric, result['first'] * 1000, result['last'] * 1000, result['growth_percent'], result['tau']))
+    for name, result in analysis['memory'].items():
+        if result['flagged'] is None:
+            print('{} memory: too few samples to tell a trend'.format(name))
+        else:
+            print('{} memory: {:.1f} MB to {:.1f} MB ({:+.1f}%, tau {})'.format(name, result['first'] / (1024.0 * 1024),
+                result['last'] / (1024.0 * 1024), result['growth_percent'], result['tau']))
+    for name, result in analysis['ledger'].items():
+        print('{} ledger: {:.1f} MB, growing {} MB/hour'.format(name, result['bytes'] / (1024.0 * 1024),
+            '-' if result['bytes_per_hour'] is None else '{:.1f}'.format(result['bytes_per_hour'] / (1024.0 * 1024))))
+
+@step(r'no memory growth or latency drift is detected')
+def step_impl(context):
+    results = getattr(context, 'benchmark_results', {}).get('soak')
+    assert results, 'No soak run.'
+    problems = soak.flagged(results['analysis'])
+    assert not problems, '; '.join(problems)
@@ -0,0 +1,152 @@
+# Copyright IBM Corp. 2017 All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# World state scaling steps, using the bundled key/value chaincode
+# (chaincode/src/kvstore), whose keys are addressed by index.
+
+from behave import *
+import json
+import random
+import time
+
+from harness import benchmark
+
+# concurrent load transactions, each writing a batch of distinct keys
+LOAD_CONCURRENCY = 4
+
+@step(r'the world state is loaded with (?P<count>\d+) keys of (?P<size>\d+) bytes in batches of (?P<batch>\d+)')
+def step_impl(context, count, size, batch):
+    # load keys up to count, on top of those loaded before
+    assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
+    count, batch = int(count), int(batch)
+    loaded = getattr(context, 'state_size', 0)
+    assert count > loaded, 'The world state already holds {} keys'.format(loaded)
+    starts = list(range(loaded, count, batch))
+    pending = iter(starts)
+    committed = sum(transactions for block, transactions in context.network.committed_blocks(context.channel_id))
+    def load():
+        # the iterator hands out every batch once, across threads
+        start = next(pending)
+        invoke(context, 'load', start, min(batch, count - start), size)
+    timings, elapsed = benchmark.run(load, len(starts), LOAD_CONCURRENCY)
+    errors = [timing['error'] for timing in timings if timing['error']]
+    assert not errors, '{} of {} load transactions failed: {}'.format(len(errors), len(starts), errors[0])
+    context.network.wait_for_committed_transactions(context.channel_id, committed + len(starts))
+    committed_elapsed = time.time() - min(timing['start'] for timing in timings)
+    print('loaded {} keys of {} bytes in {} transactions, committed after {:.2f}s'.format(count - loaded, size, len(starts), committed_elapsed))
+    context.state_size = count
+    context.state_value_size = int(size)
+    results = state_results(context)
+    results['value_size'] = int(size)
+    results['load'] = {
+        'keys': count - loaded,
+        'batch': batch,
+        'concurrency': LOAD_CONCURRENCY,
+        'summary': benchmark.summarize(timings, elapsed),
+        'committed_elapsed': committed_elapsed,
+    }
+    # the last key loaded reads back in full
+    value = query_result(query(context, 'get', count - 1))
+    assert len(value) == int(size), 'Expected a {} byte value, Actual: {} bytes'.format(size, len(value))
+
+@step(r'the get, put and range latency is measured with (?P<count>\d+) samples and ranges of (?P<range_size>\d+) keys')
+def step_impl(context, count, range_size):
+    # one operation at a time, on random keys of the current world state
+    assert getattr(context, 'state_size', 0), 'The world state was not loaded.'
+    count, range_size = int(count), int(range_size)
+    assert range_size <= context.state_size, 'Ranges of {} keys exceed the world state of {} keys'.format(range_size, context.state_size)
+    def get():
+        query(context, 'get', random.randrange(context.state_size))
+    def put():
+        # overwrite a key, measuring until the transaction is committed
+        block_height = context.network.block_height(context.channel_id)
+        invoke(context, 'put', random.randrange(context.state_size), context.state_value_size)
+        context.network.wait_for_block_height(context.channel_id, block_height + 1, max_interval=0.05)
+    def range_query():
+        keys = int(query_result(query(context, 'range', random.randrange(context.state_size - range_size + 1), range_size)))
+        assert keys == range_size, 'Expected {} keys in range, Actual: {}'.format(range_size, keys)
+    results = state_results(context)
+    for operation, function in (('get', get), ('put', put), ('range', range_query)):
+        timings, elapsed = benchmark.run(function, count, 1)
+        results[operation] = {
+            'summary': benchmark.summarize(timings, elapsed),
+            'timings': timings,
+        }
+        if operation == 'range':
+            results[operation]['range_size'] = range_size
+        print(benchmark.format_summary('{} at {} keys'.format(operation, context.state_size), results[operation]['summary']))
+
+@step(r'the latency by world state size is reported')
+def step_impl(context):
+    # p50 latencies, and how they grew compared to the smallest world state
+    by_size = getattr(context, 'benchmark_results', {}).get('state_sizes')
+    assert by_size, 'No world state latency was measured.'
+    sizes = sorted(by_size, key=int)
+    operations = ('get', 'put', 'range')
+    print('{:>10}  {}'.format('keys', '  '.join('{:>18}'.format(operation + ' p50') for operation in operations)))
+    for size in sizes:
+        cells = []
+        for operation in operations:
+            p50 = by_size[size].get(operation, {}).get('summary', {}).get('latency', {}).get('p50')
+            first = by_size[sizes[0]].get(operation, {}).get('summary', {}).get('latency', {}).get('p50')
+            if p50 is None:
+                cells.append('{:>18}'.format('-'))
+            else:
+                cells.append('{:>10.1f}ms {:>5}'.format(p50 * 1000, 'x{:.1f}'.format(p50 / first) if first else ''))
+        print('{:>10}  {}'.format(size, '  '.join(cells)))
+    for size in sizes:
+        for operation in operations:
+            for timing in by_size[size].get(operation, {}).get('timings', []):
+                if timing['error']:
+                    print(timing['error'])
+
+@step(r'the latency by state database is reported')
+def step_impl(context):
+    # p50 and p95 latencies at the largest world state loaded, next to those
+    # of the state databases measured by earlier scenarios of the run
+    by_size = getattr(context, 'benchmark_results', {}).get('state_sizes')
+    assert by_size, 'No world state latency was measured.'
+    operations = ('get', 'put', 'range')
+    size = max(by_size, key=int)
+    context.state_db_latency[context.network.state_db] = dict(
+        (operation, by_size[size][operation]['summary']['latency']) for operation in operations if operation in by_size[size])
+    state_dbs = sorted(context.state_db_latency)
+    print('{:>10}  {}'.format('{} keys'.format(size), '  '.join('{:>20}'.format(state_db + ' p50/p95') for state_db in state_dbs)))
+    for operation in operations:
+        cells = []
+        for state_db in state_dbs:
+            latency = context.state_db_latency[state_db].get(operation)
+            if not latency or latency['p50'] is None:
+                cells.append('{:>20}'.format('-'))
+            else:
+                cells.append('{:>20}'.format('{:.1f}/{:.1f}ms'.format(latency['p50'] * 1000, latency['p95'] * 1000)))
+        print('{:>10}  {}'.format(operation, '  '.join(cells)))
+    context.benchmark_results['state_db'] = context.network.state_db
+
+def state_results(context):
+    # benchmark results of the current world state size
+    if not getattr(context, 'benchmark_results', None):
+        context.benchmark_results = {}
+    return context.benchmark_results.setdefault('state_sizes', {}).setdefault(str(context.state_size), {})
+
+def invoke(context, function, *args):
+    context.network.invoke_chaincode(context.channel_id, context.chaincode_id_name,
+        json.dumps({'Args': [function] + [str(arg) for arg in args]}), logging_level='warning', echo=False)
+
+def query(context, function, *args):
+    return context.network.query_chaincode(context.channel_id, context.chaincode_id_name,
+        json.dumps({'Args': [function] + [str(arg) for arg in args]}), logging_level='warning', echo=False)
+
+def query_result(output):
+    return [line.split(':', 1)[1].strip() for line in output.splitlines() if line.startswith('Query Result:')][0]
@@ -13,545 +13,234 @@
 # limitations under the License.
 
 from behave import *
+import json
 import os
 import random
-import subprocess
-import tempfile
 import time
-import socket
-import pyaml
-import collections
+
+from harness.artifacts import ArtifactCache, tree_digest
+from harness.network import CLI_GOPATH, CLI_TEST_GOPATH, Network
+
+# what the steps know about a network, kept in its snapshots
+SNAPSHOT_CONTEXT = (
+    'channel_id',
+    'chaincode_lang',
+    'chaincode_id_name',
+    'chaincode_id_version',
+    'chaincode_path',
+    'chaincode_ctor_args',
+    'chaincode_go_path',
+    'chaincode_source_key',
+    'last_function',
+    'state_size',
+    'state_value_size',
+)
 
 @step(u'a fabric peer and orderer')
 def step_impl(context):
+    # shared networks are brought up by the feature or run hooks
+    if context.network_scope == 'scenario':
+        context.network = Network(context, 'scenario', context.scenario_temp_dir)
+        context.network.up()
+    create_test_channel(context)
 
-    # generate crypto materials
-    secrets_dir = 'secrets'
-    crypto_config_yaml = 'crypto-config.yaml'
-
-    with open(os.path.join(context.scenario_temp_dir, crypto_config_yaml), 'w') as crypto_config_stream:
-        crypto_config = {
-            'OrdererOrgs':[
-                {
-                    'Name':'OrdererOrg',
-                    'Domain':'local',
-                    'CA': {'Country':'US','Province':'North Carolina','Locality':'Raleigh'},
-                    'Specs': [{'Hostname':'orderer'}]
-                }
-            ],
-            'PeerOrgs':[
-                {
-                    'Name':'PeerOrg',
-                    'Domain':'local',
-                    'CA': {'Country':'US','Province':'North Carolina','Locality':'Raleigh'},
-                    'Specs': [{'Hostname':'peer'}]
-                }
-            ]
-        }
-        pyaml.dump(crypto_config, crypto_config_stream)
-
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--volume', '{}:/work'.format(context.scenario_temp_dir),
-            '--workdir', '/work',
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'cryptogen', 'generate',
-            '--config', crypto_config_yaml,
-            '--output', secrets_dir,
-        ], cwd=context.scenario_temp_dir, stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # create network
-    context.network_name = 'behave_' + ''.join(random.choice('0123456789') for i in xrange(7))
-    context.network_id = subprocess.check_output([
-        'docker', 'network', 'create', context.network_name
-    ]).strip()
-
-    orderer_org_msp_dir = '{0}/ordererOrganizations/{1}/msp'.format(secrets_dir, 'local')
-    peer_org_msp_dir = '{0}/peerOrganizations/{1}/msp'.format(secrets_dir, 'local')
-
-    # generate configuration transaction generator input file
-    configtx_yaml = 'configtx.yaml'
-    with open(os.path.join(context.scenario_temp_dir, configtx_yaml), 'w') as configtx_stream:
-        orderer_org = {
-            'Name' : 'OrdererOrg',
-            'ID' : 'OrdererMSP',
-            'MSPDir' : orderer_org_msp_dir,
-        }
-        peer_org = {
-            'Name' : 'PeerOrg',
-            'ID' : 'PeerMSP',
-            'MSPDir' : peer_org_msp_dir,
-            'AnchorPeers' : [{ 'Host':'peer', 'Port':7051 }],
-        }
-        configtx = {}
-        configtx['Organizations'] = [orderer_org, peer_org]
-        configtx['Profiles'] = {
-            'OrdererSystemChannel': {
-                'Orderer': {
-                    'OrdererType' : 'solo',
-                    'Addresses' : ['orderer:7050'],
-                    'BatchTimeout' : '1s',
-                    'BatchSize' : {
-                        'MaxMessageCount' : '1',
-                        'AbsoluteMaxBytes' : '10 MB',
-                        'PreferredMaxBytes' : '512 KB'
-                    },
-                    'MaxChannels' : 0,
-                    'Organizations' : [orderer_org],
-                },
-                'Consortiums' : {
-                    'SampleConsortium' : {
-                        'Organizations' : [peer_org],
-                    }
-                }
-            },
-            'TestChannel' : {
-                'Consortium' : 'SampleConsortium',
-                'Application' : {
-                    'Organizations' : [peer_org],
-                },
-            }
-        }
-        pyaml.dump(configtx, configtx_stream)
-
-    # absolute path to secrets directory
-    secrets_dir = os.path.join(context.scenario_temp_dir, secrets_dir)
-
-    orderer_msp_dir = '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/msp'.format(secrets_dir, 'local', 'orderer')
-    orderer_tls_dir = '{0}/ordererOrganizations/{1}/orderers/{2}.{1}/tls'.format(secrets_dir, 'local', 'orderer')
-    context.orderer_org_tlsca_cert_file = '{0}/ordererOrganizations/{1}/tlsca/tlsca.{1}-cert.pem'.format(secrets_dir, 'local')
-    context.peer_tls_dir = '{0}/peerOrganizations/{1}/peers/{2}.{1}/tls'.format(secrets_dir, 'local', 'peer')
-    context.peer_msp_dir = '{0}/peerOrganizations/{1}/peers/{2}.{1}/msp'.format(secrets_dir, 'local', 'peer')
-    context.peer_admin_tls_dir = '{0}/peerOrganizations/{1}/users/{2}@{1}/tls'.format(secrets_dir, 'local', 'Admin')
-    context.peer_admin_msp_dir = '{0}/peerOrganizations/{1}/users/{2}@{1}/msp'.format(secrets_dir, 'local', 'Admin')
-
-    # create orderer system channel bootstrap block
-    orderer_genesis_block = 'genesis.block'
-
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--env', 'FABRIC_CFG_PATH=/work',
-            '--volume', '{}:/work'.format(context.scenario_temp_dir),
-            '--workdir', '/work',
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'configtxgen',
-            '--profile', 'OrdererSystemChannel',
-            '--channelID', 'orderer.system.channel',
-            '--outputBlock', orderer_genesis_block,
-        ], cwd=context.scenario_temp_dir, stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # absolute path need from here on
-    orderer_genesis_block = os.path.join(context.scenario_temp_dir, orderer_genesis_block)
-
-    # start orderer
-    context.orderer_container_id = subprocess.check_output([
-        'docker', 'run',
-        '--detach',
-        '--publish', '7050',
-        '--expose', '7050',
-        '--network', context.network_name,
-        '--network-alias', 'orderer',
-        '--env', 'ORDERER_GENERAL_LISTENADDRESS=0.0.0.0',
-        '--env', 'ORDERER_GENERAL_GENESISMETHOD=file',
-        '--env', 'ORDERER_GENERAL_GENESISFILE=/run/secrets/genesis.block',
-        '--env', 'ORDERER_GENERAL_LOCALMSPDIR=/run/secrets/msp',
-        '--env', 'ORDERER_GENERAL_LOCALMSPID=OrdererMSP',
-        '--env', 'ORDERER_GENERAL_LOGLEVEL=debug',
-        '--env', 'ORDERER_GENERAL_TLS_ENABLED=true',
-        '--env', 'ORDERER_GENERAL_TLS_PRIVATEKEY=/run/secrets/tls/server.key',
-        '--env', 'ORDERER_GENERAL_TLS_CERTIFICATE=/run/secrets/tls/server.crt',
-        '--env', 'ORDERER_GENERAL_TLS_ROOTCAS=[/run/secrets/tls/ca.crt]',
-        '--volume', '{}:/run/secrets/genesis.block'.format(orderer_genesis_block),
-        '--volume', '{}:/run/secrets/msp'.format(orderer_msp_dir),
-        '--volume', '{}:/run/secrets/tls'.format(orderer_tls_dir),
-        'hyperledger/fabric-orderer:{}'.format(context.docker_tag['orderer'])
-    ], cwd=context.scenario_temp_dir).strip()
-
-    # get exposed orderer port address
-    context.orderer_address = subprocess.check_output(['docker', 'port', context.orderer_container_id, '7050']).strip()
-
-    # start peer
-    context.peer_container_id = subprocess.check_output([
-        'docker', 'run',
-        '--detach',
-        '--publish', '7051',
-        '--network', context.network_name,
-        '--network-alias', 'peer',
-        '--env', 'CORE_PEER_ADDRESSAUTODETECT=true',
-        '--env', 'CORE_PEER_ID=peer',
-        '--env', 'CORE_CHAINCODE_STARTUPTIMEOUT=300s',
-        '--env', 'CORE_VM_DOCKER_ATTACHSTDOUT=true',
-        '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-        '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-        '--env', 'CORE_PEER_TLS_ENABLED=true',
-        '--env', 'CORE_PEER_TLS_CERT_FILE=/run/secrets/tls/server.crt',
-        '--env', 'CORE_PEER_TLS_KEY_FILE=/run/secrets/tls/server.key',
-        '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-        '--volume', '/var/run/docker.sock:/var/run/docker.sock',
-        '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-        '--volume', '{0}:/run/secrets/msp'.format(context.peer_msp_dir),
-        'hyperledger/fabric-peer:{}'.format(context.docker_tag['peer']),
-        'peer', 'node', 'start', '--logging-level', 'debug', '--orderer', 'orderer:7050',
-    ]).strip()
-    context.peer_address = subprocess.check_output(['docker', 'port', context.peer_container_id, '7051']).strip()
-    time.sleep(1)
-
-    # create channel creation tx for test channel
+@step(u'a fabric peer and orderer with the orderer settings')
+def step_impl(context):
+    # the orderer settings are baked into the genesis block, so the scenario
+    # always gets a network of its own, whatever the network scope
+    orderer_settings = dict((row['setting'], row['value']) for row in context.table)
+    context.network = Network(context, 'scenario', context.scenario_temp_dir, orderer_settings)
+    context.network.up()
+    create_test_channel(context)
+
+@step(r'a fabric network with (?P<org_count>\d+) orgs? of (?P<peers_per_org>\d+) peers? each')
+def step_impl(context, org_count, peers_per_org):
+    # shared networks only have a single peer, so the scenario gets its own
+    context.network = Network(context, 'scenario', context.scenario_temp_dir,
+        org_count=int(org_count), peers_per_org=int(peers_per_org))
+    context.network.up()
+    create_test_channel(context)
+
+@step(r'a fabric network with (?P<orderer_count>\d+) (?P<orderer_type>kafka|etcdraft) orderers?')
+def step_impl(context, orderer_type, orderer_count):
+    # the ordering service is baked into the genesis block, so the scenario
+    # always gets a network of its own, whatever the network scope
+    context.network = Network(context, 'scenario', context.scenario_temp_dir,
+        {'OrdererType': orderer_type}, orderer_count=int(orderer_count))
+    context.network.up()
+    create_test_channel(context)
+
+@step(r'a fabric peer and orderer with a (?P<state_db>leveldb|couchdb) state database')
+def step_impl(context, state_db):
+    # shared networks have the state database of the run, so the scenario gets its own
+    context.network = Network(context, 'scenario', context.scenario_temp_dir, state_db=state_db)
+    context.network.up()
+    create_test_channel(context)
+
+@step(r'the network (?:is )?restored from snapshot "(?P<name>[^"]+)"')
+def step_impl(context, name):
+    # the steps in the step's text build the state the snapshot is taken
+    # of, they only run if there is no such snapshot yet; shared networks
+    # are not snapshotted, the steps always run on them
+    snapshot_dir = os.path.join(context.temp_dir, 'snapshots', name)
+    if context.network_scope != 'scenario' or not os.path.isdir(snapshot_dir):
+        assert context.text, 'No snapshot {}, and no steps to take it after.'.format(name)
+        context.execute_steps(context.text)
+        if context.network_scope == 'scenario':
+            save_snapshot(context, snapshot_dir)
+        return
+    context.network = Network(context, 'scenario', context.scenario_temp_dir, **Network.restore_settings(snapshot_dir))
+    context.network.restore(snapshot_dir)
+    with open(os.path.join(snapshot_dir, 'context.json')) as context_file:
+        for attribute, value in json.load(context_file).items():
+            setattr(context, attribute, value)
+
+@step(r'the network is saved as snapshot "(?P<name>[^"]+)"')
+def step_impl(context, name):
+    assert context.network_scope == 'scenario', 'Only networks of a single scenario can be snapshotted.'
+    save_snapshot(context, os.path.join(context.temp_dir, 'snapshots', name))
+
+def save_snapshot(context, snapshot_dir):
+    # let the last blocks be committed, then keep the network and the state
+    # of the steps alongside it
+    context.network.wait_for_quiet_logs(2)
+    context.network.snapshot(snapshot_dir)
+    with open(os.path.join(snapshot_dir, 'context.json'), 'w') as context_file:
+        json.dump(dict((attribute, getattr(context, attribute)) for attribute in SNAPSHOT_CONTEXT if hasattr(context, attribute)),
+            context_file, indent=2, sort_keys=True)
+
+@step(r'every peer commits the last transaction')
+def step_impl(context):
+    # how long it takes the other peers to catch up with the first peer, via gossip
+    start = time.time()
+    block_height = context.network.block_height(context.channel_id)
+    for peer in context.network.peers:
+        context.network.wait_for_block_height(context.channel_id, block_height, peer, max_interval=0.1)
+        print('{} reached block height {} after {:.3f}s'.format(peer.name, block_height, time.time() - start))
+
+def create_test_channel(context):
+    # every scenario gets its own test channel
     context.channel_id = 'behave' + ''.join(random.choice('0123456789') for i in xrange(7))
-    channel_create_tx = context.channel_id + '.tx'
-
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--env', 'FABRIC_CFG_PATH=/work',
-            '--volume', '{}:/work'.format(context.scenario_temp_dir),
-            '--workdir', '/work',
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'configtxgen',
-            '-profile', 'TestChannel',
-            '-channelID', context.channel_id,
-            '-outputCreateChannelTx', channel_create_tx,
-        ], cwd=context.scenario_temp_dir, stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # absolute path need from here on
-    channel_create_tx = os.path.join(context.scenario_temp_dir, channel_create_tx)
-
-    # create channel
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/tlsca-cert.pem'.format(context.orderer_org_tlsca_cert_file),
-            '--volume', '{0}:/run/secrets/channel.tx'.format(channel_create_tx),
-            '--volume', '{0}:/work'.format(context.scenario_temp_dir),
-            '--workdir', '/work',
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'channel', 'create', '--logging-level', 'debug',
-            '--channelID', context.channel_id,
-            '--file', '/run/secrets/channel.tx',
-            '--tls', 'true',
-            '--orderer', 'orderer:7050',
-            '--cafile', '/run/secrets/tlsca-cert.pem',
-        ], cwd=context.scenario_temp_dir, stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # channel genesis block was output to working directory
-    channel_genesis_block = os.path.join(context.scenario_temp_dir, context.channel_id + '.block')
-
-    # join peer to channel
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/genesis.block'.format(channel_genesis_block),
-            'hyperledger/fabric-peer:{}'.format(context.docker_tag['peer']),
-            'peer', 'channel', 'join', '--logging-level', 'debug', '--blockpath', '/run/secrets/genesis.block'
-        ], stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # generate anchor peers update for channel
-    anchorpeers_update_tx = context.channel_id + '-update.tx'
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--env', 'FABRIC_CFG_PATH=/work',
-            '--volume', '{}:/work'.format(context.scenario_temp_dir),
-            '--workdir', '/work',
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'configtxgen',
-            '--profile', 'TestChannel',
-            '--channelID', context.channel_id,
-            '--outputAnchorPeersUpdate', anchorpeers_update_tx,
-            '--asOrg', 'PeerOrg'
-        ], cwd=context.scenario_temp_dir, stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-
-    # update channel anchor peers
-    anchorpeers_update_tx = os.path.join(context.scenario_temp_dir, anchorpeers_update_tx)
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/channel-update.tx'.format(anchorpeers_update_tx),
-            '--volume', '{0}:/run/secrets/tlsca-cert.pem'.format(context.orderer_org_tlsca_cert_file),
-            'hyperledger/fabric-peer:{}'.format(context.docker_tag['peer']),
-            'peer', 'channel', 'update', '--logging-level', 'debug',
-            '--channelID', context.channel_id,
-            '--file', '/run/secrets/channel-update.tx',
-            '--tls', 'true',
-            '--orderer', 'orderer:7050',
-            '--cafile', '/run/secrets/tlsca-cert.pem',
-        ], stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+    context.network.create_channel(context.channel_id)
 
 @step(r'a (?P<lang>java|go|golang|car) chaincode is installed via the CLI')
 def step_impl(context, lang):
-    context.chaincode_lang = 'golang' if lang == 'go' else lang
-    context.chaincode_id_name = lang + '_cc_' + ''.join(random.choice('0123456789') for i in xrange(7))
-    context.chaincode_id_version = '1.0.0.0'
-
-    if context.chaincode_lang == 'golang':
-        context.chaincode_volume_source = context.go_path
-        context.chaincode_volume_target = '/run/chaincode'
-        context.chaincode_path = context.sample_chaincode_path[context.chaincode_lang]
-    else:
-        context.chaincode_volume_source = context.sample_chaincode_path[context.chaincode_lang]
-        context.chaincode_volume_target = '/run/chaincode'
-        context.chaincode_path = '/run/chaincode'
-
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--env', 'GOPATH={0}'.format(context.chaincode_volume_target),
-            '--volume', '/var/run/docker.sock:/var/run/docker.sock',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:{1}'.format(context.chaincode_volume_source, context.chaincode_volume_target),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'install', '--logging-level', 'debug',
-            '--orderer', 'orderer:7050',
-            '--name', context.chaincode_id_name,
-            '--path', context.chaincode_path,
-            '--version', context.chaincode_id_version,
-            '--lang', context.chaincode_lang
-        ], stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+    select_sample_chaincode(context, lang, '1.0.0.0')
+    install_chaincode(context)
 
 @step(u'the chaincode is installed on the peer')
 def step_impl(context):
-    print(subprocess.check_output([
-        'docker', 'exec', context.peer_container_id, 'ls', '-l', '/var/hyperledger/production/chaincodes/' + context.chaincode_id_name + '.' + context.chaincode_id_version
-    ]))
+    exit_code, output = context.network.docker.exec_run(context.network.peer_container_id, [
+        'ls', '-l', '/var/hyperledger/production/chaincodes/' + context.chaincode_id_name + '.' + context.chaincode_id_version
+    ])
+    print(output)
+    assert exit_code == 0, 'Chaincode package not found on the peer'
 
 @step(r'version (?P<version>\S+) of a (?P<lang>java|go|golang|car) chaincode is installed via the CLI')
 def step_impl(context, version, lang):
-    context.chaincode_lang = 'golang' if lang == 'go' else lang
-    context.chaincode_id_name = lang + '_cc_' + ''.join(random.choice('0123456789') for i in xrange(7))
-    context.chaincode_id_version = version
+    select_sample_chaincode(context, lang, version)
+    install_chaincode(context)
 
-    if context.chaincode_lang == 'golang':
-        context.chaincode_volume_source = context.go_path
-        context.chaincode_volume_target = '/run/chaincode'
-        context.chaincode_path = context.sample_chaincode_path[context.chaincode_lang]
-    else:
-        context.chaincode_volume_source = context.sample_chaincode_path[context.chaincode_lang]
-        context.chaincode_volume_target = '/run/chaincode'
-        context.chaincode_path = '/run/chaincode'
-
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--env', 'GOPATH={0}'.format(context.chaincode_volume_target),
-            '--volume', '/var/run/docker.sock:/var/run/docker.sock',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:{1}'.format(context.chaincode_volume_source, context.chaincode_volume_target),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'install', '--logging-level', 'debug',
-            '--orderer', 'orderer:7050',
-            '--name', context.chaincode_id_name,
-            '--path', context.chaincode_path,
-            '--version', context.chaincode_id_version,
-            '--lang', context.chaincode_lang
-        ], stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+@step(r'the key/value chaincode is installed via the CLI')
+def step_impl(context):
+    # fabric only looks up chaincode in the first GOPATH entry, the shim is
+    # found in the second one
+    select_chaincode(context, 'kv', 'golang', '1.0.0.0', context.kv_chaincode_path,
+        os.path.join(context.test_go_path, 'src', context.kv_chaincode_path), '{"Args":["init"]}',
+        '{}:{}'.format(CLI_TEST_GOPATH, CLI_GOPATH))
+    install_chaincode(context)
 
 @step(r'installing version (?P<version>\S+) of the same chaincode via the CLI will fail')
 def step_impl(context, version):
     assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
     context.chaincode_id_version = version
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--env', 'GOPATH={0}'.format(context.chaincode_volume_target),
-            '--volume', '/var/run/docker.sock:/var/run/docker.sock',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:{1}'.format(context.chaincode_volume_source, context.chaincode_volume_target),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'install', '--logging-level', 'debug',
-            '--orderer', 'orderer:7050',
-            '--name', context.chaincode_id_name,
-            '--path', context.chaincode_path,
-            '--version', context.chaincode_id_version,
-            '--lang', context.chaincode_lang
-        ], stderr=subprocess.STDOUT))
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+    install_chaincode(context)
+
+def select_sample_chaincode(context, lang, version):
+    chaincode_lang = 'golang' if lang == 'go' else lang
+    if chaincode_lang == 'golang':
+        # golang chaincode paths are relative to the GOPATH mounted in the CLI container
+        path = context.sample_chaincode_path[chaincode_lang]
+        source_dir = os.path.join(context.go_path, 'src', path)
+    else:
+        path = os.path.join(CLI_GOPATH, os.path.relpath(context.sample_chaincode_path[chaincode_lang], context.go_path))
+        source_dir = context.sample_chaincode_path[chaincode_lang]
+    select_chaincode(context, lang, chaincode_lang, version, path, source_dir, context.sample_chaincode_ctor_args[chaincode_lang])
+
+def select_chaincode(context, prefix, lang, version, path, source_dir, ctor_args, go_path=CLI_GOPATH):
+    context.chaincode_lang = lang
+    context.chaincode_id_version = version
+    context.chaincode_path = path
+    context.chaincode_ctor_args = ctor_args
+    context.chaincode_go_path = go_path
+
+    context.chaincode_source_key = None
+    if context.artifact_cache or context.reuse_chaincode_images:
+        # deployment packages embed the chaincode name, and the peers name
+        # chaincode images after it, so for packages and images to be reused
+        # the name is derived from the chaincode source instead of random;
+        # the peer network ID keeps concurrent runs apart, see environment.py
+        context.chaincode_source_key = ArtifactCache.key(context.chaincode_lang, context.chaincode_path,
+            context.docker_tag['tools'], tree_digest(source_dir))
+        context.chaincode_id_name = prefix + '_cc_' + context.chaincode_source_key[:7]
+    else:
+        context.chaincode_id_name = prefix + '_cc_' + ''.join(random.choice('0123456789') for i in xrange(7))
+
+def install_chaincode(context):
+    package_key = None
+    if context.chaincode_source_key:
+        package_key = ArtifactCache.key('chaincode-package', context.chaincode_id_name, context.chaincode_id_version, context.chaincode_source_key)
+    context.network.install_chaincode(context.chaincode_id_name, context.chaincode_path,
+        context.chaincode_id_version, context.chaincode_lang, package_key, context.chaincode_go_path)
 
 @step(r'the chaincode (?:can be|is) instantiated via the CLI')
 def step_impl(context):
     assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/tlsca-cert.pem'.format(context.orderer_org_tlsca_cert_file),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'instantiate', '--logging-level', 'debug',
-            '--channelID', context.channel_id,
-            '--name', context.chaincode_id_name,
-            '--version', context.chaincode_id_version,
-            '--lang', context.chaincode_lang,
-            '--ctor', context.sample_chaincode_ctor_args[context.chaincode_lang],
-            '--orderer', 'orderer:7050',
-            '--tls', 'true',
-            '--orderer', 'orderer:7050',
-            '--cafile', '/run/secrets/tlsca-cert.pem',
-        ], stderr=subprocess.STDOUT))
-        context.last_function = 'initialize'
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
-    time.sleep(2)
-
+    block_height = context.network.block_height(context.channel_id)
+    image_reused = bool(context.network.chaincode_images(context.chaincode_id_name, context.chaincode_id_version))
+    start = time.time()
+    context.network.peer_cli([
+        'peer', 'chaincode', 'instantiate', '--logging-level', 'debug',
+        '--channelID', context.channel_id,
+        '--name', context.chaincode_id_name,
+        '--version', context.chaincode_id_version,
+        '--lang', context.chaincode_lang,
+        '--ctor', context.chaincode_ctor_args,
+        '--tls', 'true',
+        '--orderer', 'orderer:7050',
+        '--cafile', context.network.cli_path(context.network.orderer_org_tlsca_cert_file),
+    ])
+    context.last_function = 'initialize'
+    # wait for the instantiate transaction to be committed
+    context.network.wait_for_block_height(context.channel_id, block_height + 1)
+    report_instantiate_time(context, time.time() - start, image_reused)
+
+def report_instantiate_time(context, duration, image_reused):
+    # compare instantiates reusing a chaincode image with those that built it
+    timings = context.instantiate_timings.setdefault(context.chaincode_lang, {'built': [], 'reused': []})
+    timings['reused' if image_reused else 'built'].append(duration)
+    if not image_reused:
+        print('instantiated {} in {:.2f}s, building its chaincode image'.format(context.chaincode_id_name, duration))
+    elif timings['built']:
+        saved = sum(timings['built']) / len(timings['built']) - duration
+        print('instantiated {} in {:.2f}s reusing its chaincode image, {:.2f}s faster than building it'.format(context.chaincode_id_name, duration, saved))
+    else:
+        print('instantiated {} in {:.2f}s reusing its chaincode image'.format(context.chaincode_id_name, duration))
 
 @step(r'the chaincode is invoked successfully via the CLI')
 def step_impl(context):
     assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
-    time.sleep(2)
-    try:
-        print(subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/tlsca-cert.pem'.format(context.orderer_org_tlsca_cert_file),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'invoke',
-            '--logging-level', 'debug',
-            '--channelID', context.channel_id,
-            '--name', context.chaincode_id_name,
-            '--ctor', context.sample_chaincode_transfer_args[context.chaincode_lang],
-            '--orderer', 'orderer:7050',
-            '--tls', 'true',
-            '--orderer', 'orderer:7050',
-            '--cafile', '/run/secrets/tlsca-cert.pem',
-        ], stderr=subprocess.STDOUT))
-        context.last_function = 'invoke'
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+    block_height = context.network.block_height(context.channel_id)
+    context.network.invoke_chaincode(context.channel_id, context.chaincode_id_name, context.sample_chaincode_transfer_args[context.chaincode_lang])
+    context.last_function = 'invoke'
+    # wait for the invoke transaction to be committed
+    context.network.wait_for_block_height(context.channel_id, block_height + 1)
 
 @step(r'the chaincode state is queried via the CLI')
 def step_impl(context):
     assert getattr(context, 'chaincode_id_name', None), 'No chaincode previously installed.'
-    time.sleep(2)
-    try:
-        query_commmand_output = subprocess.check_output([
-            'docker', 'run',
-            '--rm',
-            '--network', context.network_name,
-            '--env', 'CORE_PEER_ADDRESS=peer:7051',
-            '--env', 'CORE_PEER_MSPCONFIGPATH=/run/secrets/msp',
-            '--env', 'CORE_PEER_LOCALMSPID=PeerMSP',
-            '--env', 'CORE_PEER_TLS_ENABLED=true',
-            '--env', 'CORE_PEER_TLS_ROOTCERT_FILE=/run/secrets/tls/ca.crt',
-            '--volume', '{0}:/run/secrets/tls'.format(context.peer_tls_dir),
-            '--volume', '{0}:/run/secrets/msp'.format(context.peer_admin_msp_dir),
-            '--volume', '{0}:/run/secrets/tlsca-cert.pem'.format(context.orderer_org_tlsca_cert_file),
-            'hyperledger/fabric-tools:{}'.format(context.docker_tag['tools']),
-            'peer', 'chaincode', 'query',
-            '--logging-level', 'debug',
-            '--channelID', context.channel_id,
-            '--name', context.chaincode_id_name,
-            '--ctor', context.sample_chaincode_query_args[context.chaincode_lang],
-            '--orderer', 'orderer:7050',
-            '--tls', 'true',
-            '--orderer', 'orderer:7050',
-            '--cafile', '/run/secrets/tlsca-cert.pem',
-        ], stderr=subprocess.STDOUT)
-        context.query_result = get_chaincode_query_result(query_commmand_output)
-    except subprocess.CalledProcessError as e:
-        print(e.output)
-        raise
+    query_commmand_output = context.network.query_chaincode(context.channel_id, context.chaincode_id_name, context.sample_chaincode_query_args[context.chaincode_lang])
+    context.query_result = get_chaincode_query_result(query_commmand_output)
 
 def get_chaincode_query_result(query_commmand_output):
     return [line.split(':',1)[1].strip() for line in query_commmand_output.splitlines() if line.startswith('Query Result:')][0]
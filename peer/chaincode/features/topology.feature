@@ -0,0 +1,17 @@
+Feature: Multiple peer organizations
+
+Scenario Outline: Invoke a chaincode on a network of several peers
+
+  Given a fabric network with <orgs> orgs of <peers> peers each
+  And a <lang> chaincode is installed via the CLI
+  And the chaincode is instantiated via the CLI
+  When the chaincode is invoked successfully via the CLI
+  Then every peer commits the last transaction
+  When the chaincode state is queried via the CLI
+  Then the expected query result is returned
+
+  Examples:
+  | lang | orgs | peers |
+  | go   | 2    | 2     |
+  | go   | 3    | 1     |
+  | java | 2    | 2     |